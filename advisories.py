@@ -0,0 +1,274 @@
+import glob
+import json
+import logging
+import os
+import re
+import zipfile
+from bisect import bisect_left, bisect_right
+from urllib.parse import unquote
+
+# OSV ecosystems and the purl type of their packages
+ECOSYSTEM_PURL_TYPES = {
+    "npm": "npm",
+    "PyPI": "pypi",
+    "Maven": "maven",
+    "Go": "golang",
+    "crates.io": "cargo",
+    "RubyGems": "gem",
+    "NuGet": "nuget",
+    "Packagist": "composer",
+    "Pub": "pub",
+    "Hex": "hex",
+}
+
+_VERSION_SEGMENT = re.compile(r"\d+|[A-Za-z]+")
+# Sorts after every version, the end of an unbounded range
+_MAX_VERSION = ((3,),)
+
+
+def version_key(version: str) -> tuple:
+    """Creates a sort key for a version, comparing its numeric parts as numbers.
+
+    A version that continues with letters (a pre-release such as `1.0.0-rc1`) sorts
+    before the version without them, and one that continues with numbers after it.
+
+    Args:
+        version (str): The version
+
+    Returns:
+        tuple: The sort key, "0" and "" sort before every other version
+    """
+    if version in ("", "0"):
+        return ()
+    key = []
+    for segment in _VERSION_SEGMENT.findall(version.lstrip("vV")):
+        if segment.isdigit():
+            key.append((2, int(segment)))
+        else:
+            key.append((0, segment.lower()))
+    key.append((1,))
+    return tuple(key)
+
+
+def package_key(purl: str) -> tuple:
+    """Splits a purl into the key of its package and its version, e.g.
+    `pkg:npm/%40babel/core@7.0.0?x=y` into (`pkg:npm/@babel/core`, `7.0.0`)
+
+    Args:
+        purl (str): The purl
+
+    Returns:
+        tuple: The package key and the version, the version is None if the purl has none
+    """
+    purl = purl.partition("#")[0].partition("?")[0]
+    path, at, version = purl.rpartition("@")
+    if not at or "/" in version:
+        path, version = purl, None
+    purl_type, _, name = path.partition(":")[2].partition("/")
+    purl_type = purl_type.lower()
+    name = unquote(name.strip("/"))
+    if purl_type in ("pypi", "github", "bitbucket", "composer"):
+        name = name.lower()
+    if purl_type == "pypi":
+        name = name.replace("_", "-").replace(".", "-")
+    return f"pkg:{purl_type}/{name}", (unquote(version) if version else None)
+
+
+class AdvisoryIndex:
+    """An in-memory index of OSV advisories by the package they affect, for matching
+    the purls of Components offline.
+
+    The ranges of each advisory are converted to intervals of precomputed version
+    keys when the advisories are added, so a lookup only has to sort the versions
+    being matched and bisect them against each interval.
+    """
+
+    def __init__(self) -> None:
+        self.advisories = {}
+        self.__ranges = {}
+        self.__versions = {}
+
+    @classmethod
+    def load(cls, path: str) -> "AdvisoryIndex":
+        """Loads an OSV advisory dump, either a directory of OSV JSON files, a zip of
+        them (as published by OSV for each ecosystem), a JSON lines file or a JSON
+        file holding one advisory or a list of them
+
+        Args:
+            path (str): The path of the dump
+
+        Returns:
+            AdvisoryIndex: The index
+        """
+        index = cls()
+        if os.path.isdir(path):
+            for f in sorted(glob.glob(os.path.join(path, "**", "*.json"), recursive=True)):
+                with open(f) as fp:
+                    index.add(json.load(fp))
+        elif zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as archive:
+                for name in archive.namelist():
+                    if name.endswith(".json"):
+                        index.add(json.loads(archive.read(name)))
+        elif path.endswith(".jsonl"):
+            with open(path) as fp:
+                for line in fp:
+                    if line.strip():
+                        index.add(json.loads(line))
+        else:
+            with open(path) as fp:
+                advisories = json.load(fp)
+            for advisory in advisories if isinstance(advisories, list) else [advisories]:
+                index.add(advisory)
+        logging.info(
+            f"Loaded {len(index.advisories)} advisories for {len(index)} packages from {path}"
+        )
+        return index
+
+    def __len__(self) -> int:
+        return len(self.__ranges.keys() | self.__versions.keys())
+
+    def add(self, advisory: dict):
+        """Adds an OSV advisory to the index. Withdrawn advisories and GIT ranges,
+        which are expressed in commits rather than versions, are skipped.
+
+        Args:
+            advisory (dict): The OSV advisory
+        """
+        if advisory.get("withdrawn"):
+            return
+        advisory_id = advisory["id"]
+        matched = False
+        for affected in advisory.get("affected", []):
+            key = self.__affected_key(affected.get("package", {}))
+            if key is None:
+                continue
+            for r in affected.get("ranges", []):
+                if r.get("type") == "GIT":
+                    continue
+                for start, end, inclusive in self.__intervals(r.get("events", [])):
+                    self.__ranges.setdefault(key, []).append(
+                        (start, end, inclusive, advisory_id)
+                    )
+                    matched = True
+            for v in affected.get("versions", []):
+                self.__versions.setdefault(key, {}).setdefault(v, set()).add(
+                    advisory_id
+                )
+                matched = True
+        if matched:
+            self.advisories[advisory_id] = self.__node(advisory)
+
+    @staticmethod
+    def __affected_key(package: dict) -> str:
+        """Creates the package key of an affected package of an advisory
+
+        Args:
+            package (dict): The package, with a purl or an ecosystem and name
+
+        Returns:
+            str: The package key, or None for an ecosystem without a purl type
+        """
+        if "purl" in package:
+            return package_key(package["purl"])[0]
+        purl_type = ECOSYSTEM_PURL_TYPES.get(package.get("ecosystem", "").split(":")[0])
+        if purl_type is None or "name" not in package:
+            return None
+        name = package["name"]
+        if purl_type == "maven":
+            name = name.replace(":", "/")
+        return package_key(f"pkg:{purl_type}/{name}")[0]
+
+    @staticmethod
+    def __intervals(events: list) -> list:
+        """Converts the events of an OSV range into intervals of version keys
+
+        Args:
+            events (list): The introduced, fixed, last_affected and limit events
+
+        Returns:
+            list: (start, end, end inclusive) tuples
+        """
+        intervals = []
+        start = None
+        for e in events:
+            if "introduced" in e:
+                start = version_key(e["introduced"])
+            elif start is not None and "fixed" in e:
+                intervals.append((start, version_key(e["fixed"]), False))
+                start = None
+            elif start is not None and "last_affected" in e:
+                intervals.append((start, version_key(e["last_affected"]), True))
+                start = None
+        if start is not None:
+            intervals.append((start, _MAX_VERSION, True))
+        return intervals
+
+    @staticmethod
+    def __node(advisory: dict) -> dict:
+        """Creates the properties of the Vulnerability node of an advisory, named like
+        the properties of CycloneDX vulnerabilities
+
+        Args:
+            advisory (dict): The OSV advisory
+
+        Returns:
+            dict: The properties
+        """
+        node = {"id": advisory["id"], "source": "OSV"}
+        for osv_key, key in (
+            ("summary", "description"),
+            ("details", "detail"),
+            ("published", "published"),
+            ("modified", "updated"),
+        ):
+            if osv_key in advisory:
+                node[key] = advisory[osv_key]
+        severity = advisory.get("database_specific", {}).get("severity")
+        if severity:
+            node["severity"] = severity.lower()
+        for s in advisory.get("severity", []):
+            node["method"] = s["type"]
+            node["vector"] = s["score"]
+            break
+        if advisory.get("aliases"):
+            node["aliases"] = ",".join(advisory["aliases"])
+        return node
+
+    def match(self, purls: list) -> list:
+        """Finds the advisories affecting each purl. The purls are grouped by package
+        and their versions sorted, so each interval of an advisory is matched against
+        all of a package's versions with two bisections.
+
+        Args:
+            purls (list): The purls
+
+        Returns:
+            list: (purl index, advisory id) tuples, without duplicates
+        """
+        packages = {}
+        for i, purl in enumerate(purls):
+            key, version = package_key(purl)
+            if version is not None and (
+                key in self.__ranges or key in self.__versions
+            ):
+                packages.setdefault(key, []).append((version_key(version), version, i))
+
+        matches = set()
+        for key, versions in packages.items():
+            exact = self.__versions.get(key, {})
+            for _, version, i in versions:
+                for advisory_id in exact.get(version, ()):
+                    matches.add((i, advisory_id))
+
+            ranges = self.__ranges.get(key)
+            if not ranges:
+                continue
+            versions.sort(key=lambda v: v[0])
+            keys = [v[0] for v in versions]
+            for start, end, inclusive, advisory_id in ranges:
+                first = bisect_left(keys, start)
+                last = (bisect_right if inclusive else bisect_left)(keys, end)
+                for _, _, i in versions[first:last]:
+                    matches.add((i, advisory_id))
+        return sorted(matches)
@@ -0,0 +1,237 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from advisories import AdvisoryIndex
+from sbom_writer import (
+    BatchWriteError,
+    DocumentRecord,
+    NeptuneAnalyticsSBOMWriter,
+    node_merge_query,
+    rel_merge_on_property_query,
+    rel_merge_query,
+    record_sbom,
+)
+
+
+class AsyncSBOMWriter:
+    """An asyncio front end to a NeptuneAnalyticsSBOMWriter.
+
+    Documents are mapped with the same CycloneDX/SPDX mapping as the synchronous
+    writers. Each document's node batches are sent concurrently, then (once every
+    node is written) its edge batches. Concurrency is bounded at two levels:
+    max_concurrency requests are in flight across all documents, and at most
+    max_documents documents are being written at once, so callers of write_sbom
+    wait when the writer is saturated.
+
+    The blocking boto3 calls run on a dedicated thread pool and keep the retry,
+    batch sizing and write cache behavior of the synchronous Writer.
+    """
+
+    def __init__(
+        self,
+        writer: NeptuneAnalyticsSBOMWriter,
+        max_concurrency: int = 8,
+        max_documents: int = 4,
+        advisories: AdvisoryIndex = None,
+    ) -> None:
+        """Creates the async writer
+
+        Args:
+            writer (NeptuneAnalyticsSBOMWriter): The writer whose client and settings are used
+            max_concurrency (int, optional): The maximum number of requests in flight. Defaults to 8.
+            max_documents (int, optional): The maximum number of documents being written at once. Defaults to 4.
+            advisories (AdvisoryIndex, optional): Advisories to add the Vulnerabilities of the components from. Defaults to None.
+        """
+        self.writer = writer.create_writer()
+        self.advisories = advisories
+        self.max_concurrency = max_concurrency
+        self.max_documents = max_documents
+        self.__executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self.__requests = None
+        self.__documents = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    def close(self):
+        """Shuts down the thread pool used for the blocking calls, waiting for the
+        calls in progress. Blocks, use aclose() from a coroutine."""
+        self.__executor.shutdown(wait=True)
+        self.writer.close()
+
+    async def aclose(self):
+        """Shuts down the thread pool from a coroutine, waiting for the calls in
+        progress on another thread so the event loop keeps running"""
+        await asyncio.to_thread(self.close)
+
+    async def __run(self, func, *args):
+        """Runs a blocking function on the writer's thread pool
+
+        Args:
+            func (callable): The function
+            *args: Its arguments
+
+        Returns:
+            object: The result of the function
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.__executor, functools.partial(func, *args)
+        )
+
+    def __semaphores(self):
+        """Creates the semaphores on first use, so they belong to the running loop"""
+        if self.__requests is None:
+            self.__requests = asyncio.Semaphore(self.max_concurrency)
+            self.__documents = asyncio.Semaphore(self.max_documents)
+
+    async def write_sbom(self, bom: dict) -> bool:
+        """Writes out the SBOM
+
+        Args:
+            bom (dict): The dict of the SBOM
+
+        Returns:
+            bool: True if successful, False if not
+        """
+        self.__semaphores()
+        async with self.__documents:
+            record = await self.__run(record_sbom, bom, self.advisories)
+            if record is None:
+                return False
+            await self.write_record(record)
+            return True
+
+    async def write_sboms(self, boms) -> list:
+        """Writes out many SBOMs concurrently, within the configured limits
+
+        Args:
+            boms (iterable): The dicts of the SBOMs
+
+        Returns:
+            list: The result of write_sbom for each SBOM, or the exception it raised
+        """
+        return await asyncio.gather(
+            *(self.write_sbom(bom) for bom in boms), return_exceptions=True
+        )
+
+    async def write_record(self, record: DocumentRecord):
+        """Writes the nodes and then the edges of a recorded document, then publishes
+        the write generation of the graph, see Writer.publish_generation
+
+        Args:
+            record (DocumentRecord): The nodes and edges of the document
+        """
+        try:
+            await self.__write_record(record)
+        finally:
+            await self.__run(self.writer.publish_generation)
+
+    async def __write_record(self, record: DocumentRecord):
+        """Writes the nodes and then the edges of a recorded document, see write_record
+
+        Args:
+            record (DocumentRecord): The nodes and edges of the document
+        """
+        nodes = {}
+        for label, row in record.nodes.values():
+            nodes.setdefault(label, []).append(row)
+        await asyncio.gather(
+            *(self.write_node_rows(rows, label) for label, rows in nodes.items())
+        )
+
+        edges = {}
+        for f, label, t in record.edges:
+            edges.setdefault(label, []).append({"fromId": f, "toId": t})
+        property_edges = {}
+        for label, from_p, from_v, to_p, to_v, from_label, to_label in (
+            record.property_edges
+        ):
+            property_edges.setdefault(
+                (label, from_label, from_p, to_label, to_p), []
+            ).append({"from": from_v, "to": to_v})
+
+        await asyncio.gather(
+            *(
+                self.__execute_batches(rel_merge_query(label), "rels", rels, label)
+                for label, rels in edges.items()
+            ),
+            *(
+                self.__execute_batches(
+                    rel_merge_on_property_query(*key), "rels", rels, key[0]
+                )
+                for key, rels in property_edges.items()
+            ),
+        )
+
+    async def write_node_rows(self, rows: list, label: str):
+        """Writes node rows that already have their `~id` in __id, see Writer.write_node_rows
+
+        Args:
+            rows (list): The node rows to write
+            label (str): The label to associate with the nodes
+        """
+        rows = self.writer._merge_rows(rows, ("__id",), label)
+        cache = self.writer.write_cache
+        if cache is not None:
+            rows, hashes = await self.__run(
+                cache.filter, self.writer.graph_identifier, rows
+            )
+
+        await asyncio.gather(
+            *(
+                self.__execute_batches(
+                    node_merge_query(label, keys), "props", shape_rows, label
+                )
+                for keys, shape_rows in self.writer._group_by_shape(
+                    rows, label
+                ).items()
+            )
+        )
+
+        if cache is not None:
+            await self.__run(cache.record, self.writer.graph_identifier, hashes)
+
+    async def __execute_batches(
+        self, query: str, param_name: str, rows: list, label: str
+    ):
+        """Sends the rows in batches, with at most max_concurrency requests in flight
+        across the whole writer
+
+        Args:
+            query (str): The UNWIND query to execute for each batch
+            param_name (str): The name of the query parameter holding the batch
+            rows (list): The rows to write
+            label (str): The label being written, used for error reporting
+
+        Raises:
+            BatchWriteError: Raised if any batch failed
+        """
+        self.__semaphores()
+        phase = self.writer.phase_name(query, param_name, label)
+
+        async def send(batch):
+            async with self.__requests:
+                await self.__run(
+                    self.writer._send_batch, query, param_name, batch, phase
+                )
+
+        batches = self.writer._split_batches(rows, label)
+        if self.writer.metrics is None:
+            results = await asyncio.gather(
+                *(send(b) for b in batches), return_exceptions=True
+            )
+        else:
+            with self.writer.metrics.phase(phase, len(rows)):
+                results = await asyncio.gather(
+                    *(send(b) for b in batches), return_exceptions=True
+                )
+        failures = [(i, r) for i, r in enumerate(results) if isinstance(r, Exception)]
+        for i, e in failures:
+            logging.error(f"Batch {i} of {label} failed: {e}")
+        if len(failures) > 0:
+            raise BatchWriteError(label, failures)
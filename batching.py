@@ -0,0 +1,262 @@
+import json
+import logging
+import random
+import threading
+
+# Error codes returned by neptune-graph (and AWS in general) that are worth retrying
+RETRYABLE_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+    "ServiceUnavailableException",
+    "InternalServerException",
+    "ConcurrentModificationException",
+    "RequestTimeout",
+    "RequestTimeoutException",
+}
+THROTTLING_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+}
+# HTTP status codes of responses that are worth retrying, 429 is throttling
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+THROTTLING_STATUS_CODES = {429}
+
+# Exceptions raised by botocore for network failures and timeouts
+RETRYABLE_EXCEPTION_NAMES = {
+    "ConnectionError",
+    "ConnectionClosedError",
+    "EndpointConnectionError",
+    "ReadTimeoutError",
+    "ConnectTimeoutError",
+    "TimeoutError",
+}
+
+
+def error_code(e: Exception) -> str:
+    """Gets the AWS error code of a botocore ClientError
+
+    Args:
+        e (Exception): The exception
+
+    Returns:
+        str: The error code, or None if the exception is not a ClientError
+    """
+    response = getattr(e, "response", None)
+    if isinstance(response, dict):
+        return response.get("Error", {}).get("Code")
+    return None
+
+
+def status_code(e: Exception) -> int:
+    """Gets the HTTP status code of a failed request
+
+    Args:
+        e (Exception): The exception
+
+    Returns:
+        int: The status code, or None if the exception has no response
+    """
+    response = getattr(e, "response", None)
+    if isinstance(response, dict):
+        return response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return None
+
+
+def is_throttled(e: Exception) -> bool:
+    """Determines if a request failed because it was throttled
+
+    Args:
+        e (Exception): The exception raised by the request
+
+    Returns:
+        bool: True for throttling error codes and 429 responses
+    """
+    return (
+        error_code(e) in THROTTLING_ERROR_CODES
+        or status_code(e) in THROTTLING_STATUS_CODES
+    )
+
+
+def is_retryable(e: Exception) -> bool:
+    """Determines if a failed request is worth retrying as-is
+
+    Args:
+        e (Exception): The exception raised by the request
+
+    Returns:
+        bool: True for throttling, transient server errors and network failures
+    """
+    if error_code(e) in RETRYABLE_ERROR_CODES:
+        return True
+    if error_code(e) is None and status_code(e) in RETRYABLE_STATUS_CODES:
+        return True
+    return any(c.__name__ in RETRYABLE_EXCEPTION_NAMES for c in type(e).__mro__)
+
+
+def is_too_large(e: Exception) -> bool:
+    """Determines if a request failed because its payload was too large
+
+    Args:
+        e (Exception): The exception raised by the request
+
+    Returns:
+        bool: True if the request should be split into smaller ones
+    """
+    if status_code(e) == 413:
+        return True
+    message = str(e).lower()
+    return error_code(e) == "ValidationException" and (
+        "too large" in message or "size" in message
+    )
+
+
+class RetryPolicy:
+    """Retries throttled and transient failures with jittered exponential backoff"""
+
+    def __init__(
+        self,
+        max_attempts: int = 5,
+        base_delay: float = 0.1,
+        max_delay: float = 10.0,
+    ) -> None:
+        """Creates the policy
+
+        Args:
+            max_attempts (int, optional): The number of attempts before giving up. Defaults to 5.
+            base_delay (float, optional): The delay in seconds before the first retry. Defaults to 0.1.
+            max_delay (float, optional): The maximum delay in seconds between attempts. Defaults to 10.
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        """Calculates the "full jitter" delay before the next attempt
+
+        Args:
+            attempt (int): The number of attempts made so far, starting at 1
+
+        Returns:
+            float: The delay in seconds
+        """
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        )
+
+
+class AdaptiveBatchSizer:
+    """Sizes batches by their serialized payload size and adapts the number of rows
+    per batch to the observed latency and throttling.
+
+    The row limit grows by a quarter while requests are fast and is halved when a
+    request is slow or throttled. One sizer can be shared by all writers and threads
+    so what is learned about the graph carries over between documents.
+    """
+
+    def __init__(
+        self,
+        initial_rows: int = 200,
+        min_rows: int = 10,
+        max_rows: int = 5000,
+        max_bytes: int = 1024 * 1024,
+        target_latency: float = 1.0,
+    ) -> None:
+        """Creates the sizer
+
+        Args:
+            initial_rows (int, optional): The starting row limit. Defaults to 200.
+            min_rows (int, optional): The smallest row limit. Defaults to 10.
+            max_rows (int, optional): The largest row limit. Defaults to 5000.
+            max_bytes (int, optional): The maximum serialized size of a batch. Defaults to 1MB.
+            target_latency (float, optional): The request latency in seconds to aim for. Defaults to 1.
+        """
+        self.rows = initial_rows
+        self.min_rows = min_rows
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.target_latency = target_latency
+        self.__lock = threading.Lock()
+
+    def split(self, rows: list) -> list:
+        """Splits the rows into batches under both the row limit and max_bytes
+
+        Args:
+            rows (list): The rows to split
+
+        Returns:
+            list: The batches
+        """
+        return list(self.iter_split(rows))
+
+    def iter_split(self, rows: list):
+        """Splits the rows into batches like split(), but reads the limits again for
+        every batch, so the batches after a throttled or rejected one are smaller
+
+        Args:
+            rows (list): The rows to split
+
+        Yields:
+            list: The batches
+        """
+        current = []
+        size = 0
+        for r in rows:
+            row_size = len(json.dumps(r, default=str))
+            if len(current) > 0 and (
+                len(current) >= self.rows or size + row_size > self.max_bytes
+            ):
+                yield current
+                current = []
+                size = 0
+            current.append(r)
+            size += row_size
+        if len(current) > 0:
+            yield current
+
+    def record_success(self, rows: int, latency: float):
+        """Adjusts the row limit after a successful request
+
+        Args:
+            rows (int): The number of rows in the request
+            latency (float): The latency of the request in seconds
+        """
+        with self.__lock:
+            if latency > self.target_latency:
+                self.__resize(self.rows // 2, f"latency {latency:.2f}s")
+            elif rows >= self.rows and latency < self.target_latency / 2:
+                self.__resize(self.rows + max(1, self.rows // 4), f"latency {latency:.2f}s")
+
+    def record_too_large(self, rows: list):
+        """Shrinks the limits after a request was rejected as too large, so the
+        following batches are not rejected and split too. The graph's request limits
+        do not change, so the row and byte limits never grow back to the size of the
+        rejected request, and the row limit is halved.
+
+        Args:
+            rows (list): The rows of the rejected request
+        """
+        size = sum(len(json.dumps(r, default=str)) for r in rows)
+        with self.__lock:
+            self.max_rows = max(self.min_rows, min(self.max_rows, len(rows) - 1))
+            if size <= self.max_bytes:
+                self.max_bytes = max(1, size - 1)
+            self.__resize(min(self.rows, len(rows)) // 2, "too large")
+
+    def record_throttle(self):
+        """Halves the row limit after a throttled request"""
+        with self.__lock:
+            self.__resize(self.rows // 2, "throttled")
+
+    def __resize(self, rows: int, reason: str):
+        """Changes the row limit within the bounds
+
+        Args:
+            rows (int): The new row limit
+            reason (str): Why the limit changed, for the log
+        """
+        rows = max(self.min_rows, min(self.max_rows, rows))
+        if rows != self.rows:
+            logging.info(f"Batch size {self.rows} -> {rows} rows ({reason})")
+            self.rows = rows
@@ -0,0 +1,220 @@
+import argparse
+import gc
+import json
+import logging
+import time
+import tracemalloc
+from benchmarks.generate import generate_cyclonedx, generate_spdx
+from benchmarks.run import load_examples
+from sbom_schema import decode_sbom
+from sbom_writer import record_sbom
+
+SIZES = [1000, 10000, 100000]
+
+
+def time_decode(decode, data: bytes, repeat: int) -> tuple:
+    """Decodes a document repeatedly and keeps the fastest time
+
+    Args:
+        decode (function): Decodes the bytes of a JSON document
+        data (bytes): The document
+        repeat (int): The number of times to decode it
+
+    Returns:
+        tuple: The decoded document and the fastest time in seconds
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        bom = decode(data)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return bom, best
+
+
+def peak_memory(decode, data: bytes) -> float:
+    """Measures the peak memory of decoding a document with tracemalloc
+
+    Args:
+        decode (function): Decodes the bytes of a JSON document
+        data (bytes): The document
+
+    Returns:
+        float: The peak memory in MB
+    """
+    gc.collect()
+    tracemalloc.start()
+    bom = decode(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del bom
+    return peak / (1024 * 1024)
+
+
+def json_record(data: bytes):
+    """Decodes a document with json.loads and maps it with the writers
+
+    Args:
+        data (bytes): The document
+
+    Returns:
+        DocumentRecord: The nodes and edges
+    """
+    return record_sbom(json.loads(data))
+
+
+def typed_record(data: bytes):
+    """Decodes a document through the typed records and maps it with the writers
+
+    Args:
+        data (bytes): The document
+
+    Returns:
+        DocumentRecord: The nodes and edges
+    """
+    return record_sbom(decode_sbom(data))
+
+
+def same_graph(a: dict, b: dict) -> bool:
+    """Checks that two decodings of a document map to the same nodes and edges,
+    ignoring the random `~id` of Documents without a serialNumber/documentNamespace
+
+    Args:
+        a (dict): The document decoded with json.loads
+        b (dict): The document decoded through the typed records
+
+    Returns:
+        bool: True if the nodes and edges are the same
+    """
+    ra = record_sbom(a)
+    rb = record_sbom(b)
+
+    def rows(record):
+        return sorted(
+            json.dumps({k: v for k, v in row.items() if k != "__id"}, sort_keys=True)
+            for _, row in record.nodes.values()
+        )
+
+    return (
+        rows(ra) == rows(rb)
+        and len(ra.edges) == len(rb.edges)
+        and ra.property_edges == rb.property_edges
+    )
+
+
+def run_case(name: str, bom: dict, repeat: int, check: bool) -> dict:
+    """Decodes the same document with json.loads and through the typed records, on
+    its own and followed by the mapping of the writers (record_sbom)
+
+    Args:
+        name (str): The name of the case
+        bom (dict): The document
+        repeat (int): The number of times to decode it with each decoder
+        check (bool): Whether to check that both decodings give the same graph
+
+    Returns:
+        dict: The measurements
+    """
+    data = json.dumps(bom).encode("utf-8")
+    items = len(bom.get("components", bom.get("packages", [])))
+    from_json, json_seconds = time_decode(json.loads, data, repeat)
+    typed, typed_seconds = time_decode(decode_sbom, data, repeat)
+    _, json_record_seconds = time_decode(json_record, data, repeat)
+    _, typed_record_seconds = time_decode(typed_record, data, repeat)
+    return {
+        "name": name,
+        "items": items,
+        "mb": len(data) / (1024 * 1024),
+        "json_seconds": json_seconds,
+        "typed_seconds": typed_seconds,
+        "json_record_seconds": json_record_seconds,
+        "typed_record_seconds": typed_record_seconds,
+        "typed_items_per_second": (
+            items / typed_record_seconds if typed_record_seconds > 0 else 0.0
+        ),
+        "json_peak_mb": peak_memory(json_record, data),
+        "typed_peak_mb": peak_memory(typed_record, data),
+        "same_graph": same_graph(from_json, typed) if check else None,
+    }
+
+
+def format_result(result: dict) -> str:
+    """Formats the measurements of a case as a table row
+
+    Args:
+        result (dict): The measurements
+
+    Returns:
+        str: The row
+    """
+    same = {True: "yes", False: "NO", None: "-"}[result["same_graph"]]
+    return (
+        f"{result['name'][:40]:<40}{result['items']:>9}{result['mb']:>8.1f}"
+        f"{result['json_seconds']:>9.3f}{result['typed_seconds']:>9.3f}"
+        f"{result['json_record_seconds']:>9.3f}{result['typed_record_seconds']:>9.3f}"
+        f"{result['typed_items_per_second']:>12.0f}"
+        f"{result['json_peak_mb']:>10.1f}{result['typed_peak_mb']:>10.1f}{same:>6}"
+    )
+
+
+def parse_args(args: list = None) -> argparse.Namespace:
+    """Parses the command line arguments
+
+    Args:
+        args (list, optional): The arguments to parse. Defaults to sys.argv.
+
+    Returns:
+        argparse.Namespace: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="Compare decoding SBOMs with json.loads and through typed records"
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="*",
+        default=SIZES,
+        help="Numbers of components/packages of the synthetic documents (default: 1000 10000 100000)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Number of times each document is decoded, the fastest is kept (default: 3)",
+    )
+    parser.add_argument(
+        "--skip-examples", action="store_true", help="Do not run the examples/ files"
+    )
+    parser.add_argument(
+        "--no-check",
+        dest="check",
+        action="store_false",
+        help="Do not check that both decodings map to the same graph",
+    )
+    return parser.parse_args(args)
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    args = parse_args()
+    cases = []
+    if not args.skip_examples:
+        cases.extend(
+            (name, lambda b=bom: b)
+            for name, bom in load_examples()
+            if not name.endswith(".txt")
+        )
+    for size in args.sizes:
+        cases.append((f"cyclonedx-{size}", lambda s=size: generate_cyclonedx(s)))
+        cases.append((f"spdx-{size}", lambda s=size: generate_spdx(s)))
+    print(
+        f"{'case':<40}{'items':>9}{'MB':>8}{'json s':>9}{'typed s':>9}"
+        f"{'+map s':>9}{'+map s':>9}"
+        f"{'typed/s':>12}{'json MB':>10}{'typed MB':>10}{'same':>6}"
+    )
+    for name, create in cases:
+        print(format_result(run_case(name, create(), args.repeat, args.check)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import argparse
+import logging
+import time
+from advisories import AdvisoryIndex
+from benchmarks.generate import generate_advisories, generate_cyclonedx, generate_spdx
+from sbom_writer import record_sbom
+
+SIZES = [1000, 10000, 100000]
+
+
+def run_case(name: str, bom: dict, advisories: AdvisoryIndex) -> dict:
+    """Maps a document with and without vulnerability enrichment
+
+    Args:
+        name (str): The name of the case
+        bom (dict): The document
+        advisories (AdvisoryIndex): The advisories
+
+    Returns:
+        dict: The measurements
+    """
+    start = time.perf_counter()
+    record_sbom(bom)
+    plain_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    record = record_sbom(bom, advisories)
+    seconds = time.perf_counter() - start
+    labels = [label for label, _ in record.nodes.values()]
+    components = labels.count("Component")
+    return {
+        "name": name,
+        "components": components,
+        "vulnerabilities": labels.count("Vulnerability"),
+        "affects": sum(1 for e in record.edges if e[1] == "AFFECTS"),
+        "seconds": seconds,
+        "enrich_seconds": seconds - plain_seconds,
+        "components_per_minute": components / seconds * 60 if seconds > 0 else 0.0,
+    }
+
+
+def format_result(result: dict) -> str:
+    """Formats the measurements of a case as a table row
+
+    Args:
+        result (dict): The measurements
+
+    Returns:
+        str: The row
+    """
+    return (
+        f"{result['name']:<20}{result['components']:>11}{result['vulnerabilities']:>9}"
+        f"{result['affects']:>9}{result['seconds']:>9.2f}{result['enrich_seconds']:>9.2f}"
+        f"{result['components_per_minute']:>16.0f}"
+    )
+
+
+def parse_args(args: list = None) -> argparse.Namespace:
+    """Parses the command line arguments
+
+    Args:
+        args (list, optional): The arguments to parse. Defaults to sys.argv.
+
+    Returns:
+        argparse.Namespace: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark normalizing synthetic SBOMs with vulnerability enrichment"
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="*",
+        default=SIZES,
+        help="Numbers of components of the synthetic documents (default: 1000 10000 100000)",
+    )
+    parser.add_argument(
+        "--advisories",
+        default=None,
+        help="Path of an OSV advisory dump (default: synthetic advisories for twice the largest size)",
+    )
+    return parser.parse_args(args)
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    args = parse_args()
+    start = time.perf_counter()
+    if args.advisories:
+        advisories = AdvisoryIndex.load(args.advisories)
+    else:
+        advisories = AdvisoryIndex()
+        for advisory in generate_advisories(max(args.sizes)):
+            advisories.add(advisory)
+    print(
+        f"Indexed {len(advisories.advisories)} advisories in "
+        f"{time.perf_counter() - start:.2f}s"
+    )
+    print(
+        f"{'case':<20}{'components':>11}{'vulns':>9}{'affects':>9}{'seconds':>9}"
+        f"{'enrich s':>9}{'components/min':>16}"
+    )
+    for size in args.sizes:
+        for name, bom in (
+            (f"cyclonedx-{size}", generate_cyclonedx(size, vulnerability_ratio=0)),
+            (f"spdx-{size}", generate_spdx(size)),
+        ):
+            print(format_result(run_case(name, bom, advisories)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,476 @@
+import io
+import json
+import random
+import re
+import threading
+import time
+
+UNWIND_RE = re.compile(r"UNWIND \$(\w+) as (\w+)")
+NAME = r"`((?:[^`]|``)+)`"
+NODE_MERGE_RE = re.compile(r"MERGE \(s:(\S+) \{`~id`: p\.__id\}\)")
+SET_RE = re.compile(rf"s\.{NAME} = p\.{NAME}")
+SET_PARAMETER_RE = re.compile(rf"s\.{NAME} = \$(\w+)")
+MATCH_RE = re.compile(rf"\((from|to)(?::(\S+))? \{{{NAME}: r\.(\w+)\}}\)")
+EDGE_MERGE_RE = re.compile(r"MERGE \(from\)-\[s:(\S+)\]->\(to\)")
+EDGE_DELETE_RE = re.compile(r"-\[s:(\S+)\]->.*DELETE s", re.DOTALL)
+NODE_READ_RE = re.compile(r"MATCH \((\w+):(\S+) \{`~id`: \$(\w+)\}\)\s+RETURN")
+PAGE_RE = re.compile(r"MATCH \((\w+):(\S+)\)\s+WHERE id\(\1\) > \$after")
+NODE_DELETE_RE = re.compile(r"MATCH \(n:(\S+) \{`~id`: i\}\).*DETACH DELETE n", re.DOTALL)
+ORPHANED_BY_RE = re.compile(
+    r"MATCH \(d:(\S+) \{`~id`: i\}\)-\[:([\w|]+)\]->\(c:(\S+)\)"
+    r".*NOT id\(o\) IN \$(\w+)",
+    re.DOTALL,
+)
+CONDITION_RE = re.compile(r"NOT \((\w*)(?::(\w+))?\)-\[:([\w|]+)\]->\((\w*)(?::(\w+))?\)")
+WRITTEN_BEFORE_RE = re.compile(rf"coalesce\(n\.{NAME}, 0\) < \$(\w+)")
+RETURN_RE = re.compile(rf"(id\(\w+\)|coalesce\([^)]*\)|\w+\.{NAME}) as (\w+)")
+PROPERTY_RE = re.compile(rf"\w+\.{NAME}")
+
+
+class FakeClientError(Exception):
+    """An error shaped like a botocore ClientError, so the writers' retry logic
+    treats it the same way"""
+
+    def __init__(self, code: str, message: str) -> None:
+        super().__init__(f"An error occurred ({code}): {message}")
+        self.response = {
+            "Error": {"Code": code, "Message": message},
+            "ResponseMetadata": {"HTTPStatusCode": 400},
+        }
+
+
+class FakeNeptuneGraphClient:
+    """An in-process stand-in for the boto3 neptune-graph client.
+
+    It understands the UNWIND/MERGE/MATCH/DELETE queries created by sbom_writer
+    (node_merge_query, rel_merge_query, rel_merge_on_property_query and
+    rel_delete_query) and applies them to an in-memory graph with the same semantics:
+    nodes are merged on `~id`, edges are only created between nodes that both exist,
+    and an edge is created once per (from, label, to). It also answers the paged
+    reads and DETACH DELETEs of retention, with their `NOT (...)-[...]->(...)` and
+    `coalesce(n.written_at, 0) < $before` conditions, and reads of a node's
+    properties such as query_cache.generation_query. Any other query is rejected
+    with a ValidationException.
+
+    Latency and errors can be simulated to exercise the writers' concurrency and
+    retry behavior. Simulated errors are raised like botocore ClientErrors, or
+    returned as responses with error_status when it is set.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        latency_per_row: float = 0.0,
+        error_rate: float = 0.0,
+        error_code: str = "ThrottlingException",
+        seed: int = None,
+        error_status: int = None,
+        max_request_rows: int = None,
+    ) -> None:
+        """Creates the client
+
+        Args:
+            latency (float, optional): The time in seconds each request takes. Defaults to 0.
+            latency_per_row (float, optional): The additional time in seconds per row of a request. Defaults to 0.
+            error_rate (float, optional): The fraction of requests that fail. Defaults to 0.
+            error_code (str, optional): The error code of the failed requests. Defaults to "ThrottlingException".
+            seed (int, optional): The seed of the random errors. Defaults to None.
+            error_status (int, optional): The HTTP status of responses returned for the errors instead of raising them. Defaults to None.
+            max_request_rows (int, optional): Requests with more rows are rejected as too large. Defaults to None (no limit).
+        """
+        self.latency = latency
+        self.latency_per_row = latency_per_row
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.error_status = error_status
+        self.max_request_rows = max_request_rows
+        self.requests = 0
+        self.errors = 0
+        self.rows = 0
+        self.nodes = {}
+        self.edges = set()
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        # (label or None, property) -> value -> set of node ids, built on first use
+        self.__indexes = {}
+
+    def execute_query(
+        self,
+        queryString: str,
+        parameters: dict,
+        language: str,
+        graphIdentifier: str,
+    ) -> dict:
+        """Executes a query the way the neptune-graph client does
+
+        Args:
+            queryString (str): The openCypher query
+            parameters (dict): The query parameters
+            language (str): The query language, must be OPEN_CYPHER
+            graphIdentifier (str): The graph identifier, ignored
+
+        Raises:
+            FakeClientError: Raised for unsupported queries and simulated errors
+
+        Returns:
+            dict: The response, with the result set as its payload
+        """
+        if language != "OPEN_CYPHER":
+            raise FakeClientError("ValidationException", f"Unsupported language {language}")
+        unwind = UNWIND_RE.search(queryString)
+        if (
+            unwind is None
+            and PAGE_RE.search(queryString) is None
+            and NODE_READ_RE.search(queryString) is None
+        ):
+            raise FakeClientError("ValidationException", "Unsupported query")
+        rows = parameters.get(unwind.group(1), []) if unwind else []
+
+        time.sleep(self.latency + self.latency_per_row * len(rows))
+        with self.__lock:
+            self.requests += 1
+            if self.max_request_rows is not None and len(rows) > self.max_request_rows:
+                self.errors += 1
+                raise FakeClientError("ValidationException", "Request too large")
+            if self.error_rate > 0 and self.__random.random() < self.error_rate:
+                self.errors += 1
+                if self.error_status is not None:
+                    return {
+                        "ResponseMetadata": {"HTTPStatusCode": self.error_status},
+                        "payload": io.BytesIO(b"{}"),
+                    }
+                raise FakeClientError(self.error_code, "Simulated error")
+            self.rows += len(rows)
+            if unwind is None and NODE_READ_RE.search(queryString) is not None:
+                results = self.__read(queryString, parameters)
+            elif unwind is None:
+                results = self.__page(queryString, parameters)
+            else:
+                results = self.__apply(queryString, rows, parameters)
+
+        return {
+            "ResponseMetadata": {"HTTPStatusCode": 200},
+            "payload": io.BytesIO(json.dumps({"results": results}).encode("utf-8")),
+        }
+
+    def __apply(self, query: str, rows: list, parameters: dict) -> list:
+        """Applies an UNWIND query to the in-memory graph
+
+        Args:
+            query (str): The query
+            rows (list): The rows of the UNWIND parameter
+            parameters (dict): The query parameters
+
+        Returns:
+            list: The result rows
+        """
+        node = NODE_MERGE_RE.search(query)
+        if node is not None:
+            keys = [unquote(k) for k, _ in SET_RE.findall(query)]
+            values = {
+                unquote(k): parameters.get(p) for k, p in SET_PARAMETER_RE.findall(query)
+            }
+            for r in rows:
+                self.__merge_node(
+                    node.group(1), r["__id"], {**values, **{k: r.get(k) for k in keys}}
+                )
+            return []
+
+        delete = NODE_DELETE_RE.search(query)
+        if delete is not None:
+            condition = CONDITION_RE.search(query)
+            results = []
+            for node_id in rows:
+                if self.__has(node_id, delete.group(1), condition) and self.__written_before(
+                    node_id, query, parameters
+                ):
+                    self.__delete_node(node_id)
+                    results.append({"id": node_id})
+            return results
+
+        orphaned_by = ORPHANED_BY_RE.search(query)
+        if orphaned_by is not None:
+            document_label, labels, label = orphaned_by.group(1, 2, 3)
+            labels = labels.split("|")
+            expired = set(parameters.get(orphaned_by.group(4), []))
+            documents = {i for i in rows if self.__has(i, document_label)}
+            contained = {
+                t
+                for f, edge_label, t in self.edges
+                if f in documents and edge_label in labels and self.__has(t, label)
+            }
+            others = {
+                t
+                for f, edge_label, t in self.edges
+                if t in contained
+                and edge_label in labels
+                and f not in expired
+                and self.__has(f, document_label)
+            }
+            return [{"id": c} for c in sorted(contained - others)]
+
+        matches = MATCH_RE.findall(query)
+        merge = EDGE_MERGE_RE.search(query)
+        delete = EDGE_DELETE_RE.search(query)
+        if len(matches) != 2 or (merge is None and delete is None):
+            raise FakeClientError("ValidationException", "Unsupported query")
+
+        label = (merge or delete).group(1)
+        matched = 0
+        for r in rows:
+            from_ids = self.__match(matches[0], r)
+            to_ids = self.__match(matches[1], r)
+            matched += len(from_ids) * len(to_ids)
+            for f in from_ids:
+                for t in to_ids:
+                    if merge is not None:
+                        self.edges.add((f, label, t))
+                    else:
+                        self.edges.discard((f, label, t))
+        if "count(s) as edges" in query:
+            return [{"edges": matched}]
+        return []
+
+    def __page(self, query: str, parameters: dict) -> list:
+        """Reads a page of the nodes of a label ordered by `~id`, like the queries of
+        retention.documents_query and retention.orphans_query
+
+        Args:
+            query (str): The query
+            parameters (dict): The query parameters, with $after and $limit
+
+        Returns:
+            list: The result rows
+        """
+        label = PAGE_RE.search(query).group(2)
+        condition = CONDITION_RE.search(query)
+        ids = sorted(
+            i
+            for i in self.nodes
+            if i > parameters["after"]
+            and self.__has(i, label, condition)
+            and self.__written_before(i, query, parameters)
+        )[: parameters["limit"]]
+        returns = RETURN_RE.findall(query)
+        return [
+            {name: self.__value(i, expression) for expression, _, name in returns}
+            for i in ids
+        ]
+
+    def __read(self, query: str, parameters: dict) -> list:
+        """Reads the properties of one node matched on `~id`, like
+        query_cache.generation_query
+
+        Args:
+            query (str): The query
+            parameters (dict): The query parameters
+
+        Returns:
+            list: The result row, none if the node does not exist
+        """
+        _, label, parameter = NODE_READ_RE.search(query).groups()
+        node_id = parameters[parameter]
+        if not self.__has(node_id, label):
+            return []
+        returns = RETURN_RE.findall(query)
+        return [{name: self.__value(node_id, expression) for expression, _, name in returns}]
+
+    def __value(self, node_id: str, expression: str) -> object:
+        """Evaluates a returned expression of a node
+
+        Args:
+            node_id (str): The `~id` of the node
+            expression (str): The expression, id(), a property or a coalesce() of properties
+
+        Returns:
+            object: The value
+        """
+        if expression.startswith("id("):
+            return node_id
+        properties = self.nodes[node_id]["properties"]
+        for name in PROPERTY_RE.findall(expression):
+            if properties.get(unquote(name)) is not None:
+                return properties[unquote(name)]
+        return None
+
+    def __has(self, node_id: str, label: str, condition: re.Match = None) -> bool:
+        """Determines if a node exists with a label and matches a condition
+
+        Args:
+            node_id (str): The `~id` of the node
+            label (str): The label
+            condition (re.Match, optional): A `NOT (...)-[...]->(...)` pattern around the node n. Defaults to None.
+
+        Returns:
+            bool: True if the node matches
+        """
+        node = self.nodes.get(node_id)
+        if node is None or label not in node["labels"]:
+            return False
+        if condition is None:
+            return True
+        from_var, from_label, labels, _, to_label = condition.groups()
+        labels = labels.split("|")
+        for f, edge_label, t in self.edges:
+            if edge_label not in labels:
+                continue
+            if from_var == "n":
+                other, linked = t, f == node_id
+                other_label = to_label
+            else:
+                other, linked = f, t == node_id
+                other_label = from_label
+            if linked and (
+                not other_label or other_label in self.nodes[other]["labels"]
+            ):
+                return False
+        return True
+
+    def __written_before(self, node_id: str, query: str, parameters: dict) -> bool:
+        """Determines if a node matches the `coalesce(n.<property>, 0) < $<parameter>`
+        condition of a query, if it has one
+
+        Args:
+            node_id (str): The `~id` of the node
+            query (str): The query
+            parameters (dict): The query parameters
+
+        Returns:
+            bool: True if the node matches or the query has no such condition
+        """
+        condition = WRITTEN_BEFORE_RE.search(query)
+        if condition is None:
+            return True
+        property, parameter = condition.groups()
+        written = self.nodes[node_id]["properties"].get(unquote(property))
+        return (written or 0) < parameters[parameter]
+
+    def __delete_node(self, node_id: str):
+        """DETACH DELETEs a node
+
+        Args:
+            node_id (str): The `~id` of the node
+        """
+        node = self.nodes.pop(node_id)
+        self.edges = {e for e in self.edges if node_id not in (e[0], e[2])}
+        for (_, property), index in self.__indexes.items():
+            value = node["properties"].get(property)
+            if is_scalar(value):
+                index.get(value, set()).discard(node_id)
+
+    def __merge_node(self, label: str, node_id: str, props: dict):
+        """MERGEs a node on its `~id` and SETs its properties
+
+        Args:
+            label (str): The label of the node
+            node_id (str): The `~id` of the node
+            props (dict): The properties to set
+        """
+        node = self.nodes.setdefault(node_id, {"labels": set(), "properties": {}})
+        node["labels"].add(label)
+        for k, v in props.items():
+            old = node["properties"].get(k)
+            node["properties"][k] = v
+            for (index_label, property), index in self.__indexes.items():
+                if property != k or (index_label and index_label not in node["labels"]):
+                    continue
+                if is_scalar(old):
+                    index.get(old, set()).discard(node_id)
+                if is_scalar(v):
+                    index.setdefault(v, set()).add(node_id)
+
+    def __match(self, match: tuple, row: dict) -> set:
+        """Finds the nodes matched by a MATCH pattern for one row
+
+        Args:
+            match (tuple): The variable, label, property and row field of the pattern
+            row (dict): The row
+
+        Returns:
+            set: The ids of the matched nodes
+        """
+        _, label, property, field = match
+        property = unquote(property)
+        value = row.get(field)
+        if property == "~id":
+            node = self.nodes.get(value)
+            if node is None or (label and label not in node["labels"]):
+                return set()
+            return {value}
+        if not is_scalar(value):
+            return set()
+        return self.__index(label or None, property).get(value, set())
+
+    def __index(self, label: str, property: str) -> dict:
+        """Gets, building if needed, the index of a property
+
+        Args:
+            label (str): The label the index is restricted to, or None
+            property (str): The property
+
+        Returns:
+            dict: The map of property value to the ids of the nodes having it
+        """
+        key = (label, property)
+        if key not in self.__indexes:
+            index = {}
+            for node_id, node in self.nodes.items():
+                if label and label not in node["labels"]:
+                    continue
+                value = node["properties"].get(property)
+                if is_scalar(value):
+                    index.setdefault(value, set()).add(node_id)
+            self.__indexes[key] = index
+        return self.__indexes[key]
+
+    def count_nodes(self, label: str = None) -> int:
+        """Counts the nodes in the graph
+
+        Args:
+            label (str, optional): Only count the nodes with this label. Defaults to None.
+
+        Returns:
+            int: The number of nodes
+        """
+        with self.__lock:
+            if label is None:
+                return len(self.nodes)
+            return sum(1 for n in self.nodes.values() if label in n["labels"])
+
+    def count_edges(self, label: str = None) -> int:
+        """Counts the edges in the graph
+
+        Args:
+            label (str, optional): Only count the edges with this label. Defaults to None.
+
+        Returns:
+            int: The number of edges
+        """
+        with self.__lock:
+            if label is None:
+                return len(self.edges)
+            return sum(1 for e in self.edges if e[1] == label)
+
+
+def unquote(name: str) -> str:
+    """Reverses sbom_writer._quote
+
+    Args:
+        name (str): The name without its surrounding backticks
+
+    Returns:
+        str: The name
+    """
+    return name.replace("``", "`")
+
+
+def is_scalar(value: object) -> bool:
+    """Determines if a property value can be matched on
+
+    Args:
+        value (object): The value
+
+    Returns:
+        bool: True for strings, numbers and booleans
+    """
+    return isinstance(value, (str, int, float, bool))
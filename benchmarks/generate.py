@@ -0,0 +1,278 @@
+import random
+import uuid
+from spdx_tagvalue import (
+    CREATION_INFO_TAGS,
+    DOCUMENT_TAGS,
+    PACKAGE_LIST_TAGS,
+    PACKAGE_TAGS,
+)
+
+ECOSYSTEMS = ["npm", "pypi", "maven", "golang", "cargo"]
+SEVERITIES = ["low", "medium", "high", "critical"]
+
+
+def _packages(count: int, rng: random.Random) -> list:
+    """Creates the name, version and purl of each synthetic package
+
+    Args:
+        count (int): The number of packages
+        rng (random.Random): The random source
+
+    Returns:
+        list: (name, version, purl) tuples
+    """
+    packages = []
+    for i in range(count):
+        ecosystem = ECOSYSTEMS[i % len(ECOSYSTEMS)]
+        name = f"pkg-{i:06d}"
+        version = f"{rng.randint(0, 9)}.{rng.randint(0, 30)}.{rng.randint(0, 99)}"
+        packages.append((name, version, f"pkg:{ecosystem}/{name}@{version}"))
+    return packages
+
+
+def _dependencies(count: int, fan_out: int, rng: random.Random) -> list:
+    """Picks the dependencies of each package, always on packages further down the
+    list so the dependency graph is acyclic like a real one
+
+    Args:
+        count (int): The number of packages
+        fan_out (int): The average number of dependencies per package
+        rng (random.Random): The random source
+
+    Returns:
+        list: The indexes of the dependencies of each package
+    """
+    deps = []
+    for i in range(count):
+        remaining = count - i - 1
+        n = min(remaining, rng.randint(0, 2 * fan_out))
+        deps.append(sorted(rng.sample(range(i + 1, count), n)) if n > 0 else [])
+    return deps
+
+
+def generate_cyclonedx(
+    components: int,
+    dependency_fan_out: int = 3,
+    vulnerability_ratio: float = 0.05,
+    seed: int = 0,
+) -> dict:
+    """Generates a synthetic CycloneDX 1.4 document
+
+    Args:
+        components (int): The number of components
+        dependency_fan_out (int, optional): The average number of dependencies per component. Defaults to 3.
+        vulnerability_ratio (float, optional): The number of vulnerabilities per component. Defaults to 0.05.
+        seed (int, optional): The random seed, the same seed gives the same document. Defaults to 0.
+
+    Returns:
+        dict: The document
+    """
+    rng = random.Random(seed)
+    packages = _packages(components, rng)
+    bom = {
+        "bomFormat": "CycloneDX",
+        "specVersion": "1.4",
+        "serialNumber": f"urn:uuid:{uuid.UUID(int=rng.getrandbits(128))}",
+        "version": 1,
+        "metadata": {
+            "timestamp": "2024-01-01T00:00:00Z",
+            "component": {
+                "bom-ref": f"application-{seed}",
+                "type": "application",
+                "name": f"application-{seed}",
+            },
+        },
+        "components": [
+            {
+                "bom-ref": purl,
+                "type": "library",
+                "name": name,
+                "version": version,
+                "purl": purl,
+                "licenses": [{"license": {"id": "MIT"}}],
+                "externalReferences": [
+                    {"type": "website", "url": f"https://example.com/{name}"}
+                ],
+            }
+            for name, version, purl in packages
+        ],
+        "dependencies": [
+            {"ref": packages[i][2], "dependsOn": [packages[d][2] for d in deps]}
+            for i, deps in enumerate(
+                _dependencies(components, dependency_fan_out, rng)
+            )
+        ],
+        "vulnerabilities": [],
+    }
+    for i in range(int(components * vulnerability_ratio)):
+        affected = rng.sample(packages, min(len(packages), rng.randint(1, 3)))
+        bom["vulnerabilities"].append(
+            {
+                "bom-ref": f"vuln-{i}",
+                "id": f"CVE-2024-{i:05d}",
+                "source": {"name": "NVD", "url": "https://nvd.nist.gov/"},
+                "ratings": [
+                    {
+                        "score": round(rng.uniform(1, 10), 1),
+                        "severity": rng.choice(SEVERITIES),
+                        "method": "CVSSv31",
+                    }
+                ],
+                "description": f"Synthetic vulnerability {i}",
+                "affects": [{"ref": purl} for _, _, purl in affected],
+            }
+        )
+    return bom
+
+
+def generate_spdx(packages: int, dependency_fan_out: int = 3, seed: int = 0) -> dict:
+    """Generates a synthetic SPDX 2.3 document
+
+    Args:
+        packages (int): The number of packages
+        dependency_fan_out (int, optional): The average number of relationships per package besides DESCRIBES. Defaults to 3.
+        seed (int, optional): The random seed, the same seed gives the same document. Defaults to 0.
+
+    Returns:
+        dict: The document
+    """
+    rng = random.Random(seed)
+    generated = _packages(packages, rng)
+    bom = {
+        "spdxVersion": "SPDX-2.3",
+        "dataLicense": "CC0-1.0",
+        "SPDXID": "SPDXRef-DOCUMENT",
+        "name": f"application-{seed}",
+        "documentNamespace": f"https://example.com/spdx/{uuid.UUID(int=rng.getrandbits(128))}",
+        "creationInfo": {
+            "created": "2024-01-01T00:00:00Z",
+            "creators": ["Tool: sbom-neptune-benchmarks"],
+        },
+        "packages": [
+            {
+                "name": name,
+                "SPDXID": f"SPDXRef-Package-{i}",
+                "versionInfo": version,
+                "downloadLocation": "NOASSERTION",
+                "licenseConcluded": "MIT",
+                "externalRefs": [
+                    {
+                        "referenceCategory": "PACKAGE-MANAGER",
+                        "referenceType": "purl",
+                        "referenceLocator": purl,
+                    }
+                ],
+            }
+            for i, (name, version, purl) in enumerate(generated)
+        ],
+        "relationships": [],
+    }
+    for i in range(packages):
+        bom["relationships"].append(
+            {
+                "spdxElementId": "SPDXRef-DOCUMENT",
+                "relationshipType": "DESCRIBES",
+                "relatedSpdxElement": f"SPDXRef-Package-{i}",
+            }
+        )
+    for i, deps in enumerate(_dependencies(packages, dependency_fan_out, rng)):
+        for d in deps:
+            bom["relationships"].append(
+                {
+                    "spdxElementId": f"SPDXRef-Package-{i}",
+                    "relationshipType": "DEPENDS_ON",
+                    "relatedSpdxElement": f"SPDXRef-Package-{d}",
+                }
+            )
+    return bom
+
+
+def to_spdx_tag_value(bom: dict) -> str:
+    """Writes an SPDX JSON document in the SPDX tag-value format, e.g. to compare the
+    parsing of the same document in both formats. Only the document, creation info,
+    package and relationship properties read by parse_tag_value are written.
+
+    Args:
+        bom (dict): The SPDX document
+
+    Returns:
+        str: The tag-value document
+    """
+
+    def value(v):
+        v = str(v).lower() if isinstance(v, bool) else str(v)
+        return f"<text>{v}</text>" if "\n" in v else v
+
+    lines = []
+    for tag, key in DOCUMENT_TAGS.items():
+        if key in bom:
+            lines.append(f"{tag}: {value(bom[key])}")
+    creation_info = bom.get("creationInfo", {})
+    lines.extend(f"Creator: {c}" for c in creation_info.get("creators", []))
+    for tag, key in CREATION_INFO_TAGS.items():
+        if key in creation_info:
+            lines.append(f"{tag}: {value(creation_info[key])}")
+
+    for p in bom.get("packages", []):
+        lines.append("")
+        for tag, key in PACKAGE_TAGS.items():
+            if key in p:
+                lines.append(f"{tag}: {value(p[key])}")
+        for tag, key in PACKAGE_LIST_TAGS.items():
+            lines.extend(f"{tag}: {value(v)}" for v in p.get(key, []))
+        if "filesAnalyzed" in p:
+            lines.append(f"FilesAnalyzed: {value(p['filesAnalyzed'])}")
+        for c in p.get("checksums", []):
+            lines.append(f"PackageChecksum: {c['algorithm']}: {c['checksumValue']}")
+        for r in p.get("externalRefs", []):
+            lines.append(
+                f"ExternalRef: {r['referenceCategory']} {r['referenceType']} {r['referenceLocator']}"
+            )
+
+    lines.append("")
+    for r in bom.get("relationships", []):
+        lines.append(
+            f"Relationship: {r['spdxElementId']} {r['relationshipType']} {r['relatedSpdxElement']}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def generate_advisories(packages: int, advisories_per_package: int = 2, seed: int = 0) -> list:
+    """Generates synthetic OSV advisories for the packages of the synthetic documents,
+    and as many again for packages that are not in them
+
+    Args:
+        packages (int): The number of packages of the documents
+        advisories_per_package (int, optional): The number of advisories per package. Defaults to 2.
+        seed (int, optional): The random seed. Defaults to 0.
+
+    Returns:
+        list: The OSV advisories
+    """
+    rng = random.Random(seed)
+    advisories = []
+    for i in range(2 * packages):
+        ecosystem = ECOSYSTEMS[i % len(ECOSYSTEMS)]
+        for n in range(advisories_per_package):
+            introduced = f"{rng.randint(0, 4)}.{rng.randint(0, 30)}.0"
+            fixed = f"{rng.randint(5, 9)}.{rng.randint(0, 30)}.{rng.randint(0, 99)}"
+            advisories.append(
+                {
+                    "id": f"OSV-{i:06d}-{n}",
+                    "summary": f"Synthetic advisory {n} of pkg-{i:06d}",
+                    "modified": "2024-01-01T00:00:00Z",
+                    "database_specific": {"severity": rng.choice(SEVERITIES).upper()},
+                    "affected": [
+                        {
+                            "package": {"purl": f"pkg:{ecosystem}/pkg-{i:06d}"},
+                            "ranges": [
+                                {
+                                    "type": "ECOSYSTEM",
+                                    "events": [{"introduced": introduced}, {"fixed": fixed}],
+                                }
+                            ],
+                        }
+                    ],
+                }
+            )
+    return advisories
@@ -0,0 +1,136 @@
+import argparse
+import io
+import json
+import logging
+import time
+from benchmarks.generate import generate_spdx, to_spdx_tag_value
+from benchmarks.run import load_examples
+from sbom_writer import BomType, determine_bom_type
+from spdx_tagvalue import parse_tag_value
+
+SIZES = [1000, 10000, 100000]
+
+
+def time_parse(parse, text: str, repeat: int) -> tuple:
+    """Parses a document repeatedly and keeps the fastest time
+
+    Args:
+        parse (function): Parses a text file object
+        text (str): The document
+        repeat (int): The number of times to parse it
+
+    Returns:
+        tuple: The parsed document and the fastest time in seconds
+    """
+    best = None
+    for _ in range(repeat):
+        fp = io.StringIO(text)
+        start = time.perf_counter()
+        bom = parse(fp)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return bom, best
+
+
+def run_case(name: str, bom: dict, repeat: int) -> dict:
+    """Parses the same SPDX document as JSON and as tag-value
+
+    Args:
+        name (str): The name of the case
+        bom (dict): The SPDX document
+        repeat (int): The number of times to parse each format
+
+    Returns:
+        dict: The measurements
+    """
+    json_text = json.dumps(bom)
+    tag_value_text = to_spdx_tag_value(bom)
+    from_json, json_seconds = time_parse(json.load, json_text, repeat)
+    from_tag_value, tag_value_seconds = time_parse(
+        parse_tag_value, tag_value_text, repeat
+    )
+    return {
+        "name": name,
+        "packages": len(from_json.get("packages", [])),
+        "json_mb": len(json_text) / (1024 * 1024),
+        "json_seconds": json_seconds,
+        "tag_value_mb": len(tag_value_text) / (1024 * 1024),
+        "tag_value_seconds": tag_value_seconds,
+        "same_packages": len(from_json.get("packages", []))
+        == len(from_tag_value.get("packages", [])),
+        "same_relationships": from_json.get("relationships", [])
+        == from_tag_value.get("relationships", []),
+    }
+
+
+def format_result(result: dict) -> str:
+    """Formats the measurements of a case as a table row
+
+    Args:
+        result (dict): The measurements
+
+    Returns:
+        str: The row
+    """
+    same = "yes" if result["same_packages"] and result["same_relationships"] else "NO"
+    return (
+        f"{result['name'][:50]:<50}{result['packages']:>9}"
+        f"{result['json_mb']:>9.1f}{result['json_seconds']:>9.3f}"
+        f"{result['tag_value_mb']:>9.1f}{result['tag_value_seconds']:>9.3f}{same:>6}"
+    )
+
+
+def parse_args(args: list = None) -> argparse.Namespace:
+    """Parses the command line arguments
+
+    Args:
+        args (list, optional): The arguments to parse. Defaults to sys.argv.
+
+    Returns:
+        argparse.Namespace: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="Compare parsing SPDX documents as JSON and as tag-value"
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="*",
+        default=SIZES,
+        help="Numbers of packages of the synthetic documents (default: 1000 10000 100000)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Number of times each document is parsed, the fastest is kept (default: 3)",
+    )
+    parser.add_argument(
+        "--skip-examples", action="store_true", help="Do not run the examples/ files"
+    )
+    return parser.parse_args(args)
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    args = parse_args()
+    cases = []
+    if not args.skip_examples:
+        cases.extend(
+            (name, lambda b=bom: b)
+            for name, bom in load_examples()
+            if determine_bom_type(bom) == BomType.SPDX
+        )
+    cases.extend(
+        (f"spdx-{size}", lambda s=size: generate_spdx(s)) for size in args.sizes
+    )
+    print(
+        f"{'case':<50}{'packages':>9}{'JSON MB':>9}{'JSON s':>9}"
+        f"{'TV MB':>9}{'TV s':>9}{'same':>6}"
+    )
+    for name, create in cases:
+        print(format_result(run_case(name, create(), args.repeat)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
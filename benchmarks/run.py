@@ -0,0 +1,198 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import time
+import tracemalloc
+from benchmarks.fake_neptune import FakeNeptuneGraphClient
+from benchmarks.generate import generate_cyclonedx, generate_spdx
+from sbom_writer import NeptuneAnalyticsSBOMWriter
+from spdx_tagvalue import load_sbom
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "examples")
+SIZES = [1000, 10000, 100000]
+
+
+def load_examples(directory: str = EXAMPLES_DIR) -> list:
+    """Loads the example SBOMs
+
+    Args:
+        directory (str, optional): The directory holding the examples. Defaults to examples/.
+
+    Returns:
+        list: (name, document) tuples
+    """
+    cases = []
+    for path in sorted(glob.glob(os.path.join(directory, "*", "*"))):
+        try:
+            cases.append((os.path.basename(path), load_sbom(path)))
+        except ValueError:
+            logging.warning(f"Skipping {path}, it is not an SBOM")
+    return cases
+
+
+def synthetic_cases(sizes: list) -> list:
+    """Creates the synthetic cases, generating each document lazily
+
+    Args:
+        sizes (list): The numbers of components to generate documents with
+
+    Returns:
+        list: (name, function returning the document) tuples
+    """
+    cases = []
+    for size in sizes:
+        cases.append((f"cyclonedx-{size}", lambda s=size: generate_cyclonedx(s)))
+        cases.append((f"spdx-{size}", lambda s=size: generate_spdx(s)))
+    return cases
+
+
+def run_case(name: str, bom: dict, args: argparse.Namespace, trace: bool) -> dict:
+    """Writes one document to a fresh fake graph
+
+    Args:
+        name (str): The name of the case
+        bom (dict): The document
+        args (argparse.Namespace): The benchmark settings
+        trace (bool): Whether to measure the peak memory with tracemalloc
+
+    Returns:
+        dict: The measurements
+    """
+    client = FakeNeptuneGraphClient(
+        latency=args.latency, error_rate=args.error_rate, seed=0
+    )
+    writer = NeptuneAnalyticsSBOMWriter(
+        "benchmark", "local", max_workers=args.batch_workers, client=client
+    )
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    writer.write_sbom(bom)
+    seconds = time.perf_counter() - start
+    peak = 0
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {
+        "name": name,
+        "seconds": seconds,
+        "requests": client.requests,
+        "errors": client.errors,
+        "rows": client.rows,
+        "rows_per_second": client.rows / seconds if seconds > 0 else 0.0,
+        "nodes": client.count_nodes(),
+        "edges": client.count_edges(),
+        "peak_memory_mb": peak / (1024 * 1024),
+    }
+
+
+def run(args: argparse.Namespace) -> list:
+    """Runs every case
+
+    Args:
+        args (argparse.Namespace): The benchmark settings
+
+    Returns:
+        list: The measurements of each case
+    """
+    cases = []
+    if not args.skip_examples:
+        cases.extend((name, lambda b=bom: b) for name, bom in load_examples())
+    cases.extend(synthetic_cases(args.sizes))
+
+    results = []
+    for name, create in cases:
+        result = run_case(name, create(), args, trace=False)
+        # tracemalloc slows allocation down, so memory is measured in a separate run
+        if args.memory:
+            result["peak_memory_mb"] = run_case(name, create(), args, trace=True)[
+                "peak_memory_mb"
+            ]
+        print(format_result(result), flush=True)
+        results.append(result)
+    return results
+
+
+def format_result(result: dict) -> str:
+    """Formats the measurements of a case as a table row
+
+    Args:
+        result (dict): The measurements
+
+    Returns:
+        str: The row
+    """
+    return (
+        f"{result['name'][:60]:<60}{result['seconds']:>9.2f}{result['requests']:>9}"
+        f"{result['rows']:>9}{result['rows_per_second']:>11.0f}"
+        f"{result['nodes']:>9}{result['edges']:>9}{result['peak_memory_mb']:>10.1f}"
+    )
+
+
+def parse_args(args: list = None) -> argparse.Namespace:
+    """Parses the command line arguments
+
+    Args:
+        args (list, optional): The arguments to parse. Defaults to sys.argv.
+
+    Returns:
+        argparse.Namespace: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark SBOM ingestion against an in-process fake graph"
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="*",
+        default=SIZES,
+        help="Numbers of components of the synthetic documents (default: 1000 10000 100000)",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Simulated latency of each request in seconds (default: 0)",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of requests that are throttled (default: 0)",
+    )
+    parser.add_argument(
+        "--batch-workers",
+        type=int,
+        default=1,
+        help="Number of batches in flight per write phase (default: 1)",
+    )
+    parser.add_argument(
+        "--skip-examples", action="store_true", help="Do not run the examples/ files"
+    )
+    parser.add_argument(
+        "--no-memory",
+        dest="memory",
+        action="store_false",
+        help="Do not measure peak memory, which runs every case a second time",
+    )
+    parser.add_argument("--output", default=None, help="Write the results as JSON here")
+    return parser.parse_args(args)
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    args = parse_args()
+    print(
+        f"{'case':<60}{'seconds':>9}{'requests':>9}{'rows':>9}{'rows/s':>11}"
+        f"{'nodes':>9}{'edges':>9}{'peak MB':>10}"
+    )
+    results = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
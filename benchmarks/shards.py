@@ -0,0 +1,106 @@
+import argparse
+import logging
+import time
+from benchmarks.fake_neptune import FakeNeptuneGraphClient
+from benchmarks.generate import generate_cyclonedx
+from sbom_writer import NeptuneAnalyticsSBOMWriter
+from sharding import PartitionKey, ShardedSBOMWriter
+
+
+def write_documents(writer: object, boms: list) -> float:
+    """Writes the documents one after the other
+
+    Args:
+        writer (object): The NeptuneAnalyticsSBOMWriter or ShardedSBOMWriter
+        boms (list): The documents
+
+    Returns:
+        float: The seconds taken
+    """
+    start = time.perf_counter()
+    for bom in boms:
+        writer.write_sbom(bom)
+    return time.perf_counter() - start
+
+
+def parse_args(args: list = None) -> argparse.Namespace:
+    """Parses the command line arguments
+
+    Args:
+        args (list, optional): The arguments to parse. Defaults to sys.argv.
+
+    Returns:
+        argparse.Namespace: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="Compare writing synthetic SBOMs to one fake graph and to fake shards"
+    )
+    parser.add_argument(
+        "--shards", type=int, default=4, help="Number of shards (default: 4)"
+    )
+    parser.add_argument(
+        "--documents",
+        type=int,
+        default=200,
+        help="Number of documents, each of a different artifact (default: 200)",
+    )
+    parser.add_argument(
+        "--components",
+        type=int,
+        default=200,
+        help="Number of components per document, shared between documents (default: 200)",
+    )
+    parser.add_argument(
+        "--partition-key",
+        choices=[PartitionKey.ARTIFACT, PartitionKey.NAMESPACE, PartitionKey.ACCOUNT],
+        default=PartitionKey.ARTIFACT,
+        help="What documents are routed by (default: artifact)",
+    )
+    return parser.parse_args(args)
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    args = parse_args()
+    boms = [
+        generate_cyclonedx(args.components, seed=i) for i in range(args.documents)
+    ]
+
+    single = FakeNeptuneGraphClient()
+    seconds = write_documents(
+        NeptuneAnalyticsSBOMWriter("single", "local", client=single), boms
+    )
+    print(
+        f"1 graph: {seconds:.2f}s, {single.requests} requests, "
+        f"{single.count_nodes()} nodes, {single.count_edges()} edges"
+    )
+
+    clients = {f"shard-{i}": FakeNeptuneGraphClient() for i in range(args.shards)}
+    writer = ShardedSBOMWriter(
+        [NeptuneAnalyticsSBOMWriter(g, "local", client=c) for g, c in clients.items()],
+        args.partition_key,
+    )
+    seconds = write_documents(writer, boms)
+    print(f"{args.shards} shards: {seconds:.2f}s")
+    print(f"{'shard':<12}{'documents':>10}{'requests':>10}{'nodes':>9}{'edges':>9}")
+    for g, c in clients.items():
+        print(
+            f"{g:<12}{writer.documents[g]:>10}{c.requests:>10}"
+            f"{c.count_nodes():>9}{c.count_edges():>9}"
+        )
+
+    components = [
+        {i for i, n in c.nodes.items() if "Component" in n["labels"]}
+        for c in clients.values()
+    ]
+    distinct = set().union(*components)
+    print(
+        f"Components: {len(distinct)} distinct, written to "
+        f"{sum(len(c) for c in components) / max(1, len(distinct)):.2f} shards on average"
+    )
+    union = set().union(*(c.nodes for c in clients.values()))
+    print(f"Shards hold every node of the single graph: {union == set(single.nodes)}")
+
+
+if __name__ == "__main__":
+    main()
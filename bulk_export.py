@@ -0,0 +1,430 @@
+import csv
+import io
+import logging
+import os
+from advisories import AdvisoryIndex
+from sbom_writer import (
+    BomType,
+    CYCLONEDX_STREAMED_KEYS,
+    SPDX_STREAMED_KEYS,
+    CycloneDXRecordingWriter,
+    SPDXRecordingWriter,
+    determine_bom_type,
+    record_sbom,
+)
+from sbom_stream import read_header
+from spdx_tagvalue import SBOMFileFormat, detect_file_format, load_sbom
+
+
+class ExportFormat:
+    CSV = "csv"
+    PARQUET = "parquet"
+
+
+MAX_FILE_BYTES = 256 * 1024 * 1024
+
+
+class BulkExportStore:
+    """Collects the nodes and edges of any number of documents, de-duplicated by `~id`,
+    and writes them out as Neptune Analytics bulk import files.
+
+    It is the recorder of DocumentRecord.replay and of the CycloneDXRecordingWriter and
+    SPDXRecordingWriter used when streaming. Edges that could not be resolved within
+    their own document are resolved against every node in the store when the files
+    are written, so they may refer to nodes from other documents exactly as the
+    openCypher MATCH would.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        format: str = ExportFormat.CSV,
+        max_file_bytes: int = MAX_FILE_BYTES,
+    ) -> None:
+        """Creates the store
+
+        Args:
+            output_dir (str): The directory to write the nodes/ and edges/ files to
+            format (str, optional): Either ExportFormat.CSV or ExportFormat.PARQUET. Defaults to CSV.
+            max_file_bytes (int, optional): The approximate maximum size of each output file. Defaults to 256MB.
+        """
+        if format not in (ExportFormat.CSV, ExportFormat.PARQUET):
+            raise ValueError(f"Unsupported export format {format}")
+        self.output_dir = output_dir
+        self.format = format
+        self.max_file_bytes = max_file_bytes
+        self.nodes = {}
+        self.edges = {}
+        self.property_edges = []
+
+    def add_nodes(self, label: str, rows: list):
+        """Adds node rows, merging the properties of rows with the same `~id`
+
+        Args:
+            label (str): The label of the nodes
+            rows (list): The node rows, each with its `~id` in __id
+        """
+        for r in rows:
+            props = {k: v for k, v in r.items() if k != "__id" and v is not None}
+            if r["__id"] in self.nodes:
+                self.nodes[r["__id"]][1].update(props)
+            else:
+                self.nodes[r["__id"]] = (label, props)
+
+    def add_edges(self, label: str, rels: list):
+        """Adds edges between known `~id`s
+
+        Args:
+            label (str): The label of the edges
+            rels (list): The edges, each with a fromId and toId
+        """
+        for r in rels:
+            self.edges[(r["fromId"], label, r["toId"])] = None
+
+    def add_property_edges(
+        self,
+        label: str,
+        rels: list,
+        from_property: str,
+        to_property: str,
+        from_label: str = None,
+        to_label: str = None,
+    ):
+        """Adds edges whose endpoints are matched on a property when the files are written
+
+        Args:
+            label (str): The label of the edges
+            rels (list): The edges, each with a from and to property value
+            from_property (str): The property to match on the From node
+            to_property (str): The property to match on the To node
+            from_label (str, optional): The label the From node must have. Defaults to None.
+            to_label (str, optional): The label the To node must have. Defaults to None.
+        """
+        for r in rels:
+            self.property_edges.append(
+                (label, (from_property, r["from"], from_label), (to_property, r["to"], to_label))
+            )
+
+    def __resolve_property_edges(self) -> int:
+        """Turns the property matched edges into edges between `~id`s
+
+        Returns:
+            int: The number of edges that matched no node
+        """
+        needed = set()
+        for _, from_key, to_key in self.property_edges:
+            needed.add(from_key[:2])
+            needed.add(to_key[:2])
+        properties = {p for p, _ in needed if p != "~id"}
+        index = {}
+        for node_id, (_, props) in self.nodes.items():
+            for p in properties:
+                if p in props and (p, props[p]) in needed:
+                    index.setdefault((p, props[p]), []).append(node_id)
+
+        def resolve(key):
+            property, value, label = key
+            if property == "~id":
+                return [value]
+            return [
+                i
+                for i in index.get((property, value), [])
+                if label is None or self.nodes[i][0] == label
+            ]
+
+        unmatched = 0
+        for label, from_key, to_key in self.property_edges:
+            from_ids = resolve(from_key)
+            to_ids = resolve(to_key)
+            if len(from_ids) == 0 or len(to_ids) == 0:
+                unmatched += 1
+            for f in from_ids:
+                for t in to_ids:
+                    self.edges[(f, label, t)] = None
+        self.property_edges = []
+        return unmatched
+
+    def write(self) -> list:
+        """Writes the collected nodes and edges to the output directory
+
+        Returns:
+            list: The paths of the files written
+        """
+        unmatched = self.__resolve_property_edges()
+        if unmatched > 0:
+            logging.warning(f"{unmatched} edges did not match any node and were dropped")
+
+        # Like MATCH, drop edges whose endpoints were never written
+        edges = [e for e in self.edges if e[0] in self.nodes and e[2] in self.nodes]
+
+        files = []
+        by_label = {}
+        for node_id, (label, props) in self.nodes.items():
+            by_label.setdefault(label, []).append({"~id": node_id, **props})
+        for label, rows in by_label.items():
+            logging.info(f"Exporting {len(rows)} {label} nodes")
+            files.extend(self.__write_files("nodes", label, ["~id", "~label"], rows))
+
+        by_label = {}
+        for f, label, t in edges:
+            by_label.setdefault(label, []).append(
+                {"~id": f"{f}-{label}-{t}", "~from": f, "~to": t}
+            )
+        for label, rows in by_label.items():
+            logging.info(f"Exporting {len(rows)} {label} edges")
+            files.extend(
+                self.__write_files(
+                    "edges", label, ["~id", "~from", "~to", "~label"], rows
+                )
+            )
+        return files
+
+    def __write_files(
+        self, kind: str, label: str, system_columns: list, rows: list
+    ) -> list:
+        """Writes the rows of one label to as many files as needed to stay under max_file_bytes
+
+        Args:
+            kind (str): Either nodes or edges
+            label (str): The label of the rows
+            system_columns (list): The ~ columns of the file
+            rows (list): The rows to write
+
+        Returns:
+            list: The paths of the files written
+        """
+        os.makedirs(os.path.join(self.output_dir, kind), exist_ok=True)
+        properties = {}
+        for r in rows:
+            for k, v in r.items():
+                if k not in system_columns:
+                    properties.setdefault(k, []).append(v)
+        columns = {k: self.__column_type(v) for k, v in sorted(properties.items())}
+        for r in rows:
+            r["~label"] = label
+
+        if self.format == ExportFormat.PARQUET:
+            return self.__write_parquet(kind, label, system_columns, columns, rows)
+        return self.__write_csv(kind, label, system_columns, columns, rows)
+
+    def __column_type(self, values: list) -> str:
+        """Determines the Neptune type of a column from its values
+
+        Args:
+            values (list): The values of the column
+
+        Returns:
+            str: The Neptune bulk load type name
+        """
+        # bool is a subclass of int so it has to be checked first
+        if all(isinstance(v, bool) for v in values):
+            return "Bool"
+        if any(isinstance(v, bool) for v in values):
+            return "String"
+        if all(isinstance(v, int) for v in values):
+            return "Int"
+        if all(isinstance(v, (int, float)) for v in values):
+            return "Double"
+        return "String"
+
+    def __file_path(self, kind: str, label: str, part: int) -> str:
+        """Creates the path of one output file
+
+        Args:
+            kind (str): Either nodes or edges
+            label (str): The label of the rows in the file
+            part (int): The number of the file within the label
+
+        Returns:
+            str: The path of the file
+        """
+        return os.path.join(self.output_dir, kind, f"{label}-{part:05d}.{self.format}")
+
+    def __write_csv(
+        self, kind: str, label: str, system_columns: list, columns: dict, rows: list
+    ) -> list:
+        """Writes the rows as Neptune bulk load CSV files with typed headers
+
+        Args:
+            kind (str): Either nodes or edges
+            label (str): The label of the rows
+            system_columns (list): The ~ columns of the file
+            columns (dict): The property columns and their Neptune types
+            rows (list): The rows to write
+
+        Returns:
+            list: The paths of the files written
+        """
+        header = system_columns + [f"{k}:{t}" for k, t in columns.items()]
+        names = system_columns + list(columns.keys())
+        line = io.StringIO()
+        line_writer = csv.writer(line)
+        files = []
+        fp = None
+        size = 0
+        try:
+            for r in rows:
+                line_writer.writerow([self.__csv_value(r.get(n)) for n in names])
+                data = line.getvalue()
+                line.seek(0)
+                line.truncate()
+                if fp is None or size + len(data) > self.max_file_bytes:
+                    if fp is not None:
+                        fp.close()
+                    files.append(self.__file_path(kind, label, len(files)))
+                    fp = open(files[-1], "w", newline="")
+                    csv.writer(fp).writerow(header)
+                    size = 0
+                fp.write(data)
+                size += len(data)
+        finally:
+            if fp is not None:
+                fp.close()
+        return files
+
+    def __csv_value(self, value: object) -> object:
+        """Formats a value the way the Neptune bulk loader expects it
+
+        Args:
+            value (object): The property value
+
+        Returns:
+            object: The value to write to the CSV file
+        """
+        if value is None:
+            return ""
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        return value
+
+    def __write_parquet(
+        self, kind: str, label: str, system_columns: list, columns: dict, rows: list
+    ) -> list:
+        """Writes the rows as Parquet files, rolling over to a new file every
+        max_file_bytes of (estimated) row data
+
+        Args:
+            kind (str): Either nodes or edges
+            label (str): The label of the rows
+            system_columns (list): The ~ columns of the file
+            columns (dict): The property columns and their Neptune types
+            rows (list): The rows to write
+
+        Returns:
+            list: The paths of the files written
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        arrow_types = {
+            "Bool": pa.bool_(),
+            "Int": pa.int64(),
+            "Double": pa.float64(),
+            "String": pa.string(),
+        }
+        types = {c: "String" for c in system_columns}
+        types.update(columns)
+        schema = pa.schema([(k, arrow_types[t]) for k, t in types.items()])
+
+        def write_file(part):
+            data = {}
+            for k, t in types.items():
+                values = [r.get(k) for r in part]
+                if t == "String":
+                    values = [None if v is None else str(v) for v in values]
+                data[k] = values
+            files.append(self.__file_path(kind, label, len(files)))
+            pq.write_table(pa.table(data, schema=schema), files[-1])
+
+        files = []
+        part = []
+        size = 0
+        for r in rows:
+            row_size = sum(len(str(v)) for v in r.values() if v is not None)
+            if len(part) > 0 and size + row_size > self.max_file_bytes:
+                write_file(part)
+                part = []
+                size = 0
+            part.append(r)
+            size += row_size
+        if len(part) > 0:
+            write_file(part)
+        return files
+
+
+class NeptuneAnalyticsBulkExporter:
+    """Exports SBOMs to Neptune Analytics bulk import files instead of writing them
+    to a graph. Use it as a context manager, or call close() to write the files.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        format: str = ExportFormat.CSV,
+        max_file_bytes: int = MAX_FILE_BYTES,
+        advisories: AdvisoryIndex = None,
+    ) -> None:
+        """Creates the exporter
+
+        Args:
+            output_dir (str): The directory to write the nodes/ and edges/ files to
+            format (str, optional): Either ExportFormat.CSV or ExportFormat.PARQUET. Defaults to CSV.
+            max_file_bytes (int, optional): The approximate maximum size of each output file. Defaults to 256MB.
+            advisories (AdvisoryIndex, optional): Advisories to add the Vulnerabilities of the components from. Defaults to None.
+        """
+        self.store = BulkExportStore(output_dir, format, max_file_bytes)
+        self.advisories = advisories
+        self.files = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    def write_sbom(self, bom: dict) -> bool:
+        """Adds the SBOM to the export
+
+        Args:
+            bom (dict): The dict of the SBOM
+
+        Returns:
+            bool: True if successful, False if not
+        """
+        record = record_sbom(bom, self.advisories)
+        if record is None:
+            return False
+        record.replay(self.store)
+        return True
+
+    def write_sbom_stream(self, path: str) -> bool:
+        """Adds the SBOM file at the provided path to the export without loading it into memory
+
+        SPDX tag-value files are parsed a line at a time and then added as a whole.
+
+        Args:
+            path (str): The path of the JSON or SPDX tag-value SBOM file
+
+        Returns:
+            bool: True if successful, False if not
+        """
+        if detect_file_format(path) == SBOMFileFormat.TAG_VALUE:
+            return self.write_sbom(load_sbom(path))
+        header = read_header(path, CYCLONEDX_STREAMED_KEYS | SPDX_STREAMED_KEYS)
+        bom_type = determine_bom_type(header)
+        if bom_type == BomType.CYDX:
+            return CycloneDXRecordingWriter(self.store).write_document_stream(path, header)
+        elif bom_type == BomType.SPDX:
+            return SPDXRecordingWriter(self.store).write_document_stream(path, header)
+        logging.warning("Unknown SBOM format")
+        return False
+
+    def close(self) -> list:
+        """Writes the bulk import files
+
+        Returns:
+            list: The paths of the files written
+        """
+        self.files = self.store.write()
+        return self.files
@@ -0,0 +1,251 @@
+import logging
+import threading
+from advisories import AdvisoryIndex
+from sbom_writer import DocumentRecord, NeptuneAnalyticsSBOMWriter, record_sbom
+
+
+class CoalescedWriteError(Exception):
+    """Raised when writing coalesced rows fails. The failed requests may hold rows
+    of any buffered document, so every one of them is reported."""
+
+    def __init__(self, documents: list, error: Exception) -> None:
+        """Creates the error from the documents buffered when the write failed
+
+        Args:
+            documents (list): The document_key of each buffered document
+            error (Exception): The error the write failed with
+        """
+        self.documents = documents
+        self.error = error
+        super().__init__(
+            f"Writing the rows of {len(documents)} buffered documents failed: {error}"
+        )
+
+
+class CoalescingSBOMWriter:
+    """Writes many SBOMs with as few requests as possible by combining the rows of
+    consecutive documents into shared, full batches.
+
+    Each document is mapped as usual, but its node and edge rows are buffered per
+    label and query shape instead of being sent right away. Once max_buffered_rows
+    rows are buffered, every buffered node is sent, followed by every buffered edge,
+    so every edge's endpoints exist by the time it is written and no node is left
+    without the edges of its document for longer than one flush (see
+    retention.GRACE_SECONDS). Rows shared by the documents of a buffer (the same
+    Component, the same edge) are sent once.
+
+    Use it as a context manager, or call close(), so the remaining partial batches
+    are sent at the end. The buffers are swapped out under a lock and written
+    without it, so several threads can share the writer without waiting for each
+    other's flushes. Because rows of several documents share a request, a failed
+    write raises a CoalescedWriteError naming every document of the failed buffers.
+    Their rows are put back into the buffers, so the next flush sends them again
+    unless discard() drops them.
+    """
+
+    def __init__(
+        self,
+        writer: NeptuneAnalyticsSBOMWriter,
+        flush_rows: int = None,
+        max_buffered_rows: int = None,
+        advisories: AdvisoryIndex = None,
+    ) -> None:
+        """Creates the coalescing writer
+
+        Args:
+            writer (NeptuneAnalyticsSBOMWriter): The writer whose client and settings are used
+            flush_rows (int, optional): The rows per label a flush is sized for, max_buffered_rows defaults to 20 times it. Defaults to the batch size times the number of batch workers.
+            max_buffered_rows (int, optional): The number of buffered rows that triggers writing the buffers. Defaults to 20 times flush_rows.
+            advisories (AdvisoryIndex, optional): Advisories to add the Vulnerabilities of the components from. Defaults to None.
+        """
+        self.writer = writer.create_writer()
+        self.graph_identifier = writer.graph_identifier
+        self.flush_rows = flush_rows or self.writer.stream_batch_size
+        self.max_buffered_rows = max_buffered_rows or self.flush_rows * 20
+        self.advisories = advisories
+        self.documents = 0
+        self.__nodes = {}
+        self.__edges = {}
+        self.__property_edges = {}
+        # The document_key of the documents with rows in the buffers
+        self.__documents = []
+        self.__lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write_sbom(self, bom: dict, document_key: object = None) -> bool:
+        """Maps the SBOM and buffers its rows, writing the buffers once they are full
+
+        Args:
+            bom (dict): The dict of the SBOM
+            document_key (object, optional): Identifies the document in a CoalescedWriteError, e.g. its path. Defaults to None.
+
+        Raises:
+            CoalescedWriteError: Raised if writing the full buffers failed
+
+        Returns:
+            bool: True if successful, False if not
+        """
+        record = record_sbom(bom, self.advisories)
+        if record is None:
+            return False
+        with self.__lock:
+            self.__add(record)
+            self.__documents.append(document_key)
+            buffers = self.__take(final=False)
+        self.__write(buffers)
+        return True
+
+    def flush(self):
+        """Writes every buffered row, nodes first
+
+        Raises:
+            CoalescedWriteError: Raised if writing the buffers failed
+        """
+        with self.__lock:
+            buffers = self.__take(final=True)
+        self.__write(buffers)
+
+    def close(self):
+        """Writes every buffered row, see flush(), and shuts down the batch pool"""
+        self.flush()
+        self.writer.close()
+
+    def discard(self) -> list:
+        """Drops every buffered row without writing it, e.g. once the documents of a
+        CoalescedWriteError have been marked as failed
+
+        Returns:
+            list: The document_key of each document whose rows were dropped
+        """
+        with self.__lock:
+            documents = self.__documents
+            self.__nodes = {}
+            self.__edges = {}
+            self.__property_edges = {}
+            self.__documents = []
+        return documents
+
+    def __add(self, record: DocumentRecord):
+        """Adds the rows of a document to the buffers
+
+        Args:
+            record (DocumentRecord): The nodes and edges of the document
+        """
+        self.documents += 1
+        for node_id, (label, row) in record.nodes.items():
+            rows = self.__nodes.setdefault(label, {})
+            if node_id in rows:
+                rows[node_id].update({k: v for k, v in row.items() if v is not None})
+            else:
+                rows[node_id] = row
+        for f, label, t in record.edges:
+            self.__edges.setdefault(label, set()).add((f, t))
+        for label, from_p, from_v, to_p, to_v, from_label, to_label in (
+            record.property_edges
+        ):
+            self.__property_edges.setdefault(
+                (label, from_p, to_p, from_label, to_label), set()
+            ).add((from_v, to_v))
+
+    def __take(self, final: bool) -> tuple:
+        """Takes the buffers out to be written, once max_buffered_rows rows are
+        buffered or when final. Called with the lock held; the buffers are written
+        without it, so other threads keep buffering documents in the meantime.
+
+        Args:
+            final (bool): Whether to take the buffers whatever their size
+
+        Returns:
+            tuple: The node, edge and property edge buffers and their documents, or None if there is nothing to write yet
+        """
+        buffered = sum(
+            len(b)
+            for b in (
+                *self.__nodes.values(),
+                *self.__edges.values(),
+                *self.__property_edges.values(),
+            )
+        )
+        if buffered == 0 or (not final and buffered < self.max_buffered_rows):
+            return None
+        buffers = (self.__nodes, self.__edges, self.__property_edges, self.__documents)
+        self.__nodes = {}
+        self.__edges = {}
+        self.__property_edges = {}
+        self.__documents = []
+        return buffers
+
+    def __write(self, buffers: tuple):
+        """Writes buffers taken by __take. If a write fails, the rows are put back
+        into the buffers, so the next flush sends them again unless discard() drops
+        them.
+
+        Args:
+            buffers (tuple): The buffers, or None
+
+        Raises:
+            CoalescedWriteError: Raised if a write failed, naming the documents of the buffers
+        """
+        if buffers is None:
+            return
+        nodes, edges, property_edges, documents = buffers
+        try:
+            self.__write_buffers(nodes, edges, property_edges)
+        except Exception as e:
+            with self.__lock:
+                self.__restore(buffers)
+            raise CoalescedWriteError(list(documents), e) from e
+        finally:
+            self.writer.publish_generation()
+
+    def __restore(self, buffers: tuple):
+        """Puts the rows of buffers that failed to be written back into the buffers.
+        The rows of documents buffered since then win over them.
+
+        Args:
+            buffers (tuple): The buffers taken by __take
+        """
+        nodes, edges, property_edges, documents = buffers
+        for label, rows in nodes.items():
+            buffered = self.__nodes.setdefault(label, {})
+            for node_id, row in rows.items():
+                if node_id in buffered:
+                    row.update(
+                        {k: v for k, v in buffered[node_id].items() if v is not None}
+                    )
+                buffered[node_id] = row
+        for label, rels in edges.items():
+            self.__edges.setdefault(label, set()).update(rels)
+        for key, rels in property_edges.items():
+            self.__property_edges.setdefault(key, set()).update(rels)
+        self.__documents = documents + self.__documents
+
+    def __write_buffers(self, nodes: dict, edges: dict, property_edges: dict):
+        """Writes every buffered node, then every buffered edge
+
+        Args:
+            nodes (dict): The node rows by `~id` of each label
+            edges (dict): The (from, to) `~id`s of each edge label
+            property_edges (dict): The (from, to) values of each property edge key
+        """
+        # The edges may point to any buffered node, so those go out first
+        for label, rows in nodes.items():
+            if len(rows) == 0:
+                continue
+            logging.info(
+                f"Writing {len(rows)} coalesced {label} rows from {self.documents} documents"
+            )
+            self.writer.write_node_rows(list(rows.values()), label)
+        for label, rels in edges.items():
+            if len(rels) > 0:
+                self.writer.write_rel([{"fromId": f, "toId": t} for f, t in rels], label)
+        for (label, *key), rels in property_edges.items():
+            if len(rels) > 0:
+                self.writer.write_rel_match_on_property(
+                    [{"from": f, "to": t} for f, t in rels], label, *key
+                )
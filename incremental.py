@@ -0,0 +1,240 @@
+import hashlib
+import json
+import logging
+import os
+from advisories import AdvisoryIndex
+from sbom_writer import (
+    BomType,
+    DocumentRecord,
+    NeptuneAnalyticsSBOMWriter,
+    NodeLabels,
+    determine_bom_type,
+    record_sbom,
+)
+from write_cache import WriteCache
+
+
+class SnapshotStore:
+    """Stores, per document, the node hashes and edges of its last successful ingest"""
+
+    def __init__(self, directory: str) -> None:
+        """Creates the store
+
+        Args:
+            directory (str): The directory to keep the snapshots in
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def __path(self, graph_identifier: str, document_id: str) -> str:
+        """Creates the path of the snapshot of a document
+
+        Args:
+            graph_identifier (str): The graph the document was written to
+            document_id (str): The `~id` of the Document node
+
+        Returns:
+            str: The path of the snapshot file
+        """
+        key = hashlib.sha1(f"{graph_identifier}/{document_id}".encode("utf-8"))
+        return os.path.join(self.directory, f"{key.hexdigest()}.json")
+
+    def load(self, graph_identifier: str, document_id: str) -> dict:
+        """Loads the snapshot of a document
+
+        Args:
+            graph_identifier (str): The graph the document was written to
+            document_id (str): The `~id` of the Document node
+
+        Returns:
+            dict: The snapshot, or None if the document has not been ingested before
+        """
+        path = self.__path(graph_identifier, document_id)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            snapshot = json.load(f)
+        snapshot["edges"] = {tuple(e) for e in snapshot["edges"]}
+        snapshot["property_edges"] = {tuple(e) for e in snapshot["property_edges"]}
+        return snapshot
+
+    def save(
+        self,
+        graph_identifier: str,
+        document_id: str,
+        version: object,
+        record: DocumentRecord,
+    ):
+        """Saves the snapshot of a document, replacing the previous one atomically
+
+        Args:
+            graph_identifier (str): The graph the document was written to
+            document_id (str): The `~id` of the Document node
+            version (object): The version of the document, if it has one
+            record (DocumentRecord): The recorded nodes and edges of the document
+        """
+        snapshot = {
+            "document_id": document_id,
+            "version": version,
+            "nodes": {
+                node_id: WriteCache.hash_row(row)
+                for node_id, (_, row) in record.nodes.items()
+            },
+            "edges": sorted(record.edges),
+            "property_edges": sorted(record.property_edges, key=str),
+        }
+        path = self.__path(graph_identifier, document_id)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(snapshot, f)
+        os.replace(f"{path}.tmp", path)
+
+    def delete(self, graph_identifier: str, document_id: str):
+        """Deletes the snapshot of a document, e.g. because the document was deleted
+        from the graph, so its next ingest is written in full
+
+        Args:
+            graph_identifier (str): The graph the document was written to
+            document_id (str): The `~id` of the Document node
+        """
+        path = self.__path(graph_identifier, document_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class IncrementalSBOMWriter:
+    """Writes only what changed in an SBOM since the last time the same document was
+    ingested into the same graph.
+
+    A document is identified by its Document `~id`, which comes from the CycloneDX
+    serialNumber or the SPDX documentNamespace. The nodes and edges of the new version
+    are compared to a local snapshot of the previous ingest, and only new nodes, nodes
+    whose properties changed, new edges and removed edges are sent.
+
+    Only the edges from the Document node itself (e.g. DESCRIBES) belong to a single
+    document. Component, Reference and Vulnerability `~id`s are shared by every
+    document that declares them, and so are the edges between them, so an edge
+    between shared nodes that the new version no longer declares is left in place:
+    another document may still declare it. For the same reason nodes no longer
+    referenced by the document are left in place, and a property removed from a node
+    is not unset, as with a full write, where the MERGE only SETs the properties a
+    document has. Edges that could only be matched on a property in the graph are
+    never deleted. Use retention.GraphGarbageCollector to remove what no document
+    references any more.
+    """
+
+    def __init__(
+        self,
+        writer: NeptuneAnalyticsSBOMWriter,
+        snapshot_dir: str,
+        advisories: AdvisoryIndex = None,
+    ) -> None:
+        """Creates the incremental writer
+
+        Args:
+            writer (NeptuneAnalyticsSBOMWriter): The writer to send the changes with
+            snapshot_dir (str): The directory to keep the document snapshots in
+            advisories (AdvisoryIndex, optional): Advisories to add the Vulnerabilities of the components from. Defaults to None.
+        """
+        self.writer = writer
+        self.advisories = advisories
+        self.snapshots = SnapshotStore(snapshot_dir)
+
+    def write_sbom(self, bom: dict) -> bool:
+        """Writes out the changes in the SBOM since its previous ingest
+
+        Args:
+            bom (dict): The dict of the SBOM
+
+        Returns:
+            bool: True if successful, False if not
+        """
+        bom_type = determine_bom_type(bom)
+        if bom_type == BomType.CYDX:
+            stable_id = "serialNumber" in bom
+            version = bom.get("version")
+        elif bom_type == BomType.SPDX:
+            stable_id = "documentNamespace" in bom
+            version = None
+        else:
+            logging.warning("Unknown SBOM format")
+            return False
+        record = record_sbom(bom, self.advisories)
+
+        graph_identifier = self.writer.graph_identifier
+        document_id = record.document_id
+        previous = None
+        if stable_id:
+            previous = self.snapshots.load(graph_identifier, document_id)
+        else:
+            logging.warning(
+                "The document has no serialNumber or documentNamespace, writing it in full"
+            )
+
+        if previous is None:
+            logging.info(f"No previous version of {document_id}, writing it in full")
+            previous = {"nodes": {}, "edges": set(), "property_edges": set()}
+        else:
+            logging.info(
+                f"Updating {document_id} from version {previous['version']} to {version}"
+            )
+
+        self.__apply(record, previous, document_id)
+        if stable_id:
+            self.snapshots.save(graph_identifier, document_id, version, record)
+        return True
+
+    def __apply(self, record: DocumentRecord, previous: dict, document_id: str):
+        """Sends the difference between the recorded document and its previous snapshot
+
+        Args:
+            record (DocumentRecord): The nodes and edges of the new version
+            previous (dict): The snapshot of the previous version
+            document_id (str): The `~id` of the Document node
+        """
+        writer = self.writer.thread_writer()
+
+        changed_nodes = {}
+        for node_id, (label, row) in record.nodes.items():
+            if previous["nodes"].get(node_id) != WriteCache.hash_row(row):
+                changed_nodes.setdefault(label, []).append(row)
+        added_edges = {}
+        for f, label, t in record.edges - previous["edges"]:
+            added_edges.setdefault(label, []).append({"fromId": f, "toId": t})
+        added_property_edges = {}
+        for edge in record.property_edges - previous["property_edges"]:
+            label, from_p, from_v, to_p, to_v, from_label, to_label = edge
+            added_property_edges.setdefault(
+                (label, from_p, to_p, from_label, to_label), []
+            ).append({"from": from_v, "to": to_v})
+        removed_edges = {}
+        kept = 0
+        for f, label, t in previous["edges"] - record.edges:
+            if f != document_id:
+                # Shared with the other documents that declare it
+                kept += 1
+                continue
+            removed_edges.setdefault(label, []).append({"fromId": f, "toId": t})
+
+        logging.info(
+            f"Incremental update: {sum(len(v) for v in changed_nodes.values())} of "
+            f"{len(record.nodes)} nodes, {len(record.edges - previous['edges'])} added "
+            f"and {sum(len(v) for v in removed_edges.values())} removed edges, "
+            f"{kept} edges between shared nodes no longer declared left in place"
+        )
+
+        if not (changed_nodes or added_edges or added_property_edges or removed_edges):
+            return
+        try:
+            # Documents first so the edges from them can be written in the same run
+            for label in sorted(
+                changed_nodes, key=lambda l: l != NodeLabels.DOCUMENT.value
+            ):
+                writer.write_node_rows(changed_nodes[label], label)
+            for label, rels in added_edges.items():
+                writer.write_rel(rels, label)
+            for (label, *key), rels in added_property_edges.items():
+                writer.write_rel_match_on_property(rels, label, *key)
+            for label, rels in removed_edges.items():
+                writer.delete_rel(rels, label)
+        finally:
+            writer.publish_generation()
@@ -0,0 +1,272 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+# Read size when hashing files
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class IngestJournal:
+    """A local, crash-safe record of the progress of an ingestion run, so a run that
+    is restarted after dying halfway does not send everything again.
+
+    Files are identified by the graph they are written to and the hash of their
+    content, so a file written to one graph is still written to another. A file is
+    marked done once its document has been written completely, and later runs to
+    the same graph skip it. While a
+    document is being written every acknowledged batch is recorded (by the hash of
+    its query and rows) and committed, so when a partially written document is
+    retried its acknowledged batches are skipped and it resumes where it stopped.
+
+    Resuming relies on the document mapping to the same batches again, which is
+    the case unless it has no serialNumber/documentNamespace (its Document id is
+    then random) or adaptive batching splits it differently. Batches that do not
+    match are simply sent again, which is safe as every write is a MERGE.
+    """
+
+    def __init__(self, path: str, graph_identifier: str = None) -> None:
+        """Opens (creating if needed) the journal
+
+        Args:
+            path (str): The path of the SQLite database file
+            graph_identifier (str, optional): The graph the files are written to, or the comma separated graphs of a sharded run. Defaults to None, which only reports on every graph with status().
+        """
+        self.graph_identifier = graph_identifier
+        self.__graph = graph_identifier or ""
+        self.__lock = threading.Lock()
+        self.__batches = {}
+        self.__conn = sqlite3.connect(path, check_same_thread=False)
+        # WAL keeps each per-batch commit cheap while staying durable across crashes
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute(
+            """CREATE TABLE IF NOT EXISTS files (
+                graph TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                path TEXT NOT NULL,
+                status TEXT NOT NULL,
+                error TEXT,
+                updated REAL NOT NULL,
+                PRIMARY KEY (graph, hash)
+            )"""
+        )
+        self.__conn.execute(
+            """CREATE TABLE IF NOT EXISTS batches (
+                graph TEXT NOT NULL,
+                file_hash TEXT NOT NULL,
+                batch_hash TEXT NOT NULL,
+                phase TEXT,
+                PRIMARY KEY (graph, file_hash, batch_hash)
+            )"""
+        )
+        self.__conn.commit()
+
+    def close(self):
+        """Closes the journal"""
+        with self.__lock:
+            self.__conn.close()
+
+    @staticmethod
+    def hash_file(path: str) -> str:
+        """Creates the content hash of a file
+
+        Args:
+            path (str): The path of the file
+
+        Returns:
+            str: The hash of its content
+        """
+        sha = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    @staticmethod
+    def hash_batch(query: str, rows: list) -> str:
+        """Creates the hash identifying a batch
+
+        Args:
+            query (str): The query of the batch
+            rows (list): The rows of the batch
+
+        Returns:
+            str: The hash of the batch
+        """
+        data = json.dumps([query, rows], sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha1(data).hexdigest()
+
+    def is_done(self, file_hash: str) -> bool:
+        """Determines if a file has already been written completely to the graph
+
+        Args:
+            file_hash (str): The content hash of the file
+
+        Returns:
+            bool: True if the file is done
+        """
+        with self.__lock:
+            row = self.__conn.execute(
+                "SELECT status FROM files WHERE graph = ? AND hash = ?",
+                (self.__graph, file_hash),
+            ).fetchone()
+        return row is not None and row[0] == "done"
+
+    def start(self, path: str, file_hash: str):
+        """Records that a file is being written, loading the batches already
+        acknowledged if a previous attempt stopped partway
+
+        Args:
+            path (str): The path of the file
+            file_hash (str): The content hash of the file
+        """
+        with self.__lock:
+            self.__conn.execute(
+                """INSERT INTO files (graph, hash, path, status, error, updated)
+                    VALUES (?, ?, ?, 'writing', NULL, ?)
+                    ON CONFLICT (graph, hash) DO UPDATE SET path = excluded.path,
+                    status = 'writing', error = NULL, updated = excluded.updated""",
+                (self.__graph, file_hash, path, time.time()),
+            )
+            self.__conn.commit()
+            self.__batches[file_hash] = {
+                r[0]
+                for r in self.__conn.execute(
+                    "SELECT batch_hash FROM batches WHERE graph = ? AND file_hash = ?",
+                    (self.__graph, file_hash),
+                )
+            }
+        if len(self.__batches[file_hash]) > 0:
+            logging.info(
+                f"Resuming {path}, {len(self.__batches[file_hash])} batches already written"
+            )
+
+    def finish(self, file_hash: str, ok: bool, error: str = None):
+        """Records the outcome of writing a file. The batches of a completed file
+        are no longer needed and are removed.
+
+        Args:
+            file_hash (str): The content hash of the file
+            ok (bool): Whether the file was written completely
+            error (str, optional): Why the file failed. Defaults to None.
+        """
+        with self.__lock:
+            self.__conn.execute(
+                """UPDATE files SET status = ?, error = ?, updated = ?
+                    WHERE graph = ? AND hash = ?""",
+                ("done" if ok else "failed", error, time.time(), self.__graph, file_hash),
+            )
+            if ok:
+                self.__conn.execute(
+                    "DELETE FROM batches WHERE graph = ? AND file_hash = ?",
+                    (self.__graph, file_hash),
+                )
+            self.__conn.commit()
+            self.__batches.pop(file_hash, None)
+
+    def is_batch_done(self, file_hash: str, batch_hash: str) -> bool:
+        """Determines if a batch of a file was acknowledged by a previous attempt
+
+        Args:
+            file_hash (str): The content hash of the file
+            batch_hash (str): The hash of the batch
+
+        Returns:
+            bool: True if the batch can be skipped
+        """
+        with self.__lock:
+            return batch_hash in self.__batches.get(file_hash, ())
+
+    def record_batch(self, file_hash: str, batch_hash: str, phase: str = None):
+        """Records an acknowledged batch, committing it before returning
+
+        Args:
+            file_hash (str): The content hash of the file
+            batch_hash (str): The hash of the batch
+            phase (str, optional): The write phase of the batch. Defaults to None.
+        """
+        with self.__lock:
+            self.__conn.execute(
+                """INSERT OR IGNORE INTO batches (graph, file_hash, batch_hash, phase)
+                    VALUES (?, ?, ?, ?)""",
+                (self.__graph, file_hash, batch_hash, phase),
+            )
+            self.__conn.commit()
+            self.__batches.setdefault(file_hash, set()).add(batch_hash)
+
+    def forget_batches(self, file_hash: str):
+        """Forgets the acknowledged batches of a file, so the next attempt writes
+        all of it again
+
+        Args:
+            file_hash (str): The content hash of the file
+        """
+        with self.__lock:
+            self.__conn.execute(
+                "DELETE FROM batches WHERE graph = ? AND file_hash = ?",
+                (self.__graph, file_hash),
+            )
+            self.__conn.commit()
+            self.__batches.pop(file_hash, None)
+
+    def status(self, file_hashes: dict = None) -> dict:
+        """Reports the progress recorded in the journal for the graph, or for every
+        graph if the journal was opened without one
+
+        Args:
+            file_hashes (dict, optional): A map of path to content hash of the files of the next run, to report which of them are pending. Defaults to None.
+
+        Returns:
+            dict: The number of files per status, the files that are partially written or failed with their graph and acknowledged batches per phase, and the pending files
+        """
+        if self.graph_identifier is None:
+            where, params = "", ()
+        else:
+            where, params = "WHERE graph = ?", (self.__graph,)
+        with self.__lock:
+            counts = dict(
+                self.__conn.execute(
+                    f"SELECT status, COUNT(*) FROM files {where} GROUP BY status",
+                    params,
+                ).fetchall()
+            )
+            unfinished = self.__conn.execute(
+                f"""SELECT graph, hash, path, status, error FROM files
+                    {where or "WHERE TRUE"} AND status != 'done' ORDER BY graph, path""",
+                params,
+            ).fetchall()
+            phases = {}
+            for graph, file_hash, phase, count in self.__conn.execute(
+                f"""SELECT graph, file_hash, phase, COUNT(*) FROM batches {where}
+                    GROUP BY graph, file_hash, phase""",
+                params,
+            ):
+                phases.setdefault((graph, file_hash), {})[phase] = count
+            done = {
+                r[0]
+                for r in self.__conn.execute(
+                    f"SELECT hash FROM files {where or 'WHERE TRUE'} AND status = 'done'",
+                    params,
+                )
+            }
+
+        report = {
+            "counts": counts,
+            "unfinished": [
+                {
+                    "graph": graph,
+                    "path": path,
+                    "status": status,
+                    "error": error,
+                    "batches": phases.get((graph, file_hash), {}),
+                }
+                for graph, file_hash, path, status, error in unfinished
+            ],
+        }
+        if file_hashes is not None:
+            report["pending"] = sorted(
+                p for p, h in file_hashes.items() if h not in done
+            )
+        return report
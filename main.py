@@ -1,21 +1,690 @@
+import argparse
+import glob
 import json
 import os
-from write_data import NeptuneAnalyticsSBOMWriter
+import queue
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from sbom_writer import BomType, NeptuneAnalyticsSBOMWriter, determine_bom_type
+from advisories import AdvisoryIndex
+from batching import AdaptiveBatchSizer
+from coalescing import CoalescedWriteError, CoalescingSBOMWriter
+from incremental import IncrementalSBOMWriter
+from journal import IngestJournal
+from metrics import IngestMetrics
+from neptune_client import NeptuneGraphClientPool
+from retention import GRACE_SECONDS, GraphGarbageCollector, RetentionPolicy
+from sbom_schema import load_sbom_typed
+from sharding import PartitionKey, ShardedSBOMWriter
+from spdx_tagvalue import SBOM_EXTENSIONS, load_sbom
+from watch import SpoolWatcher
+from write_cache import WriteCache
 import logging
 
 logging.basicConfig(level=logging.INFO)
 
 
+def find_sbom_files(paths: list) -> list:
+    """Expands the provided directories and glob patterns into a list of SBOM files
+
+    Args:
+        paths (list): Directories, files or glob patterns
+
+    Returns:
+        list: The sorted, de-duplicated list of SBOM file paths
+    """
+    files = set()
+    for p in paths:
+        if os.path.isdir(p):
+            for f in os.listdir(p):
+                files.add(os.path.join(p, f))
+        elif os.path.isfile(p):
+            files.add(p)
+        else:
+            files.update(glob.glob(p, recursive=True))
+    return sorted(f for f in files if os.path.isfile(f) and f.endswith(SBOM_EXTENSIONS))
+
+
+def parse_sbom_file(path: str, load: object = load_sbom) -> tuple:
+    """Loads and identifies an SBOM file. This runs in a worker process.
+
+    Args:
+        path (str): The path of the SBOM file
+        load (function, optional): Loads the file, e.g. sbom_schema.load_sbom_typed to validate it. Defaults to load_sbom.
+
+    Returns:
+        tuple: The path, the parsed BOM (None on failure), an error message (None on success) and the parse time in seconds
+    """
+    start = time.monotonic()
+    try:
+        bom = load(path)
+    except (OSError, ValueError) as e:
+        return path, None, f"Unable to parse: {e}", time.monotonic() - start
+
+    if determine_bom_type(bom) == BomType.UNKNOWN:
+        return path, None, "Unknown SBOM format", time.monotonic() - start
+    return path, bom, None, time.monotonic() - start
+
+
+def ingest(
+    writer: object,
+    files: list,
+    parse_workers: int = None,
+    write_workers: int = 1,
+    queue_size: int = 16,
+    stream: bool = False,
+    metrics: IngestMetrics = None,
+    journal: IngestJournal = None,
+    load: object = load_sbom,
+    coalesce: bool = False,
+) -> dict:
+    """Parses the files in a process pool and writes them with a pool of writer threads.
+
+    At most queue_size parsed documents are held in memory at once, so parsing
+    stalls when the writers fall behind. In streaming mode the files are not parsed
+    up front; each writer thread reads its file incrementally instead.
+
+    A coalescing writer (a CoalescingSBOMWriter, or a ShardedSBOMWriter of them) is
+    passed each file's path as its document_key and flushed at the end. When a
+    flush fails, every file whose rows were buffered is failed, even if it was
+    reported as written before, and the buffers are dropped so the following
+    documents are not held up by them.
+
+    Args:
+        writer (object): The NeptuneAnalyticsSBOMWriter (or IncrementalSBOMWriter) shared by all writer threads
+        files (list): The SBOM files to ingest
+        parse_workers (int, optional): The number of parsing processes. Defaults to the number of CPUs.
+        write_workers (int, optional): The number of documents written concurrently. Defaults to 1.
+        queue_size (int, optional): The maximum number of parsed documents waiting to be written. Defaults to 16.
+        stream (bool, optional): Whether to stream each file rather than loading it. Defaults to False.
+        metrics (IngestMetrics, optional): Records the parse time of each file. Defaults to None.
+        journal (IngestJournal, optional): Records the progress of each file, files it has as done are skipped. Defaults to None.
+        load (function, optional): Loads each file in the parsing processes. Defaults to load_sbom.
+        coalesce (bool, optional): Whether the writer coalesces the rows of several documents. Defaults to False.
+
+    Returns:
+        dict: Lists of the "written", "failed" and "skipped" file paths
+    """
+    results = {"written": [], "failed": [], "skipped": []}
+    hashes = {}
+    results_lock = threading.Lock()
+    work = queue.Queue(maxsize=queue_size)
+    # The files whose buffered rows were dropped, never reported as written
+    dropped = set()
+
+    def record(key, path):
+        with results_lock:
+            if key == "written" and path in dropped:
+                return
+            results[key].append(path)
+
+    def fail_buffered(error):
+        logging.error(
+            f"Failed writing the coalesced rows of {len(error.documents)} files: {error.error}"
+        )
+        paths = dict.fromkeys([*error.documents, *writer.discard()])
+        with results_lock:
+            paths = [p for p in paths if p not in dropped]
+            dropped.update(paths)
+            results["written"] = [p for p in results["written"] if p not in dropped]
+            results["failed"].extend(paths)
+
+    def write_loop():
+        while True:
+            item = work.get()
+            if item is None:
+                return
+            path, bom = item
+            kwargs = {}
+            if journal is not None:
+                journal.start(path, hashes[path])
+                kwargs["document_key"] = hashes[path]
+            elif coalesce:
+                kwargs["document_key"] = path
+            if isinstance(writer, ShardedSBOMWriter) and not stream:
+                # Routes documents without a partition key like write_sbom_stream does
+                kwargs["path"] = path
+            error = None
+            try:
+                if stream:
+                    res = writer.write_sbom_stream(path, **kwargs)
+                else:
+                    res = writer.write_sbom(bom, **kwargs)
+                if res:
+                    logging.info(f"Wrote {path}")
+                    record("written", path)
+                else:
+                    error = "Unknown SBOM format"
+                    record("failed", path)
+            except CoalescedWriteError as e:
+                error = str(e)
+                fail_buffered(e)
+            except Exception as e:
+                logging.error(f"Failed writing {path}: {e}")
+                error = str(e)
+                record("failed", path)
+            if journal is not None:
+                journal.finish(hashes[path], error is None, error)
+
+    threads = [threading.Thread(target=write_loop) for _ in range(write_workers)]
+    for t in threads:
+        t.start()
+
+    def enqueue(future):
+        path, bom, error, seconds = future.result()
+        if metrics is not None:
+            metrics.record_parse(path, seconds)
+        if error:
+            logging.error(f"Skipping {path}: {error}")
+            record("failed", path)
+            if journal is not None:
+                journal.start(path, hashes[path])
+                journal.finish(hashes[path], False, error)
+        else:
+            work.put((path, bom))
+
+    def is_done(path):
+        if journal is None:
+            return False
+        hashes[path] = journal.hash_file(path)
+        if journal.is_done(hashes[path]):
+            logging.info(f"Skipping {path}, it was written by a previous run")
+            record("skipped", path)
+            return True
+        return False
+
+    try:
+        if stream:
+            for f in files:
+                if not is_done(f):
+                    work.put((f, None))
+        else:
+            with ProcessPoolExecutor(max_workers=parse_workers) as executor:
+                pending = deque()
+                for f in files:
+                    if is_done(f):
+                        continue
+                    pending.append(executor.submit(parse_sbom_file, f, load))
+                    if len(pending) >= queue_size:
+                        enqueue(pending.popleft())
+                while pending:
+                    enqueue(pending.popleft())
+    finally:
+        for _ in threads:
+            work.put(None)
+        for t in threads:
+            t.join()
+
+    if coalesce:
+        try:
+            writer.flush()
+        except CoalescedWriteError as e:
+            fail_buffered(e)
+    return results
+
+
+def parse_args(args: list = None) -> argparse.Namespace:
+    """Parses the command line arguments
+
+    Args:
+        args (list, optional): The arguments to parse. Defaults to sys.argv.
+
+    Returns:
+        argparse.Namespace: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="Ingest CycloneDX and SPDX files into a Neptune Analytics graph"
+    )
+    parser.add_argument(
+        "paths", nargs="*", help="SBOM files, directories or glob patterns"
+    )
+    parser.add_argument(
+        "--graph-id",
+        help="The graph identifier, or comma-separated graph identifiers to shard the "
+        "documents across",
+    )
+    parser.add_argument(
+        "--partition-key",
+        choices=[PartitionKey.ARTIFACT, PartitionKey.NAMESPACE, PartitionKey.ACCOUNT],
+        default=PartitionKey.ARTIFACT,
+        help="With several --graph-id, what documents are routed to a graph by "
+        "(default: artifact)",
+    )
+    parser.add_argument("--region", help="The graph's AWS region")
+    parser.add_argument(
+        "--parse-workers",
+        type=int,
+        default=None,
+        help="Number of parsing processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--write-workers",
+        type=int,
+        default=4,
+        help="Number of documents written concurrently (default: 4)",
+    )
+    parser.add_argument(
+        "--batch-workers",
+        type=int,
+        default=1,
+        help="Number of batches in flight per document write phase (default: 1)",
+    )
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        default=None,
+        help="Size of the connection pool (default: write workers x batch workers)",
+    )
+    parser.add_argument(
+        "--client-per-thread",
+        action="store_true",
+        help="Give each writer thread its own neptune-graph client",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=16,
+        help="Maximum number of parsed documents waiting to be written (default: 16)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Read each file incrementally to bound memory use on very large SBOMs",
+    )
+    parser.add_argument(
+        "--write-cache",
+        default=None,
+        help="Path of a local cache used to skip nodes unchanged since the last run",
+    )
+    parser.add_argument(
+        "--snapshot-dir",
+        default=None,
+        help="Write only the changes since the previous ingest of each document, "
+        "keeping document snapshots in this directory",
+    )
+    parser.add_argument(
+        "--adaptive-batching",
+        action="store_true",
+        help="Size batches by payload bytes and adapt them to latency and throttling",
+    )
+    parser.add_argument(
+        "--coalesce",
+        action="store_true",
+        help="Combine the rows of consecutive documents into shared batches, "
+        "for many small SBOMs",
+    )
+    parser.add_argument(
+        "--advisories",
+        default=None,
+        help="Path of a local OSV advisory dump (directory, zip, .jsonl or .json) to add "
+        "the Vulnerabilities of every Component from. Each document is loaded whole, "
+        "even with --stream",
+    )
+    parser.add_argument(
+        "--typed-decode",
+        action="store_true",
+        help="Validate JSON files against a typed schema of the fields that are written "
+        "before writing them. Invalid files fail with the path of the field. This only "
+        "validates, it does not speed up ingestion",
+    )
+    parser.add_argument(
+        "--journal",
+        default=None,
+        help="Path of a local journal of the progress of each file, so an interrupted "
+        "run can be restarted without writing finished files or batches again",
+    )
+    parser.add_argument(
+        "--status",
+        action="store_true",
+        help="Report the progress recorded in --journal, and which of the provided "
+        "files are pending, without writing anything. With --graph-id, only for "
+        "those graphs",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running, ingesting the files dropped into the provided directories "
+        "in micro-batches and moving them to done/ or failed/",
+    )
+    parser.add_argument(
+        "--batch-files",
+        type=int,
+        default=50,
+        help="With --watch, the number of waiting files that triggers a micro-batch (default: 50)",
+    )
+    parser.add_argument(
+        "--batch-age",
+        type=float,
+        default=5.0,
+        help="With --watch, the seconds the oldest file waits before a micro-batch is written (default: 5)",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=1.0,
+        help="With --watch, the seconds between scans of the directories (default: 1)",
+    )
+    parser.add_argument(
+        "--settle-seconds",
+        type=float,
+        default=1.0,
+        help="With --watch, the seconds a file must be unchanged to be picked up (default: 1)",
+    )
+    parser.add_argument(
+        "--done-dir",
+        default=None,
+        help="With --watch, where ingested files are moved (default: done/ in each directory)",
+    )
+    parser.add_argument(
+        "--failed-dir",
+        default=None,
+        help="With --watch, where failed files are moved (default: failed/ in each directory)",
+    )
+    parser.add_argument(
+        "--status-file",
+        default=None,
+        help="With --watch, a file the queue depth and lag are written to as JSON after every scan",
+    )
+    parser.add_argument(
+        "--gc",
+        action="store_true",
+        help="Instead of ingesting, delete the expired Documents and the Components, "
+        "References and Vulnerabilities no Document leads to anymore",
+    )
+    parser.add_argument(
+        "--keep-latest",
+        type=int,
+        default=None,
+        help="With --gc, the number of Documents kept per artifact (default: all)",
+    )
+    parser.add_argument(
+        "--max-age-days",
+        type=float,
+        default=None,
+        help="With --gc, the age in days after which a Document expires, the newest "
+        "Document of each artifact is always kept (default: no limit)",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="With --gc, print what would be deleted without deleting anything",
+    )
+    parser.add_argument(
+        "--gc-rate",
+        type=float,
+        default=None,
+        help="With --gc, the maximum number of nodes deleted per second (default: no limit)",
+    )
+    parser.add_argument(
+        "--gc-grace",
+        type=float,
+        default=GRACE_SECONDS,
+        help="With --gc, how many seconds ago an orphaned node must have been written "
+        "to be deleted, so documents being ingested are not affected. It has to be "
+        "longer than writing one document or coalesced flush takes (default: 300)",
+    )
+    parser.add_argument(
+        "--gc-checkpoint",
+        default=None,
+        help="With --gc, a file the progress is saved to, so an interrupted run resumes",
+    )
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help="Log the time, rows, bytes and latency of each write phase at the end of the run",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Profile each write phase with cProfile (implies --metrics)",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Measure the peak memory of each write phase with tracemalloc (implies --metrics)",
+    )
+    parsed = parser.parse_args(args)
+    if parsed.status:
+        if not parsed.journal:
+            parser.error("--status requires --journal")
+        return parsed
+    if parsed.gc:
+        if not parsed.graph_id or not parsed.region:
+            parser.error("--gc requires --graph-id and --region")
+        if parsed.watch or parsed.paths:
+            parser.error("--gc can not be combined with --watch or paths")
+        if parsed.keep_latest is not None and parsed.keep_latest < 1:
+            parser.error("--keep-latest must be at least 1")
+        return parsed
+    if not parsed.paths or not parsed.graph_id or not parsed.region:
+        parser.error("the paths, --graph-id and --region are required")
+    if parsed.journal and (parsed.coalesce or parsed.snapshot_dir):
+        parser.error("--journal can not be combined with --coalesce or --snapshot-dir")
+    if parsed.stream and parsed.snapshot_dir:
+        parser.error("--stream can not be combined with --snapshot-dir")
+    if parsed.watch:
+        if "," in parsed.graph_id:
+            parser.error("--watch can not be combined with several --graph-id")
+        if parsed.stream or parsed.snapshot_dir or parsed.journal:
+            parser.error(
+                "--watch can not be combined with --stream, --snapshot-dir or --journal"
+            )
+        if not all(os.path.isdir(p) for p in parsed.paths):
+            parser.error("--watch requires the paths to be directories")
+    if parsed.coalesce and (parsed.stream or parsed.snapshot_dir):
+        parser.error("--coalesce can not be combined with --stream or --snapshot-dir")
+    if parsed.typed_decode and (parsed.stream or parsed.watch):
+        parser.error("--typed-decode can not be combined with --stream or --watch")
+    return parsed
+
+
+def journal_graph(graph_id: str) -> str:
+    """Creates the graph the journal records the files of, from --graph-id. A sharded
+    run is recorded under its graphs together, as each file always goes to the same
+    one of them.
+
+    Args:
+        graph_id (str): The comma separated graph identifiers, or None
+
+    Returns:
+        str: The graph identifiers without duplicates, or None
+    """
+    if not graph_id:
+        return None
+    return ",".join(dict.fromkeys(g.strip() for g in graph_id.split(",")))
+
+
+def status(args: argparse.Namespace) -> int:
+    """Prints the progress recorded in the journal
+
+    Args:
+        args (argparse.Namespace): The parsed arguments
+
+    Returns:
+        int: The exit code, 1 if any of the provided files is pending
+    """
+    journal = IngestJournal(args.journal, journal_graph(args.graph_id))
+    file_hashes = None
+    if args.paths:
+        file_hashes = {f: journal.hash_file(f) for f in find_sbom_files(args.paths)}
+    report = journal.status(file_hashes)
+    journal.close()
+    print(json.dumps(report, indent=2))
+    return 1 if report.get("pending") else 0
+
+
+def watch(
+    args: argparse.Namespace,
+    writer: NeptuneAnalyticsSBOMWriter,
+    advisories: AdvisoryIndex = None,
+) -> int:
+    """Runs the spool directory watcher until SIGINT or SIGTERM
+
+    Args:
+        args (argparse.Namespace): The parsed arguments
+        writer (NeptuneAnalyticsSBOMWriter): The writer
+        advisories (AdvisoryIndex, optional): Advisories to enrich the documents from. Defaults to None.
+
+    Returns:
+        int: The exit code
+    """
+    watcher = SpoolWatcher(
+        writer,
+        args.paths,
+        max_batch_files=args.batch_files,
+        max_batch_age=args.batch_age,
+        poll_interval=args.poll_interval,
+        settle_seconds=args.settle_seconds,
+        done_dir=args.done_dir,
+        failed_dir=args.failed_dir,
+        status_path=args.status_file,
+        advisories=advisories,
+    )
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    watcher.run(stop)
+    writer.close()
+    logging.info(f"Stopped watching: {json.dumps(watcher.status())}")
+    if writer.write_cache is not None:
+        writer.write_cache.close()
+    if writer.metrics is not None:
+        logging.info(f"Ingestion metrics:\n{writer.metrics.report()}")
+    return 0
+
+
+def collect_garbage(args: argparse.Namespace, writers: list) -> int:
+    """Deletes the expired Documents and the orphaned nodes of each graph, one graph
+    after the other, or prints what would be deleted with --dry-run
+
+    Args:
+        args (argparse.Namespace): The parsed arguments
+        writers (list): The writer of each graph
+
+    Returns:
+        int: The exit code
+    """
+    policy = None
+    if args.keep_latest is not None or args.max_age_days is not None:
+        policy = RetentionPolicy(args.keep_latest, args.max_age_days)
+    reports = {}
+    for writer in writers:
+        checkpoint_path = args.gc_checkpoint
+        if checkpoint_path and len(writers) > 1:
+            checkpoint_path = f"{checkpoint_path}.{writer.graph_identifier}"
+        collector = GraphGarbageCollector(
+            writer,
+            policy,
+            max_rate=args.gc_rate,
+            grace_seconds=args.gc_grace,
+            checkpoint_path=checkpoint_path,
+            snapshot_dir=args.snapshot_dir,
+        )
+        reports[writer.graph_identifier] = (
+            collector.plan() if args.dry_run else collector.run()
+        )
+    print(json.dumps(reports if len(writers) > 1 else reports.popitem()[1], indent=2))
+    for writer in writers:
+        writer.close()
+    if writers[0].write_cache is not None:
+        writers[0].write_cache.close()
+    return 0
+
+
 def main():
-    writer = NeptuneAnalyticsSBOMWriter("g-eag8ov6zf3", "us-west-2")
-    directory = "./test/"
-    for f in os.listdir(directory):
-        print(f)
-        if f.endswith(".json") or f.endswith(".txt"):
-            with open(os.path.join(directory, f)) as file:
-                data = json.load(file)
-                writer.write_sbom(data)
+    args = parse_args()
+    if args.status:
+        return status(args)
+    write_cache = WriteCache(args.write_cache) if args.write_cache else None
+    journal = (
+        IngestJournal(args.journal, journal_graph(args.graph_id))
+        if args.journal
+        else None
+    )
+    metrics = None
+    if args.metrics or args.profile or args.trace_memory:
+        metrics = IngestMetrics(profile=args.profile, trace_memory=args.trace_memory)
+    client = NeptuneGraphClientPool(
+        args.region,
+        max_connections=args.max_connections
+        or max(1, args.write_workers) * max(1, args.batch_workers),
+        per_thread=args.client_per_thread,
+    )
+    advisories = (
+        AdvisoryIndex.load(args.advisories) if args.advisories and not args.gc else None
+    )
+    writers = [
+        NeptuneAnalyticsSBOMWriter(
+            graph_id.strip(),
+            args.region,
+            max_workers=args.batch_workers,
+            write_cache=write_cache,
+            batch_sizer=AdaptiveBatchSizer() if args.adaptive_batching else None,
+            metrics=metrics,
+            client=client,
+            journal=journal,
+            advisories=advisories,
+        )
+        for graph_id in dict.fromkeys(args.graph_id.split(","))
+    ]
+    if args.gc:
+        return collect_garbage(args, writers)
+    if args.watch:
+        return watch(args, writers[0], advisories)
+
+    def wrap(writer):
+        if args.snapshot_dir:
+            return IncrementalSBOMWriter(writer, args.snapshot_dir, advisories)
+        elif args.coalesce:
+            return CoalescingSBOMWriter(writer, advisories=advisories)
+        return writer
+
+    if len(writers) > 1:
+        logging.info(
+            f"Sharding the documents across {len(writers)} graphs by {args.partition_key}"
+        )
+        writer = ShardedSBOMWriter(writers, args.partition_key, wrap=wrap)
+    else:
+        writer = wrap(writers[0])
+    load = load_sbom_typed if args.typed_decode else load_sbom
+    files = find_sbom_files(args.paths)
+    logging.info(f"Found {len(files)} SBOM files")
+    results = ingest(
+        writer,
+        files,
+        parse_workers=args.parse_workers,
+        write_workers=args.write_workers,
+        queue_size=args.queue_size,
+        stream=args.stream,
+        metrics=metrics,
+        journal=journal,
+        load=load,
+        coalesce=args.coalesce,
+    )
+    if args.coalesce:
+        writer.close()
+    for w in writers:
+        w.close()
+    logging.info(
+        f"Wrote {len(results['written'])} files, {len(results['failed'])} failed, "
+        f"{len(results['skipped'])} skipped"
+    )
+    if isinstance(writer, ShardedSBOMWriter):
+        logging.info(f"Documents per graph: {json.dumps(writer.documents)}")
+    if journal is not None:
+        journal.close()
+    if write_cache is not None:
+        logging.info(
+            f"Write cache: {write_cache.written} nodes written, {write_cache.skipped} unchanged nodes skipped"
+        )
+        write_cache.close()
+    if metrics is not None:
+        logging.info(f"Ingestion metrics:\n{metrics.report()}")
+    return 1 if results["failed"] else 0
 
 
 if __name__ == "__main__":
-    main()
+    raise SystemExit(main())
@@ -0,0 +1,302 @@
+import cProfile
+import io
+import logging
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Upper bounds (in milliseconds) of the query latency histogram buckets
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+class PhaseStats:
+    """The totals recorded for one ingestion phase, e.g. "Component nodes" """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.queries = 0
+        self.retries = 0
+        self.failures = 0
+        self.peak_memory = 0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.profile = None
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        """The stats as a plain dict
+
+        Returns:
+            dict: The stats
+        """
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "seconds": self.seconds,
+            "rows": self.rows,
+            "rows_per_second": self.rows_per_second,
+            "bytes": self.bytes,
+            "queries": self.queries,
+            "retries": self.retries,
+            "failures": self.failures,
+            "peak_memory": self.peak_memory,
+            "latency_histogram_ms": dict(
+                zip([str(b) for b in LATENCY_BUCKETS_MS] + ["inf"], self.latency_buckets)
+            ),
+        }
+
+
+class IngestMetrics:
+    """Records where the time goes during an ingestion run.
+
+    Writers report every query (rows, payload bytes, latency, retries) and every
+    write phase; main.py also reports the parse time of each document. Callbacks
+    added with add_hook receive every event as it happens, and summary() and
+    report() aggregate them at the end of a run. Optionally each phase can be
+    profiled with cProfile and/or have its peak memory measured with tracemalloc.
+
+    cProfile only sees the thread that started a phase and tracemalloc peaks are
+    process wide, so both are most useful with a single writer thread.
+    """
+
+    def __init__(self, profile: bool = False, trace_memory: bool = False) -> None:
+        """Creates the metrics
+
+        Args:
+            profile (bool, optional): Whether to capture a cProfile per phase. Defaults to False.
+            trace_memory (bool, optional): Whether to measure the peak memory of each phase with tracemalloc. Defaults to False.
+        """
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.phases = {}
+        self.documents = 0
+        self.parse_seconds = 0.0
+        self.started = time.monotonic()
+        self.__hooks = []
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def add_hook(self, callback):
+        """Adds a callback that is called with a dict for every event.
+
+        Every event has a "type" of "query", "retry", "phase" or "parse".
+
+        Args:
+            callback (callable): The callback
+        """
+        self.__hooks.append(callback)
+
+    def __emit(self, event: dict):
+        """Sends an event to the hooks, never letting a hook break ingestion
+
+        Args:
+            event (dict): The event
+        """
+        for hook in self.__hooks:
+            try:
+                hook(event)
+            except Exception as e:
+                logging.warning(f"Metrics hook failed: {e}")
+
+    def __phase(self, name: str) -> PhaseStats:
+        if name not in self.phases:
+            self.phases[name] = PhaseStats(name)
+        return self.phases[name]
+
+    @contextmanager
+    def phase(self, name: str, rows: int = 0):
+        """Times a phase, e.g. writing the Component nodes of a document
+
+        Args:
+            name (str): The name of the phase
+            rows (int, optional): The number of rows written by the phase. Defaults to 0.
+        """
+        # Only the outermost phase of a thread is profiled, cProfile does not nest
+        profiler = None
+        if self.profile and not getattr(self.__local, "profiling", False):
+            profiler = cProfile.Profile()
+            self.__local.profiling = True
+            profiler.enable()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            seconds = time.monotonic() - start
+            if profiler is not None:
+                profiler.disable()
+                self.__local.profiling = False
+            peak = tracemalloc.get_traced_memory()[1] if self.trace_memory else 0
+            with self.__lock:
+                stats = self.__phase(name)
+                stats.calls += 1
+                stats.seconds += seconds
+                stats.rows += rows
+                stats.peak_memory = max(stats.peak_memory, peak)
+                if profiler is not None:
+                    if stats.profile is None:
+                        stats.profile = pstats.Stats(profiler)
+                    else:
+                        stats.profile.add(profiler)
+            self.__emit(
+                {
+                    "type": "phase",
+                    "phase": name,
+                    "seconds": seconds,
+                    "rows": rows,
+                    "peak_memory": peak,
+                }
+            )
+
+    def record_query(
+        self,
+        phase: str,
+        rows: int,
+        bytes: int,
+        latency: float,
+        attempts: int = 1,
+        ok: bool = True,
+    ):
+        """Records one request sent to the graph, see Writer.execute_query
+
+        Args:
+            phase (str): The phase the request belongs to
+            rows (int): The number of rows in the request
+            bytes (int): The serialized size of the parameters
+            latency (float): The latency of the request in seconds
+            attempts (int, optional): The number of attempts made, for callers that record a retried request once. Defaults to 1.
+            ok (bool, optional): Whether the request succeeded in the end. Defaults to True.
+        """
+        bucket = len(LATENCY_BUCKETS_MS)
+        for i, b in enumerate(LATENCY_BUCKETS_MS):
+            if latency * 1000 <= b:
+                bucket = i
+                break
+        with self.__lock:
+            stats = self.__phase(phase)
+            stats.queries += 1
+            stats.bytes += bytes
+            stats.retries += attempts - 1
+            stats.failures += 0 if ok else 1
+            stats.latency_buckets[bucket] += 1
+        self.__emit(
+            {
+                "type": "query",
+                "phase": phase,
+                "rows": rows,
+                "bytes": bytes,
+                "latency": latency,
+                "attempts": attempts,
+                "ok": ok,
+            }
+        )
+
+    def record_retry(self, phase: str):
+        """Records that a failed request is sent again. Each attempt is recorded with
+        record_query, so the failed ones are counted as failures.
+
+        Args:
+            phase (str): The phase the request belongs to
+        """
+        with self.__lock:
+            self.__phase(phase).retries += 1
+        self.__emit({"type": "retry", "phase": phase})
+
+    def record_parse(self, document: str, seconds: float):
+        """Records the time spent parsing a document
+
+        Args:
+            document (str): The name or path of the document
+            seconds (float): The parse time in seconds
+        """
+        with self.__lock:
+            self.documents += 1
+            self.parse_seconds += seconds
+        self.__emit({"type": "parse", "document": document, "seconds": seconds})
+
+    def summary(self) -> dict:
+        """Aggregates everything recorded so far
+
+        Returns:
+            dict: The totals of the run and the stats of each phase
+        """
+        with self.__lock:
+            phases = [p.as_dict() for p in self.phases.values()]
+        return {
+            "elapsed_seconds": time.monotonic() - self.started,
+            "documents": self.documents,
+            "parse_seconds": self.parse_seconds,
+            "rows": sum(p["rows"] for p in phases),
+            "bytes": sum(p["bytes"] for p in phases),
+            "queries": sum(p["queries"] for p in phases),
+            "retries": sum(p["retries"] for p in phases),
+            "failures": sum(p["failures"] for p in phases),
+            "phases": phases,
+        }
+
+    def report(self, top_functions: int = 10) -> str:
+        """Formats the summary as a table, followed by the profiles if captured
+
+        Args:
+            top_functions (int, optional): The number of functions to show per profile. Defaults to 10.
+
+        Returns:
+            str: The report
+        """
+        summary = self.summary()
+        lines = [
+            f"{summary['documents']} documents parsed in {summary['parse_seconds']:.2f}s, "
+            f"{summary['rows']} rows in {summary['queries']} queries "
+            f"({summary['bytes']} bytes, {summary['retries']} retries, "
+            f"{summary['failures']} failures) in {summary['elapsed_seconds']:.2f}s",
+            f"{'phase':<30}{'seconds':>10}{'rows':>10}{'rows/s':>10}{'queries':>9}"
+            f"{'p50 ms':>9}{'max ms':>9}",
+        ]
+        for p in sorted(summary["phases"], key=lambda p: -p["seconds"]):
+            lines.append(
+                f"{p['name']:<30}{p['seconds']:>10.2f}{p['rows']:>10}"
+                f"{p['rows_per_second']:>10.0f}{p['queries']:>9}"
+                f"{self.__percentile(p, 0.5):>9}{self.__percentile(p, 1.0):>9}"
+            )
+
+        with self.__lock:
+            profiles = [(p.name, p.profile) for p in self.phases.values() if p.profile]
+        for name, profile in profiles:
+            out = io.StringIO()
+            profile.stream = out
+            profile.sort_stats("cumulative").print_stats(top_functions)
+            lines.append(f"\nProfile of {name}:\n{out.getvalue()}")
+        return "\n".join(lines)
+
+    def __percentile(self, phase: dict, fraction: float) -> str:
+        """Estimates a latency percentile of a phase from its histogram
+
+        Args:
+            phase (dict): The phase stats
+            fraction (float): The percentile as a fraction, e.g. 0.5
+
+        Returns:
+            str: The upper bound of the bucket holding the percentile
+        """
+        buckets = list(phase["latency_histogram_ms"].items())
+        total = sum(c for _, c in buckets)
+        if total == 0:
+            return "-"
+        seen = 0
+        for bound, count in buckets:
+            seen += count
+            if seen >= total * fraction:
+                return f"<{bound}"
+        return "-"
@@ -0,0 +1,114 @@
+import threading
+import boto3
+from botocore.config import Config
+
+# botocore's default, which caps the number of concurrent requests per client
+DEFAULT_MAX_CONNECTIONS = 10
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 60
+
+
+def client_config(
+    max_connections: int = DEFAULT_MAX_CONNECTIONS,
+    connect_timeout: float = CONNECT_TIMEOUT,
+    read_timeout: float = READ_TIMEOUT,
+    retry_mode: str = "standard",
+    max_attempts: int = 1,
+) -> Config:
+    """Creates the botocore configuration of a neptune-graph client
+
+    Args:
+        max_connections (int, optional): The size of the connection pool, at least the number of concurrent requests. Defaults to 10.
+        connect_timeout (float, optional): The connection timeout in seconds. Defaults to 10.
+        read_timeout (float, optional): The read timeout in seconds. Defaults to 60.
+        retry_mode (str, optional): The botocore retry mode. Defaults to "standard".
+        max_attempts (int, optional): The attempts botocore makes per request. Defaults to 1, as the writers retry with their own RetryPolicy.
+
+    Returns:
+        Config: The configuration
+    """
+    return Config(
+        max_pool_connections=max_connections,
+        connect_timeout=connect_timeout,
+        read_timeout=read_timeout,
+        tcp_keepalive=True,
+        retries={"mode": retry_mode, "total_max_attempts": max_attempts},
+    )
+
+
+class NeptuneGraphClientPool:
+    """Creates and shares tuned neptune-graph clients.
+
+    The pool is used in place of a boto3 client: its execute_query is sent through a
+    client whose connection pool is sized for the expected concurrency, so
+    connections are kept alive and reused instead of being discarded when more
+    requests are in flight than the default 10 connections.
+
+    boto3 clients are thread-safe, so by default one client is shared by every
+    thread. With per_thread each thread gets its own client, created from its own
+    boto3 Session since the default session is not thread-safe.
+    """
+
+    def __init__(
+        self,
+        region: str,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        per_thread: bool = False,
+        config: Config = None,
+    ) -> None:
+        """Creates the pool. Clients are created when first used.
+
+        Args:
+            region (str): The aws region for the neptune-graph service
+            max_connections (int, optional): The number of concurrent requests to size the connection pool of each client for. Defaults to 10.
+            per_thread (bool, optional): Whether each thread gets its own client. Defaults to False.
+            config (Config, optional): The botocore configuration, overriding max_connections. Defaults to client_config(max_connections).
+        """
+        self.region = region
+        self.per_thread = per_thread
+        self.config = config or client_config(max_connections)
+        self.clients_created = 0
+        self.__client = None
+        self.__lock = threading.RLock()
+        self.__local = threading.local()
+
+    def get(self):
+        """Gets the client of the calling thread
+
+        Returns:
+            boto3.client: The neptune-graph client
+        """
+        if self.per_thread:
+            client = getattr(self.__local, "client", None)
+            if client is None:
+                client = self.__create()
+                self.__local.client = client
+            return client
+
+        if self.__client is None:
+            with self.__lock:
+                if self.__client is None:
+                    self.__client = self.__create()
+        return self.__client
+
+    def __create(self):
+        """Creates a client from a new session
+
+        Returns:
+            boto3.client: The neptune-graph client
+        """
+        with self.__lock:
+            self.clients_created += 1
+        session = boto3.session.Session()
+        return session.client(
+            "neptune-graph", region_name=self.region, config=self.config
+        )
+
+    def execute_query(self, **kwargs) -> dict:
+        """Executes a query with the calling thread's client, see the boto3
+        neptune-graph execute_query
+
+        Returns:
+            dict: The response
+        """
+        return self.get().execute_query(**kwargs)
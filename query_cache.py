@@ -0,0 +1,157 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+MAX_ENTRIES = 10000
+TTL_SECONDS = 300.0
+# The seconds a query client trusts the write generation it last read from a graph
+GENERATION_INTERVAL = 5.0
+
+# The node of every graph whose generation property the writers change once per
+# document, so the caches of other processes see their writes, see generation_query
+GENERATION_LABEL = "WriteGeneration"
+GENERATION_ID = "WriteGeneration"
+
+# The number of batches written to each graph by this process, see record_write
+_write_generations = {}
+_write_lock = threading.Lock()
+
+
+def record_write(graph_identifier: str):
+    """Records that a batch was written to a graph, which invalidates the cached
+    query results of that graph in this process. Called by the Writer for every
+    batch it writes.
+
+    Args:
+        graph_identifier (str): The graph identifier
+    """
+    with _write_lock:
+        _write_generations[graph_identifier] = (
+            _write_generations.get(graph_identifier, 0) + 1
+        )
+
+
+@functools.lru_cache(maxsize=None)
+def generation_query() -> str:
+    """Creates the query for the write generation published in a graph
+
+    Returns:
+        str: The query, with the `~id` of the node in $id, returning no rows if nothing was written
+    """
+    return f"""
+                    MATCH (g:{GENERATION_LABEL} {{`~id`: $id}})
+                    RETURN g.`generation` as generation """
+
+
+def write_generation(graph_identifier: str) -> int:
+    """Gets the number of batches written to a graph by this process
+
+    Args:
+        graph_identifier (str): The graph identifier
+
+    Returns:
+        int: The number of batches
+    """
+    with _write_lock:
+        return _write_generations.get(graph_identifier, 0)
+
+
+class QueryCache:
+    """An in-memory LRU cache of query results with a time to live.
+
+    Results are cached per graph, query and key, along with the generation of the
+    graph they were read at. A result is only served while the generation is the
+    same. By default that is the write_generation of this process. The
+    SBOMQueryClient also includes the generation the writers of every process
+    publish in the graph, see generation_query.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, ttl: float = TTL_SECONDS) -> None:
+        """Creates the cache
+
+        Args:
+            max_entries (int, optional): The number of results kept before the least recently used are evicted. Defaults to 10,000.
+            ttl (float, optional): The number of seconds a result is kept. Defaults to 300.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def get(
+        self, graph_identifier: str, query: str, key: object, generation: object = None
+    ) -> tuple:
+        """Looks up a cached result
+
+        Args:
+            graph_identifier (str): The graph identifier
+            query (str): The name of the query
+            key (object): The key the query was run for
+            generation (object, optional): The current generation of the graph. Defaults to its write_generation.
+
+        Returns:
+            tuple: Whether the result was cached, and the result
+        """
+        if generation is None:
+            generation = write_generation(graph_identifier)
+        entry_key = (graph_identifier, query, key)
+        with self.__lock:
+            entry = self.__entries.get(entry_key)
+            if entry is not None:
+                value, expires, cached_generation = entry
+                if expires > time.monotonic() and cached_generation == generation:
+                    self.__entries.move_to_end(entry_key)
+                    self.hits += 1
+                    return True, value
+                del self.__entries[entry_key]
+            self.misses += 1
+            return False, None
+
+    def put(
+        self,
+        graph_identifier: str,
+        query: str,
+        key: object,
+        value: object,
+        generation: object = None,
+    ):
+        """Caches a result
+
+        Args:
+            graph_identifier (str): The graph identifier
+            query (str): The name of the query
+            key (object): The key the query was run for
+            value (object): The result
+            generation (object, optional): The generation of the graph before the query was run, so a result overlapping a write is never served. Defaults to its current write_generation.
+        """
+        if generation is None:
+            generation = write_generation(graph_identifier)
+        entry_key = (graph_identifier, query, key)
+        with self.__lock:
+            self.__entries[entry_key] = (
+                value,
+                time.monotonic() + self.ttl,
+                generation,
+            )
+            self.__entries.move_to_end(entry_key)
+            while len(self.__entries) > self.max_entries:
+                self.__entries.popitem(last=False)
+
+    def clear(self, graph_identifier: str = None):
+        """Removes the cached results
+
+        Args:
+            graph_identifier (str, optional): Only remove the results of this graph. Defaults to None (all graphs).
+        """
+        with self.__lock:
+            if graph_identifier is None:
+                self.__entries.clear()
+                return
+            for entry_key in [k for k in self.__entries if k[0] == graph_identifier]:
+                del self.__entries[entry_key]
@@ -0,0 +1,569 @@
+import functools
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from batching import is_retryable, is_throttled
+from incremental import SnapshotStore
+from query_cache import record_write
+from sbom_writer import (
+    BATCH_SIZE,
+    EdgeLabels,
+    NeptuneAnalyticsSBOMWriter,
+    NodeLabels,
+    WRITTEN_PROPERTY,
+    _quote,
+)
+
+# The number of ids read per request when listing Documents or finding orphans
+SCAN_SIZE = 10000
+# The number of orphans found before they are deleted, bounding the memory used
+MAX_CANDIDATES = 100000
+
+# How long ago an orphan must have been written to be deleted. It has to be longer
+# than writing the nodes of one document, or one flush of the CoalescingSBOMWriter,
+# takes, as their DESCRIBES edges are only written after them, plus the clock skew
+# between the writers and the collector.
+GRACE_SECONDS = 300.0
+
+# The properties holding the creation time of CycloneDX and SPDX Documents
+CREATED_PROPERTIES = ("created_timestamp", "createdTimestamp")
+
+# The edge from a Document to each of its Components. Both writers link every
+# component or package of a document with it, whatever relationships it declares.
+_OWNS = EdgeLabels.DESCRIBES.value
+
+# When a node of each label is orphaned, in the order the labels are collected.
+# Deleting Components orphans their References and Vulnerabilities, so they go first.
+ORPHAN_CONDITIONS = {
+    NodeLabels.COMPONENT.value: f"NOT (:{NodeLabels.DOCUMENT.value})-[:{_OWNS}]->(n)",
+    NodeLabels.REFERENCE.value: f"NOT (:{NodeLabels.COMPONENT.value})-[:{EdgeLabels.REFERS_TO.value}]->(n)",
+    NodeLabels.VULNERABILITY.value: f"NOT (n)-[:{EdgeLabels.AFFECTS.value}]->(:{NodeLabels.COMPONENT.value})",
+}
+
+DOCUMENTS_PHASE = NodeLabels.DOCUMENT.value
+DONE_PHASE = "done"
+
+
+@functools.lru_cache(maxsize=None)
+def documents_query(artifact_property: str) -> str:
+    """Creates the query for a page of Documents, ordered by `~id`
+
+    Args:
+        artifact_property (str): The Document property identifying the artifact
+
+    Returns:
+        str: The query, with the last `~id` of the previous page in $after and the page size in $limit
+    """
+    created = ", ".join(f"d.{_quote(p)}" for p in CREATED_PROPERTIES)
+    return f"""
+                    MATCH (d:{NodeLabels.DOCUMENT.value})
+                    WHERE id(d) > $after
+                    RETURN id(d) as id, d.{_quote(artifact_property)} as artifact, coalesce({created}) as created
+                    ORDER BY id LIMIT $limit """
+
+
+def _orphaned(label: str) -> str:
+    """Creates the condition matching the orphaned nodes n of a label that were
+    written before $before. Nodes written by a document being ingested are orphaned
+    until its edges are written, and their write time keeps them.
+
+    Args:
+        label (str): The label, one of ORPHAN_CONDITIONS
+
+    Returns:
+        str: The condition
+    """
+    return (
+        f"{ORPHAN_CONDITIONS[label]} "
+        f"AND coalesce(n.{_quote(WRITTEN_PROPERTY)}, 0) < $before"
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def orphans_query(label: str) -> str:
+    """Creates the query for a page of the orphaned nodes of a label, ordered by `~id`
+
+    Args:
+        label (str): The label, one of ORPHAN_CONDITIONS
+
+    Returns:
+        str: The query, with the last `~id` of the previous page in $after, the page size in $limit and the time orphans must have been written before in $before
+    """
+    return f"""
+                    MATCH (n:{label})
+                    WHERE id(n) > $after AND {_orphaned(label)}
+                    RETURN id(n) as id
+                    ORDER BY id LIMIT $limit """
+
+
+@functools.lru_cache(maxsize=None)
+def orphans_delete_query(label: str) -> str:
+    """Creates the query to DETACH DELETE nodes matched on `~id` that are still
+    orphaned and were not written again, in case they were linked or written by a
+    document being ingested since they were found
+
+    Args:
+        label (str): The label, one of ORPHAN_CONDITIONS
+
+    Returns:
+        str: The query, with the `~id`s in the $ids parameter and the time orphans must have been written before in $before
+    """
+    return f"""
+                    UNWIND $ids as i
+                    MATCH (n:{label} {{`~id`: i}})
+                    WHERE {_orphaned(label)}
+                    DETACH DELETE n
+                    RETURN i as id """
+
+
+@functools.lru_cache(maxsize=None)
+def documents_delete_query() -> str:
+    """Creates the query to DETACH DELETE Documents matched on `~id`
+
+    Returns:
+        str: The query, with the `~id`s in the $ids parameter
+    """
+    return f"""
+                    UNWIND $ids as i
+                    MATCH (n:{NodeLabels.DOCUMENT.value} {{`~id`: i}})
+                    DETACH DELETE n
+                    RETURN i as id """
+
+
+@functools.lru_cache(maxsize=None)
+def orphaned_by_query() -> str:
+    """Creates the query for the Components that only the provided Documents contain,
+    which deleting them would orphan
+
+    Returns:
+        str: The query, with a batch of Document `~id`s in $ids and all the Documents to be deleted in $expired
+    """
+    return f"""
+                    UNWIND $ids as i
+                    MATCH (d:{NodeLabels.DOCUMENT.value} {{`~id`: i}})-[:{_OWNS}]->(c:{NodeLabels.COMPONENT.value})
+                    WITH DISTINCT c
+                    OPTIONAL MATCH (o:{NodeLabels.DOCUMENT.value})-[:{_OWNS}]->(c)
+                    WHERE NOT id(o) IN $expired
+                    WITH c, count(o) as others
+                    WHERE others = 0
+                    RETURN id(c) as id """
+
+
+def parse_timestamp(value: str) -> datetime:
+    """Parses the ISO 8601 creation time of a Document
+
+    Args:
+        value (str): The timestamp, e.g. `2024-05-01T12:00:00Z`
+
+    Returns:
+        datetime: The time in UTC, or None if there is none or it is not valid
+    """
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+class RetentionPolicy:
+    """Decides which Documents of each artifact have expired.
+
+    Documents are grouped into artifacts by a property, by default the `name` (the
+    metadata component of CycloneDX documents, the document name of SPDX). A Document
+    expires when it is older than max_age_days, or when keep_latest newer Documents
+    of its artifact exist. The newest Document of an artifact never expires, so an
+    artifact that is no longer scanned keeps its last SBOM. Documents without a
+    creation time sort oldest and never expire by age, and Documents without the
+    artifact property are each their own artifact.
+    """
+
+    def __init__(
+        self,
+        keep_latest: int = None,
+        max_age_days: float = None,
+        artifact_property: str = "name",
+    ) -> None:
+        """Creates the policy
+
+        Args:
+            keep_latest (int, optional): The number of Documents kept per artifact. Defaults to None (no limit).
+            max_age_days (float, optional): The age in days after which a Document expires. Defaults to None (no limit).
+            artifact_property (str, optional): The Document property identifying the artifact. Defaults to "name".
+
+        Raises:
+            ValueError: Raised if keep_latest is less than 1 or max_age_days is negative
+        """
+        if keep_latest is not None and keep_latest < 1:
+            raise ValueError("keep_latest must be at least 1")
+        if max_age_days is not None and max_age_days < 0:
+            raise ValueError("max_age_days can not be negative")
+        self.keep_latest = keep_latest
+        self.max_age_days = max_age_days
+        self.artifact_property = artifact_property
+
+    def expired(self, documents: list, now: datetime = None) -> dict:
+        """Finds the expired Documents
+
+        Args:
+            documents (list): The Documents, each with an id, artifact and created time
+            now (datetime, optional): The time the ages are measured at. Defaults to now.
+
+        Returns:
+            dict: The sorted `~id`s of the expired Documents of each artifact
+        """
+        now = now or datetime.now(timezone.utc)
+        artifacts = {}
+        for d in documents:
+            artifacts.setdefault(d["artifact"] or d["id"], []).append(
+                (parse_timestamp(d["created"]), d["id"])
+            )
+
+        expired = {}
+        oldest = datetime.min.replace(tzinfo=timezone.utc)
+        for artifact, versions in artifacts.items():
+            versions.sort(key=lambda v: (v[0] or oldest, v[1]), reverse=True)
+            for rank, (created, document_id) in enumerate(versions):
+                if rank == 0:
+                    continue
+                if (self.keep_latest is not None and rank >= self.keep_latest) or (
+                    self.max_age_days is not None
+                    and created is not None
+                    and (now - created).total_seconds() > self.max_age_days * 86400
+                ):
+                    expired.setdefault(artifact, []).append(document_id)
+        for ids in expired.values():
+            ids.sort()
+        return expired
+
+
+class GraphGarbageCollector:
+    """Expires old Documents and deletes the nodes no Document leads to anymore:
+    Components no Document DESCRIBES, References no Component refers to, and
+    Vulnerabilities affecting no Component.
+
+    All the work is done in bounded batches through Writer.execute_query. Orphans are
+    found in pages ordered by `~id`, and each batch is deleted only if its nodes are
+    still orphaned. So that a document being ingested at the same time does not lose
+    the nodes it has written but not linked yet, only orphans last written more than
+    grace_seconds ago are deleted, which has to be longer than writing one document
+    takes. A node the write cache kept a document from writing again is not
+    protected, but the edges to it then fail with a MissingEndpointsError instead of
+    being dropped, and the document is written in full when it is retried. Deletes
+    are throttled to max_rate nodes per second, and
+    throttled requests are retried with the writer's RetryPolicy. The phase and the
+    last deleted `~id` are saved to checkpoint_path after every batch, so an
+    interrupted run resumes where it stopped.
+    """
+
+    def __init__(
+        self,
+        writer: NeptuneAnalyticsSBOMWriter,
+        policy: RetentionPolicy = None,
+        batch_size: int = BATCH_SIZE,
+        scan_size: int = SCAN_SIZE,
+        max_candidates: int = MAX_CANDIDATES,
+        max_rate: float = None,
+        grace_seconds: float = GRACE_SECONDS,
+        checkpoint_path: str = None,
+        snapshot_dir: str = None,
+    ) -> None:
+        """Creates the garbage collector
+
+        Args:
+            writer (NeptuneAnalyticsSBOMWriter): The writer whose client, graph, retry policy and write cache are used
+            policy (RetentionPolicy, optional): Which Documents expire. Defaults to None (only orphans are deleted).
+            batch_size (int, optional): The number of nodes deleted per request. Defaults to BATCH_SIZE.
+            scan_size (int, optional): The number of ids read per request. Defaults to SCAN_SIZE.
+            max_candidates (int, optional): The number of orphans found before they are deleted. Defaults to MAX_CANDIDATES.
+            max_rate (float, optional): The maximum number of nodes deleted per second. Defaults to None (no limit).
+            grace_seconds (float, optional): How many seconds ago an orphan must have been written to be deleted. Defaults to GRACE_SECONDS.
+            checkpoint_path (str, optional): A file the progress is saved to, to resume from. Defaults to None.
+            snapshot_dir (str, optional): The snapshot directory of the IncrementalSBOMWriter, whose snapshots of deleted Documents are removed. Defaults to None.
+        """
+        self.writer = writer.create_writer()
+        self.graph_identifier = writer.graph_identifier
+        self.write_cache = writer.write_cache
+        self.policy = policy
+        self.batch_size = batch_size
+        self.scan_size = scan_size
+        self.max_candidates = max_candidates
+        self.max_rate = max_rate
+        self.grace_seconds = grace_seconds
+        self.checkpoint_path = checkpoint_path
+        self.snapshots = SnapshotStore(snapshot_dir) if snapshot_dir else None
+        self.requests = 0
+        self.throttled = 0
+
+    def list_documents(self) -> list:
+        """Lists every Document with its artifact and creation time
+
+        Returns:
+            list: The Documents, each with an id, artifact and created time
+        """
+        property = self.policy.artifact_property if self.policy else "name"
+        return self.__scan(documents_query(property), DOCUMENTS_PHASE)
+
+    def plan(self, now: datetime = None) -> dict:
+        """Reports what a run would delete, without changing anything
+
+        Args:
+            now (datetime, optional): The time the ages are measured at. Defaults to now.
+
+        Returns:
+            dict: The number of Documents and artifacts, the expired Document `~id`s of each artifact, the number of nodes orphaned now per label, and the number of Components deleting the expired Documents would orphan
+        """
+        documents = self.list_documents()
+        expired = self.__expired(documents, now)
+        expired_ids = sorted(i for ids in expired.values() for i in ids)
+
+        before = time.time() - self.grace_seconds
+        orphaned_by_expiry = set()
+        for batch in self.writer.chunk(expired_ids, self.batch_size):
+            rows = self.__execute(
+                {"ids": list(batch), "expired": expired_ids},
+                orphaned_by_query(),
+                f"{NodeLabels.COMPONENT.value} expiry scans",
+            )
+            orphaned_by_expiry.update(r["id"] for r in rows)
+
+        return {
+            "documents": len(documents),
+            "artifacts": len({d["artifact"] or d["id"] for d in documents}),
+            "expired_documents": len(expired_ids),
+            "expired": expired,
+            "orphaned": {
+                label: len(
+                    self.__scan(orphans_query(label), label, params={"before": before})
+                )
+                for label in ORPHAN_CONDITIONS
+            },
+            "orphaned_by_expiry": {
+                NodeLabels.COMPONENT.value: len(orphaned_by_expiry)
+            },
+        }
+
+    def run(self, now: datetime = None) -> dict:
+        """Deletes the expired Documents, then the orphaned nodes of each label
+
+        Args:
+            now (datetime, optional): The time the ages are measured at. Defaults to now.
+
+        Returns:
+            dict: The number of nodes deleted per label, the requests sent, how many were throttled, and the seconds taken
+        """
+        start = time.monotonic()
+        checkpoint = self.__load_checkpoint()
+        phases = [DOCUMENTS_PHASE, *ORPHAN_CONDITIONS, DONE_PHASE]
+        first = phases.index(checkpoint["phase"])
+        deleted = {}
+
+        if first <= phases.index(DOCUMENTS_PHASE):
+            expired = self.__expired(self.list_documents(), now)
+            ids = sorted(i for ids in expired.values() for i in ids)
+            logging.info(
+                f"Deleting {len(ids)} expired Documents of {len(expired)} artifacts"
+            )
+            deleted[DOCUMENTS_PHASE] = self.__delete(
+                DOCUMENTS_PHASE, documents_delete_query(), ids
+            )
+            if self.snapshots is not None:
+                for document_id in ids:
+                    self.snapshots.delete(self.graph_identifier, document_id)
+
+        for label in ORPHAN_CONDITIONS:
+            if first > phases.index(label):
+                continue
+            after = checkpoint["after"] if checkpoint["phase"] == label else ""
+            deleted[label] = self.__collect(label, after)
+
+        self.__save_checkpoint(DONE_PHASE)
+        report = {
+            "deleted": deleted,
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "seconds": round(time.monotonic() - start, 3),
+        }
+        logging.info(f"Garbage collection finished: {json.dumps(report)}")
+        return report
+
+    def __expired(self, documents: list, now: datetime) -> dict:
+        """Applies the policy, if any, to the Documents
+
+        Args:
+            documents (list): The Documents
+            now (datetime): The time the ages are measured at
+
+        Returns:
+            dict: The sorted `~id`s of the expired Documents of each artifact
+        """
+        if self.policy is None:
+            return {}
+        return self.policy.expired(documents, now)
+
+    def __collect(self, label: str, after: str) -> int:
+        """Finds and deletes the orphaned nodes of a label in rounds of at most
+        max_candidates nodes
+
+        Args:
+            label (str): The label
+            after (str): The `~id` to resume after
+
+        Returns:
+            int: The number of nodes deleted
+        """
+        deleted = 0
+        while True:
+            params = {"before": time.time() - self.grace_seconds}
+            ids = [
+                r["id"]
+                for r in self.__scan(
+                    orphans_query(label), label, after, self.max_candidates, params
+                )
+            ]
+            if len(ids) == 0:
+                break
+            deleted += self.__delete(label, orphans_delete_query(label), ids, params)
+            after = ids[-1]
+            if len(ids) < self.max_candidates:
+                break
+        return deleted
+
+    def __scan(
+        self,
+        query: str,
+        label: str,
+        after: str = "",
+        limit: int = None,
+        params: dict = None,
+    ) -> list:
+        """Reads the pages of a query ordered by `~id`
+
+        Args:
+            query (str): The query, taking $after and $limit
+            label (str): The label of the nodes read, recorded in the metrics as the "<label> scans" phase
+            after (str, optional): The `~id` to start after. Defaults to "".
+            limit (int, optional): The number of rows to stop at. Defaults to None (all).
+            params (dict, optional): The other parameters of the query. Defaults to None.
+
+        Returns:
+            list: The rows
+        """
+        results = []
+        while limit is None or len(results) < limit:
+            size = self.scan_size
+            if limit is not None:
+                size = min(size, limit - len(results))
+            rows = self.__execute(
+                {**(params or {}), "after": after, "limit": size},
+                query,
+                f"{label} scans",
+            )
+            if len(rows) == 0:
+                break
+            results.extend(rows)
+            after = rows[-1]["id"]
+            if len(rows) < size:
+                break
+        return results
+
+    def __delete(self, phase: str, query: str, ids: list, params: dict = None) -> int:
+        """Deletes nodes in batches, throttled to max_rate, saving the checkpoint and
+        forgetting the deleted nodes in the write cache after every batch
+
+        Args:
+            phase (str): The phase, saved to the checkpoint
+            query (str): The delete query, taking $ids and returning the deleted ids
+            ids (list): The sorted `~id`s of the nodes
+            params (dict, optional): The other parameters of the query. Defaults to None.
+
+        Returns:
+            int: The number of nodes deleted
+        """
+        deleted = 0
+        for batch in self.writer.chunk(ids, self.batch_size):
+            batch = list(batch)
+            start = time.monotonic()
+            removed = [
+                r["id"]
+                for r in self.__execute(
+                    {**(params or {}), "ids": batch}, query, f"{phase} deletes"
+                )
+            ]
+            record_write(self.graph_identifier)
+            if self.write_cache is not None and len(removed) > 0:
+                self.write_cache.forget(self.graph_identifier, removed)
+            deleted += len(removed)
+            self.__save_checkpoint(phase, batch[-1])
+            if self.max_rate:
+                wait = len(batch) / self.max_rate - (time.monotonic() - start)
+                if wait > 0:
+                    time.sleep(wait)
+        if deleted > 0:
+            self.writer.publish_generation()
+        logging.info(f"Deleted {deleted} of {len(ids)} {phase} nodes")
+        return deleted
+
+    def __execute(self, params: dict, query: str, phase: str) -> list:
+        """Runs a query, retrying throttled and transient failures
+
+        Args:
+            params (dict): The parameters
+            query (str): The query
+            phase (str): The phase the query is recorded under in the writer's metrics
+
+        Returns:
+            list: The result rows
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                self.requests += 1
+                resp = self.writer.execute_query(params, query, phase)
+                return json.loads(resp["payload"].read())["results"]
+            except Exception as e:
+                if is_throttled(e):
+                    self.throttled += 1
+                if not is_retryable(e) or attempt >= self.writer.retry_policy.max_attempts:
+                    raise
+                delay = self.writer.retry_policy.delay(attempt)
+                logging.warning(
+                    f"Attempt {attempt} of a garbage collection query failed ({e}), retrying in {delay:.2f}s"
+                )
+                self.writer.record_retry(phase)
+                time.sleep(delay)
+
+    def __load_checkpoint(self) -> dict:
+        """Loads the progress of an interrupted run
+
+        Returns:
+            dict: The phase and the last `~id` deleted in it, the first phase if there is no checkpoint or the last run finished
+        """
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+            if checkpoint.get("phase") != DONE_PHASE:
+                logging.info(
+                    f"Resuming garbage collection at {checkpoint['phase']} after {checkpoint['after']!r}"
+                )
+                return checkpoint
+        return {"phase": DOCUMENTS_PHASE, "after": ""}
+
+    def __save_checkpoint(self, phase: str, after: str = ""):
+        """Saves the progress to checkpoint_path, if set, replacing it atomically
+
+        Args:
+            phase (str): The phase
+            after (str, optional): The last `~id` deleted in the phase. Defaults to "".
+        """
+        if not self.checkpoint_path:
+            return
+        with open(f"{self.checkpoint_path}.tmp", "w") as f:
+            json.dump({"phase": phase, "after": after}, f)
+        os.replace(f"{self.checkpoint_path}.tmp", self.checkpoint_path)
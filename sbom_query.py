@@ -0,0 +1,319 @@
+import functools
+import json
+import logging
+import threading
+import time
+from batching import is_retryable
+from query_cache import (
+    GENERATION_ID,
+    GENERATION_INTERVAL,
+    QueryCache,
+    generation_query,
+    write_generation,
+)
+from sbom_writer import (
+    BATCH_SIZE,
+    EdgeLabels,
+    NeptuneAnalyticsSBOMWriter,
+    NodeLabels,
+)
+
+# The longest DEPENDS_ON path followed by the transitive queries
+MAX_DEPTH = 10
+
+# The edges from a Document to the Components it contains. SPDX relationships other
+# than DESCRIBES are written as DEPENDS_ON edges from the Document.
+_CONTAINS = f"{EdgeLabels.DESCRIBES.value}|{EdgeLabels.DEPENDS_ON.value}"
+
+
+def _check_depth(max_depth: int, minimum: int) -> int:
+    """Validates the depth of a transitive query, which is part of the query string
+
+    Args:
+        max_depth (int): The depth
+        minimum (int): The smallest valid depth
+
+    Raises:
+        ValueError: Raised if the depth is not an integer between minimum and MAX_DEPTH
+
+    Returns:
+        int: The depth
+    """
+    if not isinstance(max_depth, int) or not minimum <= max_depth <= MAX_DEPTH:
+        raise ValueError(f"max_depth must be between {minimum} and {MAX_DEPTH}")
+    return max_depth
+
+
+@functools.lru_cache(maxsize=None)
+def documents_with_purl_query() -> str:
+    """Creates the query for the Documents containing a Component with each purl
+
+    Returns:
+        str: The query, with the purls in the $keys parameter
+    """
+    return f"""
+                    UNWIND $keys as k
+                    MATCH (d:{NodeLabels.DOCUMENT.value})-[:{_CONTAINS}]->(c:{NodeLabels.COMPONENT.value} {{purl: k}})
+                    RETURN k as key, collect(DISTINCT id(d)) as values """
+
+
+@functools.lru_cache(maxsize=None)
+def documents_affected_query(max_depth: int) -> str:
+    """Creates the query for the Documents containing a Component affected by each
+    vulnerability, or depending on one through up to max_depth DEPENDS_ON edges
+
+    Args:
+        max_depth (int): The number of DEPENDS_ON edges to follow, 0 for direct only
+
+    Returns:
+        str: The query, with the vulnerability ids in the $keys parameter
+    """
+    return f"""
+                    UNWIND $keys as k
+                    MATCH (v:{NodeLabels.VULNERABILITY.value} {{id: k}})-[:{EdgeLabels.AFFECTS.value}]->(c:{NodeLabels.COMPONENT.value})
+                    MATCH (c)<-[:{EdgeLabels.DEPENDS_ON.value}*0..{max_depth}]-(u:{NodeLabels.COMPONENT.value})<-[:{_CONTAINS}]-(d:{NodeLabels.DOCUMENT.value})
+                    RETURN k as key, collect(DISTINCT id(d)) as values """
+
+
+@functools.lru_cache(maxsize=None)
+def vulnerabilities_query() -> str:
+    """Creates the query for the ids of the Vulnerabilities affecting each purl
+
+    Returns:
+        str: The query, with the purls in the $keys parameter
+    """
+    return f"""
+                    UNWIND $keys as k
+                    MATCH (v:{NodeLabels.VULNERABILITY.value})-[:{EdgeLabels.AFFECTS.value}]->(c:{NodeLabels.COMPONENT.value} {{purl: k}})
+                    RETURN k as key, collect(DISTINCT v.id) as values """
+
+
+@functools.lru_cache(maxsize=None)
+def reachability_query(max_depth: int, reverse: bool) -> str:
+    """Creates the query for the purls of the Components reachable from each purl
+    through 1 to max_depth DEPENDS_ON edges
+
+    Args:
+        max_depth (int): The number of DEPENDS_ON edges to follow
+        reverse (bool): Whether to follow the edges backwards, to find the dependents
+
+    Returns:
+        str: The query, with the purls in the $keys parameter
+    """
+    edge = f"-[:{EdgeLabels.DEPENDS_ON.value}*1..{max_depth}]-"
+    path = f"<{edge}" if reverse else f"{edge}>"
+    return f"""
+                    UNWIND $keys as k
+                    MATCH (c:{NodeLabels.COMPONENT.value} {{purl: k}}){path}(r:{NodeLabels.COMPONENT.value})
+                    WHERE r.purl IS NOT NULL
+                    RETURN k as key, collect(DISTINCT r.purl) as values """
+
+
+class SBOMQueryClient:
+    """Answers impact analysis questions about the graph written by the SBOM writers,
+    such as which Documents are affected by a vulnerability or contain a purl.
+
+    Every lookup takes many keys (purls or vulnerability ids) and sends them in
+    batches, one UNWIND request per batch. Results are cached per key in a
+    QueryCache, if one is provided, so only the keys not cached are queried. Cached
+    results are dropped when this process writes to the graph. They are also dropped
+    when the generation the writers of any process publish in the graph changes,
+    which is read at most once per generation_interval seconds.
+    """
+
+    def __init__(
+        self,
+        writer: NeptuneAnalyticsSBOMWriter,
+        cache: QueryCache = None,
+        batch_size: int = BATCH_SIZE,
+        generation_interval: float = GENERATION_INTERVAL,
+    ) -> None:
+        """Creates the query client
+
+        Args:
+            writer (NeptuneAnalyticsSBOMWriter): The writer whose client, graph, retry policy and max_workers are used
+            cache (QueryCache, optional): Caches the results of each key. Defaults to None.
+            batch_size (int, optional): The number of keys per request. Defaults to BATCH_SIZE.
+            generation_interval (float, optional): The seconds the write generation read from the graph is trusted for. Defaults to GENERATION_INTERVAL.
+        """
+        self.writer = writer.create_writer()
+        self.graph_identifier = writer.graph_identifier
+        self.cache = cache
+        self.batch_size = batch_size
+        self.generation_interval = generation_interval
+        self.requests = 0
+        self.__lock = threading.Lock()
+        # The generation last read from the graph, and the time.monotonic() it was
+        self.__generation = None
+        self.__generation_read = None
+
+    def documents_with_purls(self, purls: list) -> dict:
+        """Finds the Documents containing a Component with each purl
+
+        Args:
+            purls (list): The purls
+
+        Returns:
+            dict: The list of Document `~id`s of each purl
+        """
+        return self.__lookup("documents_with_purl", documents_with_purl_query(), purls)
+
+    def documents_affected_by(self, vulnerability_ids: list, max_depth: int = 0) -> dict:
+        """Finds the Documents affected by each vulnerability, because they contain an
+        affected Component or one depending on it
+
+        Args:
+            vulnerability_ids (list): The ids of the vulnerabilities, e.g. CVE ids
+            max_depth (int, optional): The number of DEPENDS_ON edges to follow from an affected Component. Defaults to 0 (directly affected only).
+
+        Returns:
+            dict: The list of Document `~id`s of each vulnerability id
+        """
+        max_depth = _check_depth(max_depth, 0)
+        return self.__lookup(
+            f"documents_affected_{max_depth}",
+            documents_affected_query(max_depth),
+            vulnerability_ids,
+        )
+
+    def vulnerabilities_of(self, purls: list) -> dict:
+        """Finds the Vulnerabilities affecting the Component with each purl
+
+        Args:
+            purls (list): The purls
+
+        Returns:
+            dict: The list of vulnerability ids of each purl
+        """
+        return self.__lookup("vulnerabilities", vulnerabilities_query(), purls)
+
+    def dependencies(self, purls: list, max_depth: int = 3) -> dict:
+        """Finds the Components each purl depends on, directly or transitively
+
+        Args:
+            purls (list): The purls
+            max_depth (int, optional): The number of DEPENDS_ON edges to follow. Defaults to 3.
+
+        Returns:
+            dict: The list of dependency purls of each purl
+        """
+        max_depth = _check_depth(max_depth, 1)
+        return self.__lookup(
+            f"dependencies_{max_depth}", reachability_query(max_depth, False), purls
+        )
+
+    def dependents(self, purls: list, max_depth: int = 3) -> dict:
+        """Finds the Components depending on each purl, directly or transitively
+
+        Args:
+            purls (list): The purls
+            max_depth (int, optional): The number of DEPENDS_ON edges to follow. Defaults to 3.
+
+        Returns:
+            dict: The list of dependent purls of each purl
+        """
+        max_depth = _check_depth(max_depth, 1)
+        return self.__lookup(
+            f"dependents_{max_depth}", reachability_query(max_depth, True), purls
+        )
+
+    def __lookup(self, name: str, query: str, keys: list) -> dict:
+        """Runs a lookup query for the keys that are not cached
+
+        Args:
+            name (str): The name of the query, used as part of the cache key
+            query (str): The UNWIND query, returning a key and its values
+            keys (list): The keys
+
+        Returns:
+            dict: The sorted values of each key, an empty list for keys without any
+        """
+        results = {}
+        missing = []
+        generation = None
+        if self.cache is not None:
+            # Taken before querying, so results that may predate a concurrent write
+            # are invalidated by it
+            generation = (write_generation(self.graph_identifier), self.__published())
+        for k in dict.fromkeys(keys):
+            if self.cache is not None:
+                cached, value = self.cache.get(self.graph_identifier, name, k, generation)
+                if cached:
+                    results[k] = value
+                    continue
+            missing.append(k)
+        if len(missing) == 0:
+            return results
+
+        logging.info(
+            f"Querying {name} for {len(missing)} keys, {len(results)} were cached"
+        )
+        batches = [list(c) for c in self.writer.chunk(missing, self.batch_size)]
+        if self.writer.max_workers <= 1 or len(batches) == 1:
+            responses = [self.__execute(name, query, {"keys": b}) for b in batches]
+        else:
+            responses = list(
+                self.writer.executor.map(
+                    lambda b: self.__execute(name, query, {"keys": b}), batches
+                )
+            )
+
+        found = {}
+        for rows in responses:
+            for r in rows:
+                found.setdefault(r["key"], set()).update(r["values"])
+        for k in missing:
+            results[k] = sorted(found.get(k, ()))
+            if self.cache is not None:
+                self.cache.put(self.graph_identifier, name, k, results[k], generation)
+        return results
+
+    def __published(self) -> str:
+        """Gets the write generation published in the graph by the writers, reading
+        it again once it is older than generation_interval
+
+        Returns:
+            str: The generation, None if nothing was published
+        """
+        with self.__lock:
+            if (
+                self.__generation_read is not None
+                and time.monotonic() - self.__generation_read < self.generation_interval
+            ):
+                return self.__generation
+        read = time.monotonic()
+        rows = self.__execute("generation", generation_query(), {"id": GENERATION_ID})
+        generation = rows[0]["generation"] if len(rows) > 0 else None
+        with self.__lock:
+            self.__generation, self.__generation_read = generation, read
+        return generation
+
+    def __execute(self, name: str, query: str, params: dict) -> list:
+        """Runs a query, retrying throttled and transient failures
+
+        Args:
+            name (str): The name of the query, recorded in the metrics as the "<name> lookups" phase
+            query (str): The query
+            params (dict): The parameters, e.g. a batch of keys
+
+        Returns:
+            list: The result rows
+        """
+        phase = f"{name} lookups"
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                with self.__lock:
+                    self.requests += 1
+                resp = self.writer.execute_query(params, query, phase)
+                return json.loads(resp["payload"].read())["results"]
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self.writer.retry_policy.max_attempts:
+                    raise
+                delay = self.writer.retry_policy.delay(attempt)
+                logging.warning(
+                    f"Attempt {attempt} of a {name} query failed ({e}), retrying in {delay:.2f}s"
+                )
+                self.writer.record_retry(phase)
+                time.sleep(delay)
@@ -0,0 +1,233 @@
+from typing import List, Optional, Union
+import msgspec
+from spdx_tagvalue import SBOMFileFormat, detect_file_format, load_sbom
+
+# Typed records of the parts of CycloneDX and SPDX JSON documents that the writers
+# read. Only the scalar properties written to nodes, and the arrays the edges come
+# from, are declared. Everything else (hashes, licenses, properties, SPDX files and
+# snippets, ...) is skipped by the decoder without being materialized.
+#
+# The records validate documents, they are not what the writers read: decode_sbom
+# turns them back into dicts with to_builtins(), which the writers map like those of
+# json.load. Fields are omitted from to_builtins() when they are missing from the
+# document, so the dicts have the same keys as those of json.load.
+
+_RECORD = dict(omit_defaults=True, gc=False)
+
+
+class CycloneDXExternalReference(msgspec.Struct, **_RECORD):
+    url: str
+    type: Optional[str] = None
+    comment: Optional[str] = None
+
+
+class CycloneDXComponent(msgspec.Struct, **_RECORD):
+    name: str
+    type: Optional[str] = None
+    mime_type: Optional[str] = msgspec.field(default=None, name="mime-type")
+    bom_ref: Optional[str] = msgspec.field(default=None, name="bom-ref")
+    author: Optional[str] = None
+    publisher: Optional[str] = None
+    group: Optional[str] = None
+    version: Optional[str] = None
+    description: Optional[str] = None
+    scope: Optional[str] = None
+    copyright: Optional[str] = None
+    cpe: Optional[str] = None
+    purl: Optional[str] = None
+    modified: Optional[bool] = None
+    externalReferences: Optional[List[CycloneDXExternalReference]] = None
+
+
+class CycloneDXMetadataComponent(CycloneDXComponent, **_RECORD):
+    name: Optional[str] = None
+
+
+class CycloneDXMetadata(msgspec.Struct, **_RECORD):
+    timestamp: str
+    component: CycloneDXMetadataComponent
+
+
+class CycloneDXDependency(msgspec.Struct, **_RECORD):
+    ref: str
+    dependsOn: Optional[List[str]] = None
+
+
+class CycloneDXRating(msgspec.Struct, **_RECORD):
+    score: Optional[float] = None
+    severity: Optional[str] = None
+    method: Optional[str] = None
+    vector: Optional[str] = None
+    justification: Optional[str] = None
+
+
+class CycloneDXAffects(msgspec.Struct, **_RECORD):
+    ref: str
+
+
+class CycloneDXVulnerability(msgspec.Struct, **_RECORD):
+    id: str
+    affects: List[CycloneDXAffects]
+    bom_ref: Optional[str] = msgspec.field(default=None, name="bom-ref")
+    description: Optional[str] = None
+    detail: Optional[str] = None
+    recommendation: Optional[str] = None
+    workaround: Optional[str] = None
+    created: Optional[str] = None
+    published: Optional[str] = None
+    updated: Optional[str] = None
+    rejected: Optional[str] = None
+    ratings: Optional[List[CycloneDXRating]] = None
+
+
+class CycloneDXDocument(msgspec.Struct, **_RECORD):
+    bomFormat: str
+    specVersion: str
+    metadata: CycloneDXMetadata
+    serialNumber: Optional[str] = None
+    version: Optional[int] = None
+    components: Optional[List[CycloneDXComponent]] = None
+    dependencies: Optional[List[CycloneDXDependency]] = None
+    vulnerabilities: Optional[List[CycloneDXVulnerability]] = None
+
+
+class SPDXExternalRef(msgspec.Struct, **_RECORD):
+    referenceType: str
+    referenceLocator: str
+    referenceCategory: Optional[str] = None
+    comment: Optional[str] = None
+
+
+class SPDXPackage(msgspec.Struct, **_RECORD):
+    name: str
+    SPDXID: Optional[str] = None
+    versionInfo: Optional[str] = None
+    packageFileName: Optional[str] = None
+    supplier: Optional[str] = None
+    originator: Optional[str] = None
+    downloadLocation: Optional[str] = None
+    filesAnalyzed: Optional[bool] = None
+    homepage: Optional[str] = None
+    sourceInfo: Optional[str] = None
+    licenseConcluded: Optional[str] = None
+    licenseDeclared: Optional[str] = None
+    licenseComments: Optional[str] = None
+    copyrightText: Optional[str] = None
+    summary: Optional[str] = None
+    description: Optional[str] = None
+    comment: Optional[str] = None
+    primaryPackagePurpose: Optional[str] = None
+    releaseDate: Optional[str] = None
+    builtDate: Optional[str] = None
+    validUntilDate: Optional[str] = None
+    externalRefs: Optional[List[SPDXExternalRef]] = None
+
+
+class SPDXRelationship(msgspec.Struct, **_RECORD):
+    spdxElementId: str
+    relationshipType: str
+    relatedSpdxElement: str
+    comment: Optional[str] = None
+
+
+class SPDXCreationInfo(msgspec.Struct, **_RECORD):
+    created: str
+    comment: Optional[str] = None
+    licenseListVersion: Optional[str] = None
+
+
+class SPDXDocument(msgspec.Struct, **_RECORD):
+    spdxVersion: str
+    creationInfo: SPDXCreationInfo
+    SPDXID: Optional[str] = None
+    name: Optional[str] = None
+    dataLicense: Optional[str] = None
+    documentNamespace: Optional[str] = None
+    comment: Optional[str] = None
+    packages: Optional[List[SPDXPackage]] = None
+    relationships: Optional[List[SPDXRelationship]] = None
+
+
+class _Format(msgspec.Struct):
+    bomFormat: Optional[str] = None
+    spdxVersion: Optional[str] = None
+
+
+_format_decoder = msgspec.json.Decoder(_Format)
+_cyclonedx_decoder = msgspec.json.Decoder(CycloneDXDocument)
+_spdx_decoder = msgspec.json.Decoder(SPDXDocument)
+
+
+def decode_document(data: Union[bytes, str]) -> Union[CycloneDXDocument, SPDXDocument]:
+    """Decodes a CycloneDX or SPDX JSON document into typed records, validating the
+    fields the writers read
+
+    Args:
+        data (Union[bytes, str]): The JSON document
+
+    Raises:
+        ValueError: Raised if the document is neither CycloneDX nor SPDX, or a field the writers read is missing or has the wrong type. The message holds the path of the field, e.g. `$.components[3].name`.
+
+    Returns:
+        Union[CycloneDXDocument, SPDXDocument]: The document
+    """
+    try:
+        document_format = _format_decoder.decode(data)
+        if document_format.spdxVersion is not None:
+            return _spdx_decoder.decode(data)
+        if document_format.bomFormat is not None:
+            return _cyclonedx_decoder.decode(data)
+    except msgspec.DecodeError as e:
+        raise ValueError(f"Invalid SBOM: {e}") from e
+    raise ValueError("Unknown SBOM format")
+
+
+def decode_sbom(data: Union[bytes, str]) -> dict:
+    """Decodes a CycloneDX or SPDX JSON document, validated by the typed records,
+    into a dict holding only the fields the writers use
+
+    Args:
+        data (Union[bytes, str]): The JSON document
+
+    Raises:
+        ValueError: Raised if the document is not a valid CycloneDX or SPDX document
+
+    Returns:
+        dict: The document
+    """
+    return msgspec.to_builtins(decode_document(data))
+
+
+def _read_json(path: str) -> bytes:
+    """Reads the bytes of a JSON file, without a UTF-8 byte order mark
+
+    Args:
+        path (str): The path of the file
+
+    Returns:
+        bytes: The JSON document
+    """
+    with open(path, "rb") as fp:
+        data = fp.read()
+    if data.startswith(b"\xef\xbb\xbf"):
+        data = data[3:]
+    return data
+
+
+def load_sbom_typed(path: str) -> dict:
+    """Loads a JSON SBOM file through the typed records, or an SPDX tag-value file
+    with the tag-value parser
+
+    Args:
+        path (str): The path of the file
+
+    Raises:
+        ValueError: Raised if the file is not a valid CycloneDX or SPDX document
+
+    Returns:
+        dict: The document
+    """
+    if detect_file_format(path) != SBOMFileFormat.JSON:
+        return load_sbom(path)
+    return decode_sbom(_read_json(path))
+
@@ -0,0 +1,242 @@
+import json
+import re
+from itertools import islice
+
+READ_SIZE = 1024 * 1024
+
+_STRUCTURE = re.compile(r'["\[\]{}]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+_WHITESPACE = " \t\n\r"
+
+
+class JsonStreamReader:
+    """An incremental reader over a JSON document whose root is an object.
+
+    Only a sliding window of the file is held in memory. Top-level values are
+    either decoded, skipped without being materialized, or (for arrays)
+    decoded one element at a time.
+    """
+
+    def __init__(self, fp, read_size: int = READ_SIZE) -> None:
+        """Creates the reader
+
+        Args:
+            fp (file): A text file object opened for reading
+            read_size (int, optional): The number of characters to read at a time. Defaults to 1MB.
+        """
+        self.fp = fp
+        self.read_size = read_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def __fill(self, min_size: int = 0) -> bool:
+        """Reads more of the file into the buffer, dropping the consumed part
+
+        Args:
+            min_size (int, optional): The minimum number of characters to read. Defaults to 0.
+
+        Returns:
+            bool: False if the end of the file was reached
+        """
+        if self.eof:
+            return False
+        data = self.fp.read(max(self.read_size, min_size))
+        self.buf = self.buf[self.pos :] + data
+        self.pos = 0
+        if not data:
+            self.eof = True
+            return False
+        return True
+
+    def peek(self) -> str:
+        """Skips whitespace and returns the next character without consuming it
+
+        Returns:
+            str: The next character or an empty string at the end of the file
+        """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.__fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        """Consumes the next character, which must be the one provided
+
+        Args:
+            char (str): The expected character
+
+        Raises:
+            ValueError: Raised if the next character is a different one
+        """
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected '{char}' but found '{found}'")
+        self.pos += 1
+
+    def read_value(self) -> object:
+        """Decodes the next JSON value
+
+        Raises:
+            json.JSONDecodeError: Raised if the value is not valid JSON
+
+        Returns:
+            object: The decoded value
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A number ending exactly at the end of the buffer may be truncated
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # Grow geometrically so a large value is not re-decoded too often
+            self.__fill(len(self.buf) - self.pos)
+
+    def skip_value(self) -> None:
+        """Skips over the next JSON value without materializing it
+
+        Raises:
+            ValueError: Raised if the end of the file is reached inside the value
+        """
+        if self.peek() not in "[{":
+            self.read_value()
+            return
+
+        depth = 0
+        in_string = False
+        while True:
+            pattern = _STRING_SPECIAL if in_string else _STRUCTURE
+            m = pattern.search(self.buf, self.pos)
+            if m is None:
+                self.pos = len(self.buf)
+                if not self.__fill():
+                    raise ValueError("Unexpected end of file")
+                continue
+
+            char = m.group()
+            if char == "\\":
+                if m.end() >= len(self.buf):
+                    # Keep the backslash so the escaped character is seen with it
+                    self.pos = m.start()
+                    if not self.__fill():
+                        raise ValueError("Unexpected end of file")
+                    continue
+                self.pos = m.end() + 1
+                continue
+
+            self.pos = m.end()
+            if char == '"':
+                in_string = not in_string
+            elif char in "[{":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def iter_keys(self):
+        """Iterates the keys of the root object. After each key is yielded the caller
+        must consume its value with read_value, skip_value or iter_array.
+
+        Yields:
+            str: The next key of the root object
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.read_value()
+            self.expect(":")
+            yield key
+            if self.peek() == ",":
+                self.pos += 1
+            else:
+                self.expect("}")
+                return
+
+    def iter_array(self):
+        """Iterates the elements of the array at the current position one at a time
+
+        Yields:
+            object: The next decoded element
+        """
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.read_value()
+            if self.peek() == ",":
+                self.pos += 1
+            else:
+                self.expect("]")
+                return
+
+
+def read_header(path: str, skip: set) -> dict:
+    """Reads the top-level properties of a JSON document, skipping the provided keys
+    without materializing their values
+
+    Args:
+        path (str): The path of the JSON document
+        skip (set): The top-level keys to skip
+
+    Returns:
+        dict: The remaining top-level properties
+    """
+    header = {}
+    with open(path) as fp:
+        reader = JsonStreamReader(fp)
+        for key in reader.iter_keys():
+            if key in skip:
+                reader.skip_value()
+            else:
+                header[key] = reader.read_value()
+    return header
+
+
+def iter_array_items(path: str, key: str):
+    """Iterates the elements of a top-level array of a JSON document one at a time
+
+    Args:
+        path (str): The path of the JSON document
+        key (str): The top-level key of the array
+
+    Yields:
+        object: The next element of the array
+    """
+    with open(path) as fp:
+        reader = JsonStreamReader(fp)
+        for k in reader.iter_keys():
+            if k != key:
+                reader.skip_value()
+            elif reader.peek() == "[":
+                yield from reader.iter_array()
+                return
+            else:
+                reader.skip_value()
+
+
+def iter_array_batches(path: str, key: str, batch_size: int):
+    """Iterates the elements of a top-level array of a JSON document in lists of batch_size
+
+    Args:
+        path (str): The path of the JSON document
+        key (str): The top-level key of the array
+        batch_size (int): The maximum number of elements in each batch
+
+    Returns:
+        iterator: An iterator of lists of elements
+    """
+    items = iter_array_items(path, key)
+    return iter(lambda: list(islice(items, batch_size)), [])
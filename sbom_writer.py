@@ -1,8 +1,28 @@
 import boto3
+import functools
+import json
 import logging
+import threading
+import time
 import uuid
+import weakref
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from itertools import islice
 from enum import Enum
+from batching import (
+    AdaptiveBatchSizer,
+    RetryPolicy,
+    is_retryable,
+    is_throttled,
+    is_too_large,
+)
+from metrics import IngestMetrics
+from journal import IngestJournal
+from neptune_client import DEFAULT_MAX_CONNECTIONS, NeptuneGraphClientPool
+from query_cache import GENERATION_ID, GENERATION_LABEL, record_write
+from sbom_stream import iter_array_batches, read_header
+from spdx_tagvalue import SBOMFileFormat, detect_file_format, load_sbom
+from write_cache import WriteCache
 
 
 class BomType(Enum):
@@ -13,6 +33,9 @@ class BomType(Enum):
 
 BATCH_SIZE = 200
 
+CYCLONEDX_STREAMED_KEYS = {"components", "dependencies", "vulnerabilities"}
+SPDX_STREAMED_KEYS = {"packages", "relationships", "files", "snippets"}
+
 
 class NodeLabels(Enum):
     DOCUMENT = "Document"
@@ -33,83 +56,542 @@ class EdgeLabels(Enum):
 
 logger = logging.getLogger(__name__)
 
+# The node properties that edges are matched on
+INDEXED_PROPERTIES = ("purl", "bom-ref", "SPDXID", "id")
+
+# The property every node MERGE sets to the time it was written, in seconds since the
+# epoch. The garbage collector only deletes orphans that were not written recently.
+WRITTEN_PROPERTY = "written_at"
+
+# The end of rel_merge_query, returning the number of edges whose nodes were matched
+_EDGES_RETURN = "RETURN count(s) as edges"
+
+
+class KeyIndex:
+    """Maps the key properties (purl, bom-ref, SPDXID, id) of the nodes written by a
+    writer to their `~id`s, so edges can be written as id lookups.
+
+    Keys are indexed per label, so an edge whose MATCH fallback is restricted to a
+    label only resolves to nodes of that label. The CycloneDX Document node, for
+    example, carries the purl and bom-ref of the metadata component and must not be
+    the endpoint of an edge between Components.
+    """
+
+    def __init__(self) -> None:
+        self.__keys = {}
+
+    def add(self, rows: list, label: str):
+        """Indexes the provided node rows
+
+        Args:
+            rows (list): The node rows, each with its `~id` in __id
+            label (str): The label of the nodes
+        """
+        for r in rows:
+            for p in INDEXED_PROPERTIES:
+                if r.get(p) is not None:
+                    self.__keys.setdefault((label, p, r[p]), set()).add(r["__id"])
+                    self.__keys.setdefault((None, p, r[p]), set()).add(r["__id"])
+
+    def resolve(self, property: str, value: str, label: str = None) -> set:
+        """Finds the `~id`s of the indexed nodes with the provided property value
+
+        Args:
+            property (str): The property name, `~id` values resolve to themselves
+            value (str): The property value
+            label (str, optional): The label the nodes must have. Defaults to None (any label).
+
+        Returns:
+            set: The matching `~id`s, empty if the key is not in the index
+        """
+        if property == "~id":
+            return {value}
+        return self.__keys.get((label, property, value), set())
+
+
+class BatchWriteError(Exception):
+    """Raised when one or more batches of a write phase fail"""
+
+    def __init__(self, label: str, failures: list) -> None:
+        """Creates the error from the failed batches of a phase
+
+        Args:
+            label (str): The node or edge label of the phase that failed
+            failures (list): A list of (batch index, exception) tuples
+        """
+        self.label = label
+        self.failures = failures
+        super().__init__(
+            f"{len(failures)} batch(es) failed while writing {label}: "
+            + "; ".join(f"batch {i}: {e!r}" for i, e in failures)
+        )
+
+
+class QueryError(Exception):
+    """Raised when the graph answers a query with a status other than 200"""
+
+    def __init__(self, query: str, response: dict) -> None:
+        """Creates the error from the response
+
+        Args:
+            query (str): The query
+            response (dict): The response of the neptune-graph client
+        """
+        self.query = query
+        self.response = response
+        super().__init__(
+            f"The query failed with HTTP status "
+            f"{response['ResponseMetadata']['HTTPStatusCode']}: {query.strip()[:200]}"
+        )
+
+
+class MissingEndpointsError(Exception):
+    """Raised when edges between nodes matched on `~id` were not all written because
+    some of their nodes no longer exist, e.g. the garbage collector deleted them"""
+
+    def __init__(self, query: str, rows: int, written: int) -> None:
+        """Creates the error from the batch of edges
+
+        Args:
+            query (str): The query
+            rows (int): The number of edges in the batch
+            written (int): The number of edges whose nodes were both matched
+        """
+        self.query = query
+        self.rows = rows
+        self.written = written
+        super().__init__(
+            f"Only {written} of {rows} edges were written, the nodes of the others "
+            f"no longer exist: {query.strip()[:200]}"
+        )
+
+
+def _quote(name: str) -> str:
+    """Quotes a label or property name for use in an openCypher query
+
+    Args:
+        name (str): The name
+
+    Returns:
+        str: The name in backticks
+    """
+    return "`" + name.replace("`", "``") + "`"
+
+
+@functools.lru_cache(maxsize=1024)
+def node_merge_query(label: str, keys: tuple) -> str:
+    """Creates the query to MERGE nodes with exactly the provided properties.
+
+    Queries are cached per (label, keys) so every document reuses the same small set
+    of query strings, which the server side can cache the plans of.
+
+    Args:
+        label (str): The label of the nodes
+        keys (tuple): The sorted property names set on the nodes
+
+    Returns:
+        str: The query, with the rows in the $props parameter and the time in $written_at
+    """
+    sets = [f"s.{_quote(WRITTEN_PROPERTY)} = $written_at"]
+    sets += [f"s.{_quote(k)} = p.{_quote(k)}" for k in keys]
+    return f"""
+                UNWIND $props as p
+                MERGE (s:{label} {{`~id`: p.__id}})
+                SET """ + ",".join(sets)
+
+
+@functools.lru_cache(maxsize=256)
+def rel_merge_query(label: str) -> str:
+    """Creates the query to MERGE edges between nodes matched on `~id`. It returns
+    the number of edges written, so edges whose nodes no longer exist are noticed.
+
+    Args:
+        label (str): The label of the edges
+
+    Returns:
+        str: The query, with the rows in the $rels parameter
+    """
+    return f"""
+                    UNWIND $rels as r
+                    MATCH (from {{`~id`: r.fromId}})
+                    MATCH (to {{`~id`: r.toId}})
+                    MERGE (from)-[s:{label}]->(to)
+                    {_EDGES_RETURN} """
+
+
+@functools.lru_cache(maxsize=256)
+def rel_merge_on_property_query(
+    label: str, from_label: str, from_property: str, to_label: str, to_property: str
+) -> str:
+    """Creates the query to MERGE edges between nodes matched on a property
+
+    Args:
+        label (str): The label of the edges
+        from_label (str): The label of the From node, or None to match any node
+        from_property (str): The property to match on the From node
+        to_label (str): The label of the To node, or None to match any node
+        to_property (str): The property to match on the To node
+
+    Returns:
+        str: The query, with the rows in the $rels parameter
+    """
+
+    def match(variable, node_label, property, value):
+        if node_label is None or property == "~id":
+            return f"({variable} {{{_quote(property)}: {value}}})"
+        return f"({variable}:{node_label} {{{_quote(property)}: {value}}})"
+
+    return f"""
+                    UNWIND $rels as r
+                    MATCH {match("from", from_label, from_property, "r.from")}
+                    MATCH {match("to", to_label, to_property, "r.to")}
+                    MERGE (from)-[s:{label}]->(to) """
+
+
+@functools.lru_cache(maxsize=256)
+def rel_delete_query(label: str) -> str:
+    """Creates the query to DELETE edges between nodes matched on `~id`
+
+    Args:
+        label (str): The label of the edges
+
+    Returns:
+        str: The query, with the rows in the $rels parameter
+    """
+    return f"""
+                    UNWIND $rels as r
+                    MATCH (from {{`~id`: r.fromId}})-[s:{label}]->(to {{`~id`: r.toId}})
+                    DELETE s """
+
+
+def determine_bom_type(bom: dict) -> BomType:
+    """This determines if the file is an SPDX or CycloneDX file based on the json structure
+
+    Args:
+        bom (dict): The BOM element
+
+    Returns:
+        BomType: The type of BOM
+    """
+    if "spdxVersion" in bom:
+        logging.info("Identified file as SPDX")
+        return BomType.SPDX
+    elif "bomFormat" in bom:
+        logging.info("Identified file as CycloneDX")
+        return BomType.CYDX
+    else:
+        logging.warning("Unknown SBOM format")
+        return BomType.UNKNOWN
+
 
 class NeptuneAnalyticsSBOMWriter:
     client = None
     graph_identifier = None
-
-    def __init__(self, graph_identifier: str, region: str) -> None:
+    max_workers = 1
+    write_cache = None
+    batch_sizer = None
+    retry_policy = None
+    metrics = None
+    journal = None
+    advisories = None
+
+    def __init__(
+        self,
+        graph_identifier: str,
+        region: str,
+        max_workers: int = 1,
+        write_cache: WriteCache = None,
+        batch_sizer: AdaptiveBatchSizer = None,
+        retry_policy: RetryPolicy = None,
+        metrics: IngestMetrics = None,
+        client: object = None,
+        journal: IngestJournal = None,
+        advisories: object = None,
+    ) -> None:
         """The purpose of this function is to initialize the NeptuneAnalyticsSBOMWriter class.
         This function initializes the NeptuneAnalyticsSBOMWriter class.
         It takes in a graph_identifier and a region as parameters.
-        It sets the client to a boto3 client for the neptune-graph service in the specified region.
+        It sets the client to a pooled neptune-graph client in the specified region.
         It sets the graph_identifier to the graph_identifier passed in.
         It returns nothing.
 
         Args:
             graph_identifier (str): The graph identifier
             region (str): The aws region for the neptune-graph service
+            max_workers (int, optional): The number of batches to keep in flight per write phase. Defaults to 1 (serial).
+            write_cache (WriteCache, optional): A cache used to skip unchanged nodes. Defaults to None.
+            batch_sizer (AdaptiveBatchSizer, optional): Sizes batches adaptively, shared by all documents. Defaults to None (fixed batch size).
+            retry_policy (RetryPolicy, optional): How throttled and transient failures are retried. Defaults to RetryPolicy().
+            metrics (IngestMetrics, optional): Records the time, rows and bytes of each write phase. Defaults to None.
+            client (object, optional): The neptune-graph client to use, e.g. a NeptuneGraphClientPool or a stand-in for testing. Defaults to a NeptuneGraphClientPool sized for max_workers.
+            journal (IngestJournal, optional): Records the acknowledged batches of documents written with a document_key, to resume them. Defaults to None.
+            advisories (AdvisoryIndex, optional): Advisories to add the Vulnerabilities of the components from. Each document is then mapped with record_sbom and written with write_record. Defaults to None.
         """
-        self.client = boto3.client("neptune-graph", region_name=region)
+        if client is None:
+            client = NeptuneGraphClientPool(
+                region, max_connections=max(DEFAULT_MAX_CONNECTIONS, max_workers)
+            )
+        self.client = client
         self.graph_identifier = graph_identifier
+        self.max_workers = max_workers
+        self.write_cache = write_cache
+        self.batch_sizer = batch_sizer
+        self.retry_policy = retry_policy
+        self.metrics = metrics
+        self.journal = journal
+        self.advisories = advisories
+        self.__writers = threading.local()
+        # Every writer created, to shut down their batch pools in close()
+        self.__created = weakref.WeakSet()
+        self.__created_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Shuts down the batch pools of the writers created by this writer, see
+        Writer.close"""
+        with self.__created_lock:
+            writers = list(self.__created)
+        for writer in writers:
+            writer.close()
+
+    def create_writer(self, writer_class: type = None):
+        """Creates a writer that shares this writer's client and settings. Its batch
+        pool is shut down by close().
 
-    def __determine_filetype(self, bom: str) -> BomType:
-        """This determines if the file is an SPDX or CycloneDX file based on the json structure
+        Args:
+            writer_class (type, optional): The Writer subclass to create. Defaults to Writer.
+
+        Returns:
+            Writer: The writer
+        """
+        writer = (writer_class or Writer)(
+            self.graph_identifier,
+            self.client,
+            self.max_workers,
+            self.write_cache,
+            self.batch_sizer,
+            self.retry_policy,
+            self.metrics,
+            self.journal,
+        )
+        with self.__created_lock:
+            self.__created.add(writer)
+        return writer
+
+    def __create_writer(self, bom_type: BomType):
+        """Gets the writer for the provided type of BOM. Each thread reuses its
+        writers from one document to the next.
 
         Args:
-            bom (str): The BOM element
+            bom_type (BomType): The type of BOM
 
         Returns:
-            BomType: The type of BOM
-        """
-        if "spdxVersion" in bom:
-            logging.info("Identified file as SPDX")
-            return BomType.SPDX
-        elif "bomFormat" in bom:
-            logging.info("Identified file as CycloneDX")
-            return BomType.CYDX
+            Writer: The writer, or None if the type is unknown
+        """
+        if bom_type == BomType.CYDX:
+            writer_class = CycloneDXWriter
+        elif bom_type == BomType.SPDX:
+            writer_class = SPDXWriter
         else:
             logging.warning("Unknown SBOM format")
-            return BomType.UNKNOWN
+            return None
+        return self.thread_writer(writer_class)
 
-    def write_sbom(self, bom: str) -> bool:
+    def thread_writer(self, writer_class: type = None):
+        """Gets this thread's writer of the provided class, reset for a new document.
+        Reusing it keeps its batch pool from one document to the next.
+
+        Args:
+            writer_class (type, optional): The Writer subclass. Defaults to Writer.
+
+        Returns:
+            Writer: The writer
+        """
+        writer_class = writer_class or Writer
+        writers = getattr(self.__writers, "writers", None)
+        if writers is None:
+            writers = self.__writers.writers = {}
+        if writer_class not in writers:
+            writers[writer_class] = self.create_writer(writer_class)
+        writer = writers[writer_class]
+        writer.reset()
+        return writer
+
+    def write_sbom(self, bom: str, document_key: str = None) -> bool:
         """Writes out the SBOM
 
         Args:
             bom (str): The string of the SBOM data file
+            document_key (str, optional): Identifies the document in the journal, e.g. the hash of its file. Defaults to None.
 
         Returns:
             bool: True if successful, False if not
         """
-        bom_type = self.__determine_filetype(bom)
-        res = False
-        if bom_type == BomType.CYDX:
-            res = CycloneDXWriter(self.graph_identifier, self.client).write_document(
-                bom
-            )
-        elif bom_type == BomType.SPDX:
-            res = SPDXWriter(self.graph_identifier, self.client).write_document(bom)
-        else:
-            logging.warning("Unknown SBOM format")
+        if self.advisories is not None:
+            record = record_sbom(bom, self.advisories)
+            if record is None:
+                return False
+            return self.write_record(record, document_key)
+        writer = self.__create_writer(determine_bom_type(bom))
+        if writer is None:
+            return False
+        writer.document_key = document_key
+        try:
+            return writer.write_document(bom)
+        finally:
+            writer.publish_generation()
+
+    def write_sbom_stream(self, path: str, document_key: str = None) -> bool:
+        """Writes out the SBOM file at the provided path without loading it into memory.
+
+        The large arrays (components, packages, dependencies, relationships, ...) are
+        read incrementally and written in batches, so memory use is bounded by the
+        batch size rather than the size of the file.
+
+        SPDX tag-value files are parsed a line at a time and then written as a whole,
+        and documents enriched from advisories are loaded and written as a whole.
 
-        return res
+        Args:
+            path (str): The path of the JSON or SPDX tag-value SBOM file
+            document_key (str, optional): Identifies the document in the journal, e.g. the hash of its file. Defaults to None.
+
+        Returns:
+            bool: True if successful, False if not
+        """
+        if (
+            self.advisories is not None
+            or detect_file_format(path) == SBOMFileFormat.TAG_VALUE
+        ):
+            return self.write_sbom(load_sbom(path), document_key)
+        header = read_header(path, CYCLONEDX_STREAMED_KEYS | SPDX_STREAMED_KEYS)
+        writer = self.__create_writer(determine_bom_type(header))
+        if writer is None:
+            return False
+        writer.document_key = document_key
+        try:
+            return writer.write_document_stream(path, header)
+        finally:
+            writer.publish_generation()
+
+    def write_record(self, record: object, document_key: str = None) -> bool:
+        """Writes out an SBOM already mapped into its nodes and edges
+
+        Args:
+            record (DocumentRecord): The nodes and edges, see record_sbom
+            document_key (str, optional): Identifies the document in the journal, e.g. the hash of its file. Defaults to None.
+
+        Returns:
+            bool: True if successful, False if not
+        """
+        writer = self.thread_writer(Writer)
+        writer.document_key = document_key
+        try:
+            return writer.write_record(record)
+        finally:
+            writer.publish_generation()
 
 
 class Writer:
     client = None
     graph_identifier = None
-    batch_size = 200
-
-    def __init__(self, graph_identifier: str, client: boto3.client) -> None:
+    batch_size = BATCH_SIZE
+    max_workers = 1
+    write_cache = None
+    batch_sizer = None
+    retry_policy = RetryPolicy()
+    metrics = None
+    journal = None
+    document_key = None
+    duplicate_rows = 0
+    __executor = None
+
+    def __init__(
+        self,
+        graph_identifier: str,
+        client: boto3.client,
+        max_workers: int = 1,
+        write_cache: WriteCache = None,
+        batch_sizer: AdaptiveBatchSizer = None,
+        retry_policy: RetryPolicy = None,
+        metrics: IngestMetrics = None,
+        journal: IngestJournal = None,
+    ) -> None:
         """This initializes a base writer class
 
         Args:
             graph_identifier (str): The graph identifier
             client (boto3.client): The neptune-graph boto3 client
+            max_workers (int, optional): The number of batches to keep in flight per write phase. Defaults to 1 (serial).
+            write_cache (WriteCache, optional): A cache used to skip unchanged nodes. Defaults to None.
+            batch_sizer (AdaptiveBatchSizer, optional): Sizes batches adaptively. Defaults to None (batches of batch_size rows).
+            retry_policy (RetryPolicy, optional): How throttled and transient failures are retried. Defaults to RetryPolicy().
+            metrics (IngestMetrics, optional): Records the time, rows and bytes of each write phase. Defaults to None.
+            journal (IngestJournal, optional): Records the acknowledged batches of the document identified by document_key. Defaults to None.
         """
         self.client = client
         self.graph_identifier = graph_identifier
+        self.max_workers = max_workers
+        self.write_cache = write_cache
+        self.batch_sizer = batch_sizer
+        if retry_policy is not None:
+            self.retry_policy = retry_policy
+        self.metrics = metrics
+        self.journal = journal
+        self.key_index = KeyIndex()
+        self.__executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Shuts down the batch pool, waiting for the batches in flight. The writer can
+        still be used, a new pool is created when one is needed."""
+        executor, self.__executor = self.__executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """The pool the batches of each write phase are sent on when max_workers > 1.
+        It is created on first use and kept until close(), so its threads (and the
+        clients of a per-thread NeptuneGraphClientPool) are reused from one phase and
+        one document to the next.
+
+        Returns:
+            ThreadPoolExecutor: The pool
+        """
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix=f"{self.graph_identifier}-batch",
+            )
+        return self.__executor
+
+    def reset(self):
+        """Forgets the nodes written so far, before the writer is reused for another
+        document"""
+        self.key_index = KeyIndex()
+        self.document_key = None
+
+    @property
+    def stream_batch_size(self) -> int:
+        """The number of array elements read at a time when streaming a document,
+        enough to keep every worker busy with a full batch
 
+        Returns:
+            int: The number of elements
+        """
+        return self.batch_size * max(1, self.max_workers)
+
+    @staticmethod
     def chunk(arr_range, arr_size: int):
         """Chunks the array into multiple arrays of the specified size
 
@@ -146,21 +628,88 @@ class Writer:
         Returns:
             Nothing
         """ """"""
-        params = []
         logging.info(f"Writing {label} nodes")
         if len(nodes) == 0:
             return
 
-        query = (
-            """
-                UNWIND $props as p
-                MERGE (s:"""
-            + label
-            + """ {`~id`: p.__id})
-                SET """
-            + self.__create_property_map_str(nodes[0])
+        params = self._create_node_rows(
+            nodes, label, keyName, create_uuid_if_key_not_exists, id
         )
+        self.key_index.add(params, label)
+        self.write_node_rows(params, label)
+
+    def write_node_rows(self, rows: list, label: str):
+        """Writes node rows that already have their `~id` in __id
+
+        Args:
+            rows (list): The node rows to write
+            label (str): The label to associate with the nodes
+        """
+        if len(rows) == 0:
+            return
+        rows = self._merge_rows(rows, ("__id",), label)
+
+        if self.write_cache is not None:
+            changed, hashes = self.write_cache.filter(self.graph_identifier, rows)
+            if len(changed) < len(rows):
+                logging.info(
+                    f"Skipping {len(rows) - len(changed)} unchanged {label} nodes"
+                )
+            rows = changed
+
+        shapes = self._group_by_shape(rows, label)
+        for keys, shape_rows in shapes.items():
+            self.__execute_batches(
+                node_merge_query(label, keys), "props", shape_rows, label
+            )
+
+        if self.write_cache is not None:
+            self.write_cache.record(self.graph_identifier, hashes)
+
+    def _group_by_shape(self, rows: list, label: str) -> dict:
+        """Groups node rows by their property names. Rows with different properties
+        need different SET clauses, otherwise the properties missing from the first
+        row would be dropped.
+
+        Args:
+            rows (list): The node rows
+            label (str): The label of the nodes, used for logging
+
+        Returns:
+            dict: The rows keyed by their sorted property names (excluding __id)
+        """
+        shapes = {}
+        for r in rows:
+            keys = tuple(sorted(k for k in r.keys() if k != "__id"))
+            shapes.setdefault(keys, []).append(r)
+        if len(shapes) > 1:
+            logging.info(f"Writing {label} nodes with {len(shapes)} property sets")
+        return shapes
+
+    def _create_node_rows(
+        self,
+        nodes: object,
+        label: str,
+        keyName: str,
+        create_uuid_if_key_not_exists: bool = False,
+        id: str = None,
+    ) -> list:
+        """Creates the rows to write for the provided nodes, each with its `~id` in __id
+
+        Args:
+            nodes (object): The nodes to write
+            label (str): The label to associate with the nodes
+            keyName (str): The name of the property to use as the key for matching
+            create_uuid_if_key_not_exists (bool, optional): Whether or not to create a UUID if the key does not exist. Defaults to False.
+            id (str, optional): The specific ID to match. Defaults to None.
 
+        Raises:
+            AttributeError: Raises an error if the key property name does not exist
+
+        Returns:
+            list: The rows with the list and dict properties removed
+        """
+        params = []
         for o in nodes:
             if keyName in o:
                 params.append(
@@ -189,13 +738,31 @@ class Writer:
                     f"The object {o} does not contain the key {keyName}"
                 )
 
-        arr_range = iter(params)
-        chunks = iter(lambda: tuple(islice(arr_range, self.batch_size)), ())
-        for chunk in chunks:
-            # This should not be needed but due to an issue with duplicate maps we have to guarantee uniqeness
-            res = list(map(dict, set(tuple(sorted(sub.items())) for sub in chunk)))
+        return params
 
-            self.execute_query({"props": res}, query)
+    def write_record(self, record: object) -> bool:
+        """Writes the nodes of a mapped document, then its edges. The edges within the
+        document are already resolved to `~id`s, only the rest are matched on a
+        property.
+
+        Args:
+            record (DocumentRecord): The nodes and edges, see record_sbom
+
+        Returns:
+            bool: True if successful, False if not
+        """
+        for label, rows in record.node_rows().items():
+            logging.info(f"Writing {label} nodes")
+            self.write_node_rows(rows, label)
+        for label, rels in record.edge_rows().items():
+            self.write_rel(rels, label)
+        for (label, from_p, to_p, from_label, to_label), rels in (
+            record.property_edge_rows().items()
+        ):
+            self.write_rel_match_on_property(
+                rels, label, from_p, to_p, from_label, to_label
+            )
+        return True
 
     def write_rel(self, rels: list, label: str):
         """Writes the provided relationships
@@ -207,79 +774,453 @@ class Writer:
         logging.info(f"Writing {label} edges")
         if len(rels) == 0:
             return
+        rels = self._merge_rows(rels, ("fromId", "toId"), label)
 
-        query = (
-            """                
-                    UNWIND $rels as r
-                    MATCH (from {`~id`: r.fromId})
-                    MATCH (to {`~id`: r.toId})
-                    MERGE (from)-[s:"""
-            + label
-            + """]->(to) """
-        )
-
-        arr_range = iter(rels)
-        chunks = iter(lambda: tuple(islice(arr_range, self.batch_size)), ())
-        for chunk in chunks:
-            # This should not be needed but due to an issue with duplicate maps we have to guarantee uniqeness
-            res = list(map(dict, set(tuple(sorted(sub.items())) for sub in chunk)))
-            self.execute_query({"rels": res}, query)
+        self.__execute_batches(rel_merge_query(label), "rels", rels, label)
 
     def write_rel_match_on_property(
-        self, rels: list, label: str, from_property: str, to_property: str
+        self,
+        rels: list,
+        label: str,
+        from_property: str,
+        to_property: str,
+        from_label: str = None,
+        to_label: str = None,
     ):
         """Writes the provided relationships where you match on the provided key
 
+        Endpoints are first resolved to `~id`s using the nodes this writer has already
+        written, and those edges are written by id. Only the rest fall back to a
+        (labeled, when labels are provided) property MATCH in the graph.
+
         Args:
             rels (list): The list of relationships to write
             label (str): The label to associate with the relationship
             from_property (str): The property to match on the From node
             to_property (str): The property to match on the To node
+            from_label (str, optional): The label of the From node for the property MATCH fallback. Defaults to None.
+            to_label (str, optional): The label of the To node for the property MATCH fallback. Defaults to None.
         """
-        logging.info(f"Writing {label} edges")
         if len(rels) == 0:
+            logging.info(f"Writing {label} edges")
             return
 
-        query = (
-            """                
-                    UNWIND $rels as r
-                    MATCH (from {`"""
-            + from_property
-            + """`: r.from})
-                    MATCH (to {`"""
-            + to_property
-            + """`: r.to})
-                    MERGE (from)-[s:"""
-            + label
-            + """]->(to) """
+        rels = self._merge_rows(rels, ("from", "to"), label)
+        resolved, unresolved = self._resolve_rels(
+            rels, from_property, to_property, from_label, to_label
         )
+        logging.info(
+            f"Resolved {len(rels) - len(unresolved)} of {len(rels)} {label} edges to ids"
+        )
+        if len(resolved) > 0:
+            self.write_rel(resolved, label)
+        if len(unresolved) == 0:
+            return
 
-        arr_range = iter(rels)
-        chunks = iter(lambda: tuple(islice(arr_range, self.batch_size)), ())
-        for chunk in chunks:
-            # This should not be needed but due to an issue with duplicate maps we have to guarantee uniqeness
-            res = list(map(dict, set(tuple(sorted(sub.items())) for sub in chunk)))
-            self.execute_query({"rels": res}, query)
-
-    def execute_query(self, params: map, query: str) -> map:
-        resp = self.client.execute_query(
-            queryString=query,
-            parameters=params,
-            language="OPEN_CYPHER",
-            graphIdentifier=self.graph_identifier,
+        logging.info(f"Writing {label} edges")
+        query = rel_merge_on_property_query(
+            label, from_label, from_property, to_label, to_property
         )
-        """_summary_
-        
+        self.__execute_batches(query, "rels", unresolved, label)
+
+    def _merge_rows(self, rows: list, key_fields: tuple, label: str) -> list:
+        """Merges the rows that share the same key, in a single pass before batching.
+
+        Later rows win for each property they set, except that a None value never
+        overwrites a value from an earlier row. The merged rows keep the order in
+        which their keys were first seen.
+
+        Args:
+            rows (list): The node or edge rows
+            key_fields (tuple): The fields that identify a row, e.g. ("__id",) or ("fromId", "toId")
+            label (str): The label being written, used for reporting
+
+        Returns:
+            list: The rows with one row per key
+        """
+        merged = {}
+        for r in rows:
+            key = tuple(r[k] for k in key_fields)
+            if key not in merged:
+                merged[key] = r
+            else:
+                merged[key] = {
+                    **merged[key],
+                    **{k: v for k, v in r.items() if v is not None},
+                }
+
+        duplicates = len(rows) - len(merged)
+        if duplicates > 0:
+            self.duplicate_rows += duplicates
+            logging.info(f"Merged {duplicates} duplicate {label} rows")
+        return list(merged.values())
+
+    def _resolve_rels(
+        self,
+        rels: list,
+        from_property: str,
+        to_property: str,
+        from_label: str = None,
+        to_label: str = None,
+    ) -> tuple:
+        """Resolves the endpoints of property matched relationships using the key index
+
+        Args:
+            rels (list): The relationships, each with a from and to property value
+            from_property (str): The property to match on the From node
+            to_property (str): The property to match on the To node
+            from_label (str, optional): The label the From node must have. Defaults to None.
+            to_label (str, optional): The label the To node must have. Defaults to None.
+
+        Returns:
+            tuple: The resolved relationships with fromId and toId, and the relationships that could not be resolved
+        """
+        resolved = []
+        unresolved = []
+        for r in rels:
+            from_ids = self.key_index.resolve(from_property, r["from"], from_label)
+            to_ids = self.key_index.resolve(to_property, r["to"], to_label)
+            if len(from_ids) > 0 and len(to_ids) > 0:
+                resolved.extend(
+                    {"fromId": f, "toId": t} for f in from_ids for t in to_ids
+                )
+            else:
+                unresolved.append(r)
+        return resolved, unresolved
+
+    def delete_rel(self, rels: list, label: str):
+        """Deletes the provided relationships
+
+        Args:
+            rels (list): The relationships to delete, each with a fromId and toId
+            label (str): The label of the relationship
+        """
+        logging.info(f"Deleting {label} edges")
+        if len(rels) == 0:
+            return
+        rels = self._merge_rows(rels, ("fromId", "toId"), label)
+
+        self.__execute_batches(rel_delete_query(label), "rels", rels, label)
+
+    def __execute_batches(self, query: str, param_name: str, rows: list, label: str):
+        """Sends the rows to the graph in batches of batch_size, or as sized by the
+        batch_sizer if there is one.
+
+        With max_workers > 1 up to max_workers batches are in flight at once. This
+        returns only once every batch has completed, so each write_* call is a
+        barrier and nodes are always written before the edges that reference them.
+
+        Args:
+            query (str): The UNWIND query to execute for each batch
+            param_name (str): The name of the query parameter holding the batch
+            rows (list): The rows to write
+            label (str): The label being written, used for error reporting
+
+        Raises:
+            BatchWriteError: Raised in concurrent mode if any batch failed
+        """
+        phase = self.phase_name(query, param_name, label)
+        if self.metrics is None:
+            self.__send_batches(query, param_name, rows, label, phase)
+            return
+        with self.metrics.phase(phase, len(rows)):
+            self.__send_batches(query, param_name, rows, label, phase)
+
+    def __send_batches(
+        self, query: str, param_name: str, rows: list, label: str, phase: str
+    ):
+        """Sends the batches of one write phase, see __execute_batches
+
+        Args:
+            query (str): The UNWIND query to execute for each batch
+            param_name (str): The name of the query parameter holding the batch
+            rows (list): The rows to write
+            label (str): The label being written, used for error reporting
+            phase (str): The name of the phase, used for metrics
+        """
+        if self.max_workers <= 1:
+            # Split as the batches are sent, so they follow the batch_sizer's limits
+            batches = (
+                self.batch_sizer.iter_split(rows)
+                if self.batch_sizer is not None
+                else self.chunk(rows, self.batch_size)
+            )
+            for batch in batches:
+                self._send_batch(query, param_name, list(batch), phase=phase)
+            return
+
+        batches = self._split_batches(rows, label)
+
+        failures = []
+        futures = {
+            self.executor.submit(
+                self._send_batch, query, param_name, batch, phase=phase
+            ): i
+            for i, batch in enumerate(batches)
+        }
+        for future in as_completed(futures):
+            if future.exception() is not None:
+                logging.error(
+                    f"Batch {futures[future]} of {label} failed: {future.exception()}"
+                )
+                failures.append((futures[future], future.exception()))
+
+        if len(failures) > 0:
+            raise BatchWriteError(label, sorted(failures, key=lambda f: f[0]))
+
+    @staticmethod
+    def phase_name(query: str, param_name: str, label: str) -> str:
+        """Names the write phase a query belongs to, e.g. "Component nodes"
+
+        Args:
+            query (str): The UNWIND query
+            param_name (str): The name of the query parameter holding the batch
+            label (str): The label being written
+
+        Returns:
+            str: The name of the phase
+        """
+        if param_name == "props":
+            return f"{label} nodes"
+        if "DELETE" in query:
+            return f"{label} edge deletes"
+        return f"{label} edges"
+
+    def _split_batches(self, rows: list, label: str) -> list:
+        """Splits the rows into batches of batch_size, or as sized by the batch_sizer
+
+        Args:
+            rows (list): The rows to write
+            label (str): The label being written, used for logging
+
+        Returns:
+            list: The batches
+        """
+        if self.batch_sizer is None:
+            return [list(chunk) for chunk in self.chunk(rows, self.batch_size)]
+
+        batches = self.batch_sizer.split(rows)
+        if len(batches) > 0:
+            logging.info(
+                f"Writing {len(rows)} {label} rows in {len(batches)} batches "
+                f"of up to {max(len(b) for b in batches)} rows"
+            )
+        return batches
+
+    def _send_batch(
+        self,
+        query: str,
+        param_name: str,
+        rows: list,
+        phase: str = None,
+    ):
+        """Sends one batch, retrying throttled and transient failures with backoff.
+
+        A batch that is rejected as too large is split in half and each half is sent
+        on its own, and the batch_sizer is told so the following batches are smaller
+        too. A batch that still fails once its retries are used up fails the
+        write; it is not split, as smaller requests only add load to a throttled or
+        failing server.
+
+        Args:
+            query (str): The UNWIND query to execute
+            param_name (str): The name of the query parameter holding the batch
+            rows (list): The rows of the batch
+            phase (str, optional): The write phase the batch belongs to, used for metrics. Defaults to the phase named after the query.
+        """
+        if self.metrics is not None and phase is None:
+            phase = self.phase_name(query, param_name, "").strip()
+
+        batch_hash = None
+        if self.journal is not None and self.document_key is not None:
+            batch_hash = self.journal.hash_batch(query, rows)
+            if self.journal.is_batch_done(self.document_key, batch_hash):
+                logging.info(f"Skipping a batch of {len(rows)} rows written before")
+                return
+
+        try:
+            self.__send_with_retries(query, param_name, rows, phase)
+        except MissingEndpointsError:
+            if batch_hash is not None:
+                # The nodes of batches written before are gone, so the next
+                # attempt has to write the whole document again
+                self.journal.forget_batches(self.document_key)
+            raise
+        if batch_hash is not None:
+            self.journal.record_batch(self.document_key, batch_hash, phase)
+
+    def __send_with_retries(
+        self, query: str, param_name: str, rows: list, phase: str
+    ):
+        """Sends one batch, see _send_batch
+
+        Args:
+            query (str): The UNWIND query to execute
+            param_name (str): The name of the query parameter holding the batch
+            rows (list): The rows of the batch
+            phase (str): The write phase the batch belongs to
+
+        Raises:
+            MissingEndpointsError: Raised if edges were not written because their nodes no longer exist
+            Exception: The error of the last attempt, if the batch could not be written
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            start = time.monotonic()
+            params = {param_name: rows}
+            if "$written_at" in query:
+                params["written_at"] = time.time()
+            try:
+                resp = self.execute_query(params, query, phase)
+            except Exception as e:
+                if is_too_large(e) and len(rows) > 1:
+                    logging.warning(f"Batch of {len(rows)} rows too large, splitting")
+                    if self.batch_sizer is not None:
+                        self.batch_sizer.record_too_large(rows)
+                    self.__send_halves(query, param_name, rows, phase)
+                    return
+                if not is_retryable(e):
+                    raise
+                if is_throttled(e) and self.batch_sizer:
+                    self.batch_sizer.record_throttle()
+                if attempt < self.retry_policy.max_attempts:
+                    delay = self.retry_policy.delay(attempt)
+                    logging.warning(
+                        f"Attempt {attempt} of a batch of {len(rows)} rows failed ({e}), retrying in {delay:.2f}s"
+                    )
+                    self.record_retry(phase)
+                    time.sleep(delay)
+                    continue
+                logging.error(f"Batch of {len(rows)} rows failed {attempt} times: {e}")
+                raise
+
+            if self.batch_sizer is not None:
+                self.batch_sizer.record_success(len(rows), time.monotonic() - start)
+            record_write(self.graph_identifier)
+            if query.rstrip().endswith(_EDGES_RETURN):
+                self.__check_edges(query, rows, resp)
+            return
+
+    def __check_edges(self, query: str, rows: list, resp: dict):
+        """Checks that a batch of rel_merge_query wrote every edge. An edge is not
+        written when one of its nodes no longer exists, e.g. because the garbage
+        collector deleted it as an orphan while the write cache kept it from being
+        written again. The nodes are forgotten in the write cache, so they are
+        written again the next time the document is.
+
+        Args:
+            query (str): The rel_merge_query
+            rows (list): The rows of the batch
+            resp (dict): The response of the query
+
+        Raises:
+            MissingEndpointsError: Raised if fewer edges were written than sent
+        """
+        results = json.loads(resp["payload"].read())["results"]
+        written = results[0]["edges"] if len(results) > 0 else 0
+        if written >= len(rows):
+            return
+        if self.write_cache is not None:
+            self.write_cache.forget(
+                self.graph_identifier,
+                {r[k] for r in rows for k in ("fromId", "toId")},
+            )
+        raise MissingEndpointsError(query, len(rows), written)
+
+    def __send_halves(self, query: str, param_name: str, rows: list, phase: str):
+        """Sends the two halves of a batch one after the other
+
+        Args:
+            query (str): The UNWIND query to execute
+            param_name (str): The name of the query parameter holding the batch
+            rows (list): The rows of the batch
+            phase (str): The write phase of the batch
+        """
+        middle = len(rows) // 2
+        self._send_batch(query, param_name, rows[:middle], phase)
+        self._send_batch(query, param_name, rows[middle:], phase)
+
+    def execute_query(self, params: map, query: str, phase: str = None) -> map:
+        """Executes an openCypher query, recording its latency and payload size in
+        the metrics, if there are any. Callers that retry a query report each retry
+        with record_retry.
+
         Args:
             params (map): A map of the parameters
             query (str): The query to execute
+            phase (str, optional): The phase the query is recorded under. Defaults to "queries".
+
+        Raises:
+            QueryError: Raised if the response status is not 200, so the failure is retried or reported like any other
 
         Returns:
             map: The response object from the boto3 client
         """
-        if not resp["ResponseMetadata"]["HTTPStatusCode"] == 200:
-            print(f"An error occurred on query: {query}")
-        return resp
+        start = time.monotonic()
+        ok = False
+        try:
+            resp = self.client.execute_query(
+                queryString=query,
+                parameters=params,
+                language="OPEN_CYPHER",
+                graphIdentifier=self.graph_identifier,
+            )
+            if not resp["ResponseMetadata"]["HTTPStatusCode"] == 200:
+                logging.error(
+                    f"Query failed with HTTP status {resp['ResponseMetadata']['HTTPStatusCode']}"
+                )
+                raise QueryError(query, resp)
+            ok = True
+            return resp
+        finally:
+            if self.metrics is not None:
+                self.__record_query(phase or "queries", params, start, ok)
+
+    def publish_generation(self):
+        """Sets the generation of the graph to a new value, so the query caches of
+        every process stop serving the results read before, see
+        query_cache.generation_query. Called once per document, after its batches,
+        whether or not they were all written. A failure is only logged, the caches
+        then see the write once their results expire.
+        """
+        row = {"__id": GENERATION_ID, "generation": uuid.uuid4().hex}
+        try:
+            self.__send_with_retries(
+                node_merge_query(GENERATION_LABEL, ("generation",)),
+                "props",
+                [row],
+                "generation",
+            )
+        except Exception as e:
+            logging.warning(f"Could not publish the write generation: {e}")
+
+    def record_retry(self, phase: str = None):
+        """Records in the metrics, if there are any, that a failed query is retried
+
+        Args:
+            phase (str, optional): The phase the query is recorded under. Defaults to "queries".
+        """
+        if self.metrics is not None:
+            self.metrics.record_retry(phase or "queries")
+
+    def __record_query(self, phase: str, params: map, start: float, ok: bool):
+        """Records a sent query in the metrics
+
+        Args:
+            phase (str): The phase of the query
+            params (map): The parameters, the rows are those of the first list
+            start (float): The time.monotonic() the query was sent at
+            ok (bool): Whether the query succeeded
+        """
+        rows = next((len(v) for v in params.values() if isinstance(v, list)), 0)
+        self.metrics.record_query(
+            phase,
+            rows,
+            len(json.dumps(params, default=str)),
+            time.monotonic() - start,
+            ok=ok,
+        )
 
     def __cleanup_map(self, props: dict) -> dict:
         """This removes all the lists and dict properties from the map
@@ -299,26 +1240,217 @@ class Writer:
                 result[k] = props[k]
         return result
 
-    def __create_property_map_str(self, props: dict, exclude_list: list = []) -> str:
-        """This should not be needed but there is a bug that prevents Maps from working when not strings
+
+class RecordingWriterMixin:
+    """Replaces the openCypher writes of a Writer with calls to a recorder, which
+    collects the node and edge rows instead of sending them to a graph.
+
+    The recorder provides add_nodes(label, rows), add_edges(label, rels) and
+    add_property_edges(label, rels, from_property, to_property, from_label, to_label).
+    """
+
+    def __init__(self, recorder: object) -> None:
+        """Initializes the writer
 
         Args:
-            props (dict): The input dictionary
-            exclude_list (list, optional): The fields to exclude. Defaults to [].
+            recorder (object): The recorder to send the rows to
+        """
+        self.recorder = recorder
+        self.key_index = KeyIndex()
+
+    def write_nodes(
+        self,
+        nodes: object,
+        label: str,
+        keyName: str,
+        create_uuid_if_key_not_exists: bool = False,
+        id: str = None,
+    ):
+        """Records the provided nodes, see Writer.write_nodes"""
+        rows = self._create_node_rows(
+            nodes, label, keyName, create_uuid_if_key_not_exists, id
+        )
+        self.key_index.add(rows, label)
+        self.recorder.add_nodes(label, rows)
+
+    def write_rel(self, rels: list, label: str):
+        """Records the provided relationships, see Writer.write_rel"""
+        self.recorder.add_edges(label, rels)
+
+    def write_rel_match_on_property(
+        self,
+        rels: list,
+        label: str,
+        from_property: str,
+        to_property: str,
+        from_label: str = None,
+        to_label: str = None,
+    ):
+        """Records the provided relationships, see Writer.write_rel_match_on_property"""
+        resolved, unresolved = self._resolve_rels(
+            rels, from_property, to_property, from_label, to_label
+        )
+        self.recorder.add_edges(label, resolved)
+        self.recorder.add_property_edges(
+            label, unresolved, from_property, to_property, from_label, to_label
+        )
+
+
+class DocumentRecord:
+    """The nodes and edges produced by the mapping of a single document, for use as
+    the recorder of a CycloneDXRecordingWriter or SPDXRecordingWriter"""
+
+    def __init__(self) -> None:
+        self.nodes = {}
+        self.edges = set()
+        self.property_edges = set()
+
+    def add_nodes(self, label: str, rows: list):
+        """Adds node rows, merging the properties of rows with the same `~id`
+
+        Args:
+            label (str): The label of the nodes
+            rows (list): The node rows, each with its `~id` in __id
+        """
+        for r in rows:
+            if r["__id"] in self.nodes:
+                self.nodes[r["__id"]][1].update(r)
+            else:
+                self.nodes[r["__id"]] = (label, dict(r))
+
+    def add_edges(self, label: str, rels: list):
+        """Adds edges between `~id`s
+
+        Args:
+            label (str): The label of the edges
+            rels (list): The edges, each with a fromId and toId
+        """
+        for r in rels:
+            self.edges.add((r["fromId"], label, r["toId"]))
+
+    def add_property_edges(
+        self,
+        label: str,
+        rels: list,
+        from_property: str,
+        to_property: str,
+        from_label: str = None,
+        to_label: str = None,
+    ):
+        """Adds edges whose endpoints have to be matched on a property in the graph
+
+        Args:
+            label (str): The label of the edges
+            rels (list): The edges, each with a from and to property value
+            from_property (str): The property to match on the From node
+            to_property (str): The property to match on the To node
+            from_label (str, optional): The label of the From node. Defaults to None.
+            to_label (str, optional): The label of the To node. Defaults to None.
+        """
+        for r in rels:
+            self.property_edges.add(
+                (label, from_property, r["from"], to_property, r["to"], from_label, to_label)
+            )
+
+    def add_vulnerabilities(self, advisories: object):
+        """Adds the Vulnerability nodes and AFFECTS edges of the advisories that match
+        the purls of the recorded Components. Each distinct purl is matched once.
+
+        Args:
+            advisories (AdvisoryIndex): The advisories
+        """
+        component = NodeLabels.COMPONENT.value
+        components = {}
+        for node_id, (label, row) in self.nodes.items():
+            if label == component and row.get("purl") is not None:
+                components.setdefault(row["purl"], []).append(node_id)
+        purls = list(components.keys())
+        matches = advisories.match(purls)
+        if len(matches) == 0:
+            return
+        label = NodeLabels.VULNERABILITY.value
+        self.add_nodes(
+            label,
+            [
+                {"__id": f"{label}_{a}", **advisories.advisories[a]}
+                for a in sorted({a for _, a in matches})
+            ],
+        )
+        affects = [
+            {"fromId": f"{label}_{a}", "toId": c}
+            for i, a in matches
+            for c in components[purls[i]]
+        ]
+        self.add_edges(EdgeLabels.AFFECTS.value, affects)
+        logging.info(
+            f"Matched {len(matches)} advisories to "
+            f"{len({r['toId'] for r in affects})} components"
+        )
+
+    def node_rows(self) -> dict:
+        """Groups the node rows by label
 
         Returns:
-            str: The string of the cleaned input dictionary
+            dict: The node rows of each label, each with its `~id` in __id
         """
-        result = []
-        for k in props.keys():
-            if k not in exclude_list:
-                if type(props[k]) is None:
-                    result.append(f"s.`{k}` = null")
-                elif isinstance(props[k], list) or isinstance(props[k], dict):
-                    pass
-                else:
-                    result.append(f"s.`{k}` = p.`{k}`")
-        return ",".join(result)
+        rows = {}
+        for label, row in self.nodes.values():
+            rows.setdefault(label, []).append(row)
+        return rows
+
+    def edge_rows(self) -> dict:
+        """Groups the edges by label
+
+        Returns:
+            dict: The edges of each label, each with a fromId and toId
+        """
+        rels = {}
+        for f, label, t in self.edges:
+            rels.setdefault(label, []).append({"fromId": f, "toId": t})
+        return rels
+
+    def property_edge_rows(self) -> dict:
+        """Groups the edges matched on properties by how they are matched
+
+        Returns:
+            dict: The edges, each with a from and to value, keyed by (label, from_property, to_property, from_label, to_label)
+        """
+        rels = {}
+        for label, from_p, from_v, to_p, to_v, from_label, to_label in (
+            self.property_edges
+        ):
+            rels.setdefault((label, from_p, to_p, from_label, to_label), []).append(
+                {"from": from_v, "to": to_v}
+            )
+        return rels
+
+    def replay(self, recorder: object):
+        """Sends the nodes and edges to another recorder, see RecordingWriterMixin,
+        e.g. a BulkExportStore
+
+        Args:
+            recorder (object): The recorder
+        """
+        for label, rows in self.node_rows().items():
+            recorder.add_nodes(label, rows)
+        for label, rels in self.edge_rows().items():
+            recorder.add_edges(label, rels)
+        for (label, from_p, to_p, from_label, to_label), rels in (
+            self.property_edge_rows().items()
+        ):
+            recorder.add_property_edges(label, rels, from_p, to_p, from_label, to_label)
+
+    @property
+    def document_id(self) -> str:
+        """The `~id` of the Document node
+
+        Returns:
+            str: The `~id`, or None if the document has not been recorded
+        """
+        for node_id, (label, _) in self.nodes.items():
+            if label == NodeLabels.DOCUMENT.value:
+                return node_id
+        return None
 
 
 class CycloneDXWriter(Writer):
@@ -343,6 +1475,34 @@ class CycloneDXWriter(Writer):
             self.__write_vulnerabilities(bom["vulnerabilities"])
         return True
 
+    def write_document_stream(self, path: str, header: dict = None) -> bool:
+        """Writes the CycloneDX document at the provided path, reading the components,
+        dependencies and vulnerabilities incrementally. All components are written
+        before any dependency or vulnerability edges.
+
+        Args:
+            path (str): The path of the CycloneDX JSON document
+            header (dict, optional): The top-level properties without the streamed arrays, if already read. Defaults to None.
+
+        Returns:
+            bool: True if successful, False if not
+        """
+        if header is None:
+            header = read_header(path, CYCLONEDX_STREAMED_KEYS)
+
+        logging.info("Writing bom metadata")
+        document_id = self.__write_bom(header)
+
+        for batch in iter_array_batches(path, "components", self.stream_batch_size):
+            self.__write_components(batch, document_id)
+        for batch in iter_array_batches(path, "dependencies", self.stream_batch_size):
+            self.__write_dependencies(batch)
+        for batch in iter_array_batches(
+            path, "vulnerabilities", self.stream_batch_size
+        ):
+            self.__write_vulnerabilities(batch)
+        return True
+
     def __write_bom(self, bom):
         """Writes the BOM metadata
 
@@ -420,7 +1580,12 @@ class CycloneDXWriter(Writer):
                 )
 
         self.write_rel_match_on_property(
-            depends_on_edges, EdgeLabels.DEPENDS_ON.value, "purl", "purl"
+            depends_on_edges,
+            EdgeLabels.DEPENDS_ON.value,
+            "purl",
+            "purl",
+            NodeLabels.COMPONENT.value,
+            NodeLabels.COMPONENT.value,
         )
 
     def __write_vulnerabilities(self, vulnerabilities: list):
@@ -444,7 +1609,12 @@ class CycloneDXWriter(Writer):
 
         self.write_nodes(vuls, NodeLabels.VULNERABILITY.value, "id")
         self.write_rel_match_on_property(
-            affects_edges, EdgeLabels.AFFECTS.value, "id", "bom-ref"
+            affects_edges,
+            EdgeLabels.AFFECTS.value,
+            "id",
+            "bom-ref",
+            NodeLabels.VULNERABILITY.value,
+            NodeLabels.COMPONENT.value,
         )
 
 
@@ -464,7 +1634,7 @@ class SPDXWriter(Writer):
 
         if "packages" in bom:
             logging.info("Writing packages as components")
-            self.__write_packages(bom["packages"])
+            self.__write_packages(bom["packages"], document_id)
 
         if "relationships" in bom:
             logging.info("Writing relationships")
@@ -472,6 +1642,34 @@ class SPDXWriter(Writer):
 
         return True
 
+    def write_document_stream(self, path: str, header: dict = None) -> bool:
+        """Writes the SPDX document at the provided path, reading the packages and
+        relationships incrementally. All packages are written before any relationship
+        edges.
+
+        Args:
+            path (str): The path of the SPDX JSON document
+            header (dict, optional): The top-level properties without the streamed arrays, if already read. Defaults to None.
+
+        Returns:
+            bool: True if successful, False if not
+        """
+        if header is None:
+            header = read_header(path, SPDX_STREAMED_KEYS)
+
+        logging.info("Writing bom metadata")
+        document_id = self.__write_bom(header)
+
+        logging.info("Writing packages as components")
+        for batch in iter_array_batches(path, "packages", self.stream_batch_size):
+            self.__write_packages(batch, document_id)
+
+        logging.info("Writing relationships")
+        for batch in iter_array_batches(path, "relationships", self.stream_batch_size):
+            self.__write_relationships(batch, document_id)
+
+        return True
+
     def __write_bom(self, bom: dict) -> str:
         """Write the BOM node
 
@@ -481,7 +1679,11 @@ class SPDXWriter(Writer):
         Returns:
             str: The document id
         """
-        document_id = f"{NodeLabels.DOCUMENT.value}_{uuid.uuid4()}"
+        # The namespace is unique to the document, so a rescan updates the same node
+        if "documentNamespace" in bom:
+            document_id = f"{NodeLabels.DOCUMENT.value}_{bom['documentNamespace']}"
+        else:
+            document_id = f"{NodeLabels.DOCUMENT.value}_{uuid.uuid4()}"
         document = {**bom, **bom["creationInfo"]}
 
         # Do mappings from Cyclone DX to more generic name
@@ -493,11 +1695,14 @@ class SPDXWriter(Writer):
 
         return document_id
 
-    def __write_packages(self, packages: list):
-        """Writes the pacakges of the BOM to the graph
+    def __write_packages(self, packages: list, document_id: str):
+        """Writes the pacakges of the BOM to the graph. Like the CycloneDX components,
+        every package is linked to the document with a DESCRIBES edge, whether or not
+        a relationship mentions it.
 
         Args:
             packages (list): The packages to write
+            document_id (str): The document to link the packages to
         """
         for c in packages:
             if "externalRefs" in c:
@@ -507,6 +1712,11 @@ class SPDXWriter(Writer):
                         break
 
         self.write_nodes(packages, NodeLabels.COMPONENT.value, "name")
+        describes_edges = [
+            {"fromId": document_id, "toId": f"{NodeLabels.COMPONENT.value}_{c['name']}"}
+            for c in packages
+        ]
+        self.write_rel(describes_edges, EdgeLabels.DESCRIBES.value)
 
         logging.info("Writing component -> externalReferences")
         refs = []
@@ -581,23 +1791,80 @@ class SPDXWriter(Writer):
 
         if len(describes_edges) > 0:
             self.write_rel_match_on_property(
-                describes_edges, EdgeLabels.DESCRIBES.value, "~id", "SPDXID"
+                describes_edges,
+                EdgeLabels.DESCRIBES.value,
+                "~id",
+                "SPDXID",
+                NodeLabels.DOCUMENT.value,
+                NodeLabels.COMPONENT.value,
             )
         if len(depends_on_edges) > 0:
             self.write_rel_match_on_property(
-                depends_on_edges, EdgeLabels.DEPENDS_ON.value, "~id", "SPDXID"
+                depends_on_edges,
+                EdgeLabels.DEPENDS_ON.value,
+                "~id",
+                "SPDXID",
+                NodeLabels.DOCUMENT.value,
+                NodeLabels.COMPONENT.value,
             )
         if len(dependency_of_edges) > 0:
             self.write_rel_match_on_property(
-                dependency_of_edges, EdgeLabels.DEPENDS_ON.value, "~id", "SPDXID"
+                dependency_of_edges,
+                EdgeLabels.DEPENDS_ON.value,
+                "~id",
+                "SPDXID",
+                NodeLabels.DOCUMENT.value,
+                NodeLabels.COMPONENT.value,
             )
 
         if len(described_by_edges) > 0:
             self.write_rel_match_on_property(
-                described_by_edges, EdgeLabels.DEPENDS_ON.value, "~id", "SPDXID"
+                described_by_edges,
+                EdgeLabels.DEPENDS_ON.value,
+                "~id",
+                "SPDXID",
+                NodeLabels.DOCUMENT.value,
+                NodeLabels.COMPONENT.value,
             )
 
         if len(contains_edges) > 0:
             self.write_rel_match_on_property(
-                contains_edges, EdgeLabels.DEPENDS_ON.value, "~id", "SPDXID"
+                contains_edges,
+                EdgeLabels.DEPENDS_ON.value,
+                "~id",
+                "SPDXID",
+                NodeLabels.DOCUMENT.value,
+                NodeLabels.COMPONENT.value,
             )
+
+
+class CycloneDXRecordingWriter(RecordingWriterMixin, CycloneDXWriter):
+    pass
+
+
+class SPDXRecordingWriter(RecordingWriterMixin, SPDXWriter):
+    pass
+
+
+def record_sbom(bom: dict, advisories: object = None) -> DocumentRecord:
+    """Maps an SBOM to its nodes and edges without writing them anywhere
+
+    Args:
+        bom (dict): The dict of the SBOM
+        advisories (AdvisoryIndex, optional): Advisories to add the Vulnerabilities of the components from. Defaults to None.
+
+    Returns:
+        DocumentRecord: The nodes and edges of the document, or None if the format is unknown
+    """
+    bom_type = determine_bom_type(bom)
+    record = DocumentRecord()
+    if bom_type == BomType.CYDX:
+        CycloneDXRecordingWriter(record).write_document(bom)
+    elif bom_type == BomType.SPDX:
+        SPDXRecordingWriter(record).write_document(bom)
+    else:
+        logging.warning("Unknown SBOM format")
+        return None
+    if advisories is not None:
+        record.add_vulnerabilities(advisories)
+    return record
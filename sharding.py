@@ -0,0 +1,461 @@
+import hashlib
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from journal import IngestJournal
+from query_cache import GENERATION_INTERVAL, QueryCache
+from sbom_query import SBOMQueryClient, _check_depth
+from sbom_stream import read_header
+from sbom_writer import (
+    BATCH_SIZE,
+    CYCLONEDX_STREAMED_KEYS,
+    SPDX_STREAMED_KEYS,
+    BomType,
+    determine_bom_type,
+)
+from spdx_tagvalue import SBOMFileFormat, detect_file_format, load_sbom
+
+
+class PartitionKey:
+    NAMESPACE = "namespace"
+    ARTIFACT = "artifact"
+    ACCOUNT = "account"
+
+
+def _namespace(bom: dict, bom_type: BomType) -> str:
+    """Gets the document namespace: the CycloneDX serialNumber or SPDX documentNamespace"""
+    if bom_type == BomType.CYDX:
+        return bom.get("serialNumber")
+    if bom_type == BomType.SPDX:
+        return bom.get("documentNamespace")
+    return None
+
+
+def _artifact(bom: dict, bom_type: BomType) -> str:
+    """Gets the artifact name, the `name` of the Document node: the CycloneDX metadata
+    component name or the SPDX document name"""
+    if bom_type == BomType.CYDX:
+        return bom.get("metadata", {}).get("component", {}).get("name")
+    if bom_type == BomType.SPDX:
+        return bom.get("name")
+    return None
+
+
+def _account(bom: dict, bom_type: BomType) -> str:
+    """Gets the organization that owns the document: the CycloneDX metadata supplier
+    or manufacturer, or the first SPDX Organization creator"""
+    if bom_type == BomType.CYDX:
+        metadata = bom.get("metadata", {})
+        for owner in (
+            metadata.get("supplier"),
+            metadata.get("manufacturer"),
+            metadata.get("manufacture"),
+            metadata.get("component", {}).get("supplier"),
+        ):
+            if isinstance(owner, dict) and owner.get("name"):
+                return owner["name"]
+    elif bom_type == BomType.SPDX:
+        for creator in bom.get("creationInfo", {}).get("creators", []):
+            kind, _, name = creator.partition(":")
+            if kind.strip() == "Organization" and name.strip():
+                return name.strip()
+    return None
+
+
+# Each partition key, followed by the keys it falls back to when a document has none
+_PARTITION_KEYS = {
+    PartitionKey.NAMESPACE: (_namespace,),
+    PartitionKey.ARTIFACT: (_artifact, _namespace),
+    PartitionKey.ACCOUNT: (_account, _artifact, _namespace),
+}
+
+
+def partition_key(bom: dict, partition: str = PartitionKey.ARTIFACT) -> str:
+    """Gets the partition key of a document. The account falls back to the artifact,
+    and the artifact to the namespace, for documents that do not have them.
+
+    Args:
+        bom (dict): The document, or only its header (see sbom_stream.read_header)
+        partition (str, optional): A PartitionKey. Defaults to PartitionKey.ARTIFACT.
+
+    Raises:
+        ValueError: Raised if the partition is not a PartitionKey
+
+    Returns:
+        str: The key, or None if the document has none of them
+    """
+    if partition not in _PARTITION_KEYS:
+        raise ValueError(f"Unknown partition key {partition}")
+    bom_type = determine_bom_type(bom)
+    for key in _PARTITION_KEYS[partition]:
+        value = key(bom, bom_type)
+        if value:
+            return f"{partition}:{value}"
+    return None
+
+
+def content_key(bom: dict) -> str:
+    """Gets a key derived from the content of a document, to route the documents that
+    have no partition key and were not read from a file by
+
+    Args:
+        bom (dict): The document
+
+    Returns:
+        str: The key, the same for documents with the same content
+    """
+    data = json.dumps(bom, sort_keys=True, default=str).encode("utf-8")
+    return f"content:{hashlib.sha1(data).hexdigest()}"
+
+
+class ShardRouter:
+    """Maps partition keys to graph identifiers with rendezvous hashing.
+
+    Every key goes to the graph with the highest hash of (graph, key), so the
+    mapping only depends on the key and the set of graphs. Adding a graph moves only
+    the keys that now hash highest on it, and removing one moves only its keys.
+    """
+
+    def __init__(self, graph_identifiers: list) -> None:
+        """Creates the router
+
+        Args:
+            graph_identifiers (list): The graph identifiers of the shards
+
+        Raises:
+            ValueError: Raised if there are no graph identifiers
+        """
+        if len(graph_identifiers) == 0:
+            raise ValueError("At least one graph identifier is required")
+        self.graph_identifiers = list(dict.fromkeys(graph_identifiers))
+
+    def route(self, key: str) -> str:
+        """Gets the graph a partition key belongs to
+
+        Args:
+            key (str): The partition key
+
+        Returns:
+            str: The graph identifier
+        """
+        return max(
+            self.graph_identifiers,
+            key=lambda g: hashlib.sha1(f"{g}/{key}".encode("utf-8")).digest(),
+        )
+
+
+def scatter_gather(shards: dict, function, max_workers: int = None) -> dict:
+    """Calls a function for every shard in parallel and gathers the results
+
+    Args:
+        shards (dict): The shards by graph identifier, e.g. writers or query clients
+        function (callable): Called with each shard
+        max_workers (int, optional): The number of shards called at once. Defaults to one thread per shard.
+
+    Returns:
+        dict: The result of each graph identifier
+    """
+    if len(shards) == 1:
+        return {g: function(s) for g, s in shards.items()}
+    with ThreadPoolExecutor(max_workers=max_workers or len(shards)) as executor:
+        futures = {g: executor.submit(function, s) for g, s in shards.items()}
+        return {g: f.result() for g, f in futures.items()}
+
+
+class ShardedSBOMWriter:
+    """Spreads documents across several graphs, one NeptuneAnalyticsSBOMWriter per
+    graph, by a stable partition key (see PartitionKey and ShardRouter).
+
+    Each document is written in full to its shard, Components included, so the
+    Components shared by documents on different shards are written to every shard
+    that has a document containing them. They get the same `~id` and properties on
+    each, and the edges of a document, including those matched on purl or bom-ref,
+    always resolve within its own shard.
+    """
+
+    def __init__(
+        self,
+        writers: list,
+        partition: str = PartitionKey.ARTIFACT,
+        wrap=None,
+    ) -> None:
+        """Creates the sharded writer
+
+        Args:
+            writers (list): The NeptuneAnalyticsSBOMWriter of each graph, each with its own client or sharing one
+            partition (str, optional): The PartitionKey documents are routed by. Defaults to PartitionKey.ARTIFACT.
+            wrap (callable, optional): Wraps the writer of each shard, e.g. in a CoalescingSBOMWriter or IncrementalSBOMWriter. Defaults to None.
+
+        Raises:
+            ValueError: Raised if the partition is not a PartitionKey
+        """
+        if partition not in _PARTITION_KEYS:
+            raise ValueError(f"Unknown partition key {partition}")
+        self.partition = partition
+        self.writers = {w.graph_identifier: w for w in writers}
+        self.shards = {g: wrap(w) if wrap else w for g, w in self.writers.items()}
+        self.router = ShardRouter(list(self.writers))
+        self.documents = {g: 0 for g in self.writers}
+        self.__lock = threading.Lock()
+
+    def shard_for(self, bom: dict, fallback_key: str = None) -> str:
+        """Gets the graph a document is written to. Documents without a partition key
+        are routed by their content, so a document written again goes to the same
+        shard.
+
+        Args:
+            bom (dict): The document, or only its header
+            fallback_key (str, optional): The key used if the document has no partition key. Defaults to the content_key of bom.
+
+        Returns:
+            str: The graph identifier
+        """
+        key = partition_key(bom, self.partition)
+        if key is None:
+            logging.warning(
+                f"The document has no {self.partition} key, routing it by its content"
+            )
+            key = fallback_key or content_key(bom)
+        return self.router.route(key)
+
+    def write_sbom(
+        self, bom: dict, document_key: str = None, path: str = None
+    ) -> bool:
+        """Writes out the SBOM to its shard
+
+        Args:
+            bom (dict): The dict of the SBOM
+            document_key (str, optional): Identifies the document in the journal, e.g. the hash of its file. Defaults to None.
+            path (str, optional): The file the SBOM was read from. Without a partition key, the document is routed by the file's content hash, like write_sbom_stream does. Defaults to None.
+
+        Returns:
+            bool: True if successful, False if not
+        """
+        graph_identifier = self.shard_for(bom, self.__file_key(bom, path))
+        self.__count(graph_identifier)
+        logging.info(f"Routing the document to {graph_identifier}")
+        kwargs = {} if document_key is None else {"document_key": document_key}
+        return self.shards[graph_identifier].write_sbom(bom, **kwargs)
+
+    def write_sbom_stream(self, path: str, document_key: str = None) -> bool:
+        """Writes out the SBOM file at the provided path to its shard, routing it by its
+        header so the file is not loaded into memory
+
+        Args:
+            path (str): The path of the JSON or SPDX tag-value SBOM file
+            document_key (str, optional): Identifies the document in the journal, e.g. the hash of its file. Defaults to None.
+
+        Returns:
+            bool: True if successful, False if not
+        """
+        if detect_file_format(path) == SBOMFileFormat.TAG_VALUE:
+            return self.write_sbom(load_sbom(path), document_key, path)
+        header = read_header(path, CYCLONEDX_STREAMED_KEYS | SPDX_STREAMED_KEYS)
+        graph_identifier = self.shard_for(header, self.__file_key(header, path))
+        self.__count(graph_identifier)
+        logging.info(f"Routing {path} to {graph_identifier}")
+        return self.shards[graph_identifier].write_sbom_stream(path, document_key)
+
+    def flush(self):
+        """Flushes the shards that buffer rows, e.g. CoalescingSBOMWriters"""
+        scatter_gather(
+            {g: s for g, s in self.shards.items() if hasattr(s, "flush")},
+            lambda s: s.flush(),
+        )
+
+    def discard(self) -> list:
+        """Drops the rows buffered by the shards that buffer rows, see
+        CoalescingSBOMWriter.discard
+
+        Returns:
+            list: The document_key of each document whose rows were dropped
+        """
+        return [
+            key
+            for s in self.shards.values()
+            if hasattr(s, "discard")
+            for key in s.discard()
+        ]
+
+    def close(self):
+        """Closes the shards that need it, e.g. CoalescingSBOMWriters"""
+        scatter_gather(
+            {g: s for g, s in self.shards.items() if hasattr(s, "close")},
+            lambda s: s.close(),
+        )
+
+    def __file_key(self, bom: dict, path: str) -> str:
+        """Gets the key a document without a partition key is routed by when it was
+        read from a file: the content hash of the file, the same whether the file is
+        loaded or streamed
+
+        Args:
+            bom (dict): The document, or only its header
+            path (str): The path of the file, or None
+
+        Returns:
+            str: The key, or None if the document has a partition key or no file
+        """
+        if path is None or partition_key(bom, self.partition) is not None:
+            return None
+        return f"content:{IngestJournal.hash_file(path)}"
+
+    def __count(self, graph_identifier: str):
+        """Counts a document routed to a shard
+
+        Args:
+            graph_identifier (str): The graph identifier of the shard
+        """
+        with self.__lock:
+            self.documents[graph_identifier] += 1
+
+
+class ShardedQueryClient:
+    """Answers the questions of SBOMQueryClient across every shard of a
+    ShardedSBOMWriter, by asking all the shards in parallel and merging the results
+    of each key.
+
+    Documents and the edges from them live on one shard, so lookups of Documents
+    and Vulnerabilities are the union of the shards' answers. Vulnerabilities listed
+    in a CycloneDX document are only on that document's shard, while those added
+    from advisories are on every shard with the affected Component. Dependencies
+    and dependents are followed one DEPENDS_ON edge at a time across all the shards,
+    so paths that continue on another shard through a shared Component are found.
+    """
+
+    def __init__(
+        self,
+        writer: ShardedSBOMWriter,
+        cache: QueryCache = None,
+        batch_size: int = BATCH_SIZE,
+        generation_interval: float = GENERATION_INTERVAL,
+    ) -> None:
+        """Creates the query client
+
+        Args:
+            writer (ShardedSBOMWriter): The sharded writer, or a list of NeptuneAnalyticsSBOMWriters
+            cache (QueryCache, optional): Caches the results of each key per shard. Defaults to None.
+            batch_size (int, optional): The number of keys per request. Defaults to BATCH_SIZE.
+            generation_interval (float, optional): The seconds the write generation read from each shard is trusted for. Defaults to GENERATION_INTERVAL.
+        """
+        writers = (
+            writer.writers.values() if isinstance(writer, ShardedSBOMWriter) else writer
+        )
+        self.clients = {
+            w.graph_identifier: SBOMQueryClient(
+                w, cache, batch_size, generation_interval
+            )
+            for w in writers
+        }
+
+    @property
+    def requests(self) -> int:
+        """The number of requests sent to all the shards"""
+        return sum(c.requests for c in self.clients.values())
+
+    def documents_with_purls(self, purls: list) -> dict:
+        """Finds the Documents containing a Component with each purl, on every shard
+
+        Args:
+            purls (list): The purls
+
+        Returns:
+            dict: The list of Document `~id`s of each purl
+        """
+        return self.__gather(lambda c: c.documents_with_purls(purls))
+
+    def documents_affected_by(self, vulnerability_ids: list, max_depth: int = 0) -> dict:
+        """Finds the Documents affected by each vulnerability, on every shard
+
+        Args:
+            vulnerability_ids (list): The ids of the vulnerabilities, e.g. CVE ids
+            max_depth (int, optional): The number of DEPENDS_ON edges to follow from an affected Component. Defaults to 0 (directly affected only).
+
+        Returns:
+            dict: The list of Document `~id`s of each vulnerability id
+        """
+        return self.__gather(lambda c: c.documents_affected_by(vulnerability_ids, max_depth))
+
+    def vulnerabilities_of(self, purls: list) -> dict:
+        """Finds the Vulnerabilities affecting the Component with each purl, on every
+        shard
+
+        Args:
+            purls (list): The purls
+
+        Returns:
+            dict: The list of vulnerability ids of each purl
+        """
+        return self.__gather(lambda c: c.vulnerabilities_of(purls))
+
+    def dependencies(self, purls: list, max_depth: int = 3) -> dict:
+        """Finds the Components each purl depends on, directly or transitively, across
+        the shards
+
+        Args:
+            purls (list): The purls
+            max_depth (int, optional): The number of DEPENDS_ON edges to follow. Defaults to 3.
+
+        Returns:
+            dict: The list of dependency purls of each purl
+        """
+        return self.__reachable(purls, max_depth, lambda c, keys: c.dependencies(keys, 1))
+
+    def dependents(self, purls: list, max_depth: int = 3) -> dict:
+        """Finds the Components depending on each purl, directly or transitively,
+        across the shards
+
+        Args:
+            purls (list): The purls
+            max_depth (int, optional): The number of DEPENDS_ON edges to follow. Defaults to 3.
+
+        Returns:
+            dict: The list of dependent purls of each purl
+        """
+        return self.__reachable(purls, max_depth, lambda c, keys: c.dependents(keys, 1))
+
+    def __gather(self, lookup) -> dict:
+        """Runs a lookup on every shard and merges the values of each key
+
+        Args:
+            lookup (callable): Called with the SBOMQueryClient of each shard
+
+        Returns:
+            dict: The sorted, de-duplicated values of each key
+        """
+        merged = {}
+        for results in scatter_gather(self.clients, lookup).values():
+            for key, values in results.items():
+                merged.setdefault(key, set()).update(values)
+        return {k: sorted(v) for k, v in merged.items()}
+
+    def __reachable(self, purls: list, max_depth: int, step) -> dict:
+        """Follows DEPENDS_ON edges from the purls one edge at a time, asking every
+        shard for the next edge of all the purls reached so far
+
+        Args:
+            purls (list): The purls
+            max_depth (int): The number of DEPENDS_ON edges to follow
+            step (callable): Looks up the purls one edge away on a shard, called with the SBOMQueryClient and the purls
+
+        Returns:
+            dict: The sorted purls reachable from each purl
+        """
+        max_depth = _check_depth(max_depth, 1)
+        reached = {p: set() for p in purls}
+        # purl -> the purls it was reached from
+        frontier = {p: {p} for p in reached}
+        for _ in range(max_depth):
+            if len(frontier) == 0:
+                break
+            neighbors = self.__gather(lambda c: step(c, list(frontier)))
+            next_frontier = {}
+            for purl, origins in frontier.items():
+                for neighbor in neighbors.get(purl, ()):
+                    for origin in origins:
+                        if neighbor not in reached[origin]:
+                            reached[origin].add(neighbor)
+                            next_frontier.setdefault(neighbor, set()).add(origin)
+            frontier = next_frontier
+        return {p: sorted(v) for p, v in reached.items()}
@@ -0,0 +1,323 @@
+import json
+import logging
+
+SNIFF_SIZE = 4096
+
+SBOM_EXTENSIONS = (".json", ".txt", ".spdx")
+
+
+class SBOMFileFormat:
+    JSON = "json"
+    TAG_VALUE = "tag-value"
+    UNKNOWN = "unknown"
+
+
+# Tags mapped to a property of the document, or of its creationInfo
+DOCUMENT_TAGS = {
+    "SPDXVersion": "spdxVersion",
+    "DataLicense": "dataLicense",
+    "SPDXID": "SPDXID",
+    "DocumentName": "name",
+    "DocumentNamespace": "documentNamespace",
+    "DocumentComment": "comment",
+}
+CREATION_INFO_TAGS = {
+    "Created": "created",
+    "CreatorComment": "comment",
+    "LicenseListVersion": "licenseListVersion",
+}
+
+PACKAGE_TAGS = {
+    "PackageName": "name",
+    "SPDXID": "SPDXID",
+    "PackageVersion": "versionInfo",
+    "PackageFileName": "packageFileName",
+    "PackageSupplier": "supplier",
+    "PackageOriginator": "originator",
+    "PackageDownloadLocation": "downloadLocation",
+    "PackageHomePage": "homepage",
+    "PackageSourceInfo": "sourceInfo",
+    "PackageLicenseConcluded": "licenseConcluded",
+    "PackageLicenseDeclared": "licenseDeclared",
+    "PackageLicenseComments": "licenseComments",
+    "PackageCopyrightText": "copyrightText",
+    "PackageSummary": "summary",
+    "PackageDescription": "description",
+    "PackageComment": "comment",
+    "PrimaryPackagePurpose": "primaryPackagePurpose",
+    "ReleaseDate": "releaseDate",
+    "BuiltDate": "builtDate",
+    "ValidUntilDate": "validUntilDate",
+}
+PACKAGE_LIST_TAGS = {
+    "PackageLicenseInfoFromFiles": "licenseInfoFromFiles",
+    "PackageAttributionText": "attributionTexts",
+}
+
+FILE_TAGS = {
+    "FileName": "fileName",
+    "SPDXID": "SPDXID",
+    "LicenseConcluded": "licenseConcluded",
+    "LicenseComments": "licenseComments",
+    "FileCopyrightText": "copyrightText",
+    "FileComment": "comment",
+    "FileNotice": "noticeText",
+}
+FILE_LIST_TAGS = {
+    "FileType": "fileTypes",
+    "LicenseInfoInFile": "licenseInfoInFiles",
+    "FileContributor": "fileContributors",
+    "FileAttributionText": "attributionTexts",
+}
+
+LICENSE_TAGS = {
+    "LicenseID": "licenseId",
+    "ExtractedText": "extractedText",
+    "LicenseName": "name",
+    "LicenseComment": "comment",
+}
+
+ANNOTATION_TAGS = {
+    "Annotator": "annotator",
+    "AnnotationDate": "annotationDate",
+    "AnnotationType": "annotationType",
+    "AnnotationComment": "comment",
+}
+
+# The tags that start a new element, and the top-level array the element is added to
+SECTION_TAGS = {
+    "PackageName": "packages",
+    "FileName": "files",
+    "SnippetSPDXID": "snippets",
+    "LicenseID": "hasExtractedLicensingInfos",
+}
+
+
+def iter_tag_values(lines):
+    """Tokenizes SPDX tag-value lines into (tag, value) pairs. Blank lines and
+    comments are skipped, and <text>...</text> values may span several lines.
+
+    Args:
+        lines (iterable): The lines of the document, e.g. a text file object
+
+    Yields:
+        tuple: The tag and its value, without surrounding whitespace or <text> tags
+    """
+    text_tag = None
+    text = []
+    for line in lines:
+        if text_tag is not None:
+            end = line.find("</text>")
+            if end < 0:
+                text.append(line)
+                continue
+            text.append(line[:end])
+            yield text_tag, "".join(text).strip()
+            text_tag = None
+            continue
+
+        tag, sep, value = line.partition(":")
+        if not sep:
+            line = line.strip()
+            if line and line[0] != "#":
+                logging.warning(f"Skipping SPDX tag-value line without a tag: {line}")
+            continue
+        tag = tag.strip()
+        if tag[:1] == "#":
+            continue
+        value = value.strip()
+        if value[:6] == "<text>":
+            value = value[len("<text>") :]
+            end = value.find("</text>")
+            if end < 0:
+                text_tag = tag
+                text = [value, "\n"]
+                continue
+            value = value[:end]
+        yield tag, value
+
+    if text_tag is not None:
+        raise ValueError(f"Unterminated <text> value of {text_tag}")
+
+
+def _checksum(value: str) -> dict:
+    """Parses a checksum value such as `SHA1: 85ed0817af83a24ad8da68c2b5094de69833983c`
+
+    Args:
+        value (str): The value
+
+    Returns:
+        dict: The algorithm and checksumValue
+    """
+    algorithm, _, checksum = value.partition(":")
+    return {"algorithm": algorithm.strip(), "checksumValue": checksum.strip()}
+
+
+def _verification_code(value: str) -> dict:
+    """Parses a package verification code, with its optional `(excludes: ...)` files
+
+    Args:
+        value (str): The value
+
+    Returns:
+        dict: The packageVerificationCodeValue and packageVerificationCodeExcludedFiles
+    """
+    code, _, excludes = value.partition("(")
+    result = {"packageVerificationCodeValue": code.strip()}
+    excludes = excludes.rstrip(")").partition(":")[2].strip()
+    if excludes:
+        result["packageVerificationCodeExcludedFiles"] = [
+            e.strip() for e in excludes.split(",")
+        ]
+    return result
+
+
+def parse_tag_value(lines) -> dict:
+    """Parses an SPDX 2.x tag-value document into the structure of the equivalent
+    SPDX JSON document, as read by the SPDXWriter. The lines are read one at a time.
+
+    Args:
+        lines (iterable): The lines of the document, e.g. a text file object
+
+    Raises:
+        ValueError: Raised if the document has no SPDXVersion
+
+    Returns:
+        dict: The document
+    """
+    bom = {"creationInfo": {}}
+    element = bom
+    section = None
+    for tag, value in iter_tag_values(lines):
+        if tag in SECTION_TAGS:
+            section = SECTION_TAGS[tag]
+            element = {}
+            bom.setdefault(section, []).append(element)
+        elif section == "packages" and tag in PACKAGE_TAGS:
+            # Most of the lines of a document are package properties
+            element[PACKAGE_TAGS[tag]] = value
+            continue
+
+        if tag == "Relationship":
+            parts = value.split()
+            if len(parts) != 3:
+                logging.warning(f"Skipping malformed relationship: {value}")
+                continue
+            bom.setdefault("relationships", []).append(
+                {
+                    "spdxElementId": parts[0],
+                    "relationshipType": parts[1],
+                    "relatedSpdxElement": parts[2],
+                }
+            )
+        elif tag == "RelationshipComment":
+            if bom.get("relationships"):
+                bom["relationships"][-1]["comment"] = value
+        elif tag in ANNOTATION_TAGS or tag == "SPDXREF":
+            if tag == "Annotator":
+                bom.setdefault("annotations", []).append({})
+            if bom.get("annotations"):
+                annotation = bom["annotations"][-1]
+                annotation[ANNOTATION_TAGS.get(tag, "spdxElementId")] = value
+        elif section is None:
+            if tag in DOCUMENT_TAGS:
+                bom[DOCUMENT_TAGS[tag]] = value
+            elif tag in CREATION_INFO_TAGS:
+                bom["creationInfo"][CREATION_INFO_TAGS[tag]] = value
+            elif tag == "Creator":
+                bom["creationInfo"].setdefault("creators", []).append(value)
+            elif tag == "ExternalDocumentRef":
+                ref_id, document, checksum = (value.split(None, 2) + ["", ""])[:3]
+                bom.setdefault("externalDocumentRefs", []).append(
+                    {
+                        "externalDocumentId": ref_id,
+                        "spdxDocument": document,
+                        "checksum": _checksum(checksum),
+                    }
+                )
+        elif section == "packages":
+            if tag in PACKAGE_TAGS:
+                element[PACKAGE_TAGS[tag]] = value
+            elif tag in PACKAGE_LIST_TAGS:
+                element.setdefault(PACKAGE_LIST_TAGS[tag], []).append(value)
+            elif tag == "FilesAnalyzed":
+                element["filesAnalyzed"] = value.lower() == "true"
+            elif tag == "PackageChecksum":
+                element.setdefault("checksums", []).append(_checksum(value))
+            elif tag == "PackageVerificationCode":
+                element["packageVerificationCode"] = _verification_code(value)
+            elif tag == "ExternalRef":
+                category, ref_type, locator = (value.split(None, 2) + ["", ""])[:3]
+                element.setdefault("externalRefs", []).append(
+                    {
+                        "referenceCategory": category.replace("_", "-"),
+                        "referenceType": ref_type,
+                        "referenceLocator": locator,
+                    }
+                )
+            elif tag == "ExternalRefComment":
+                if element.get("externalRefs"):
+                    element["externalRefs"][-1]["comment"] = value
+        elif section == "files":
+            if tag in FILE_TAGS:
+                element[FILE_TAGS[tag]] = value
+            elif tag in FILE_LIST_TAGS:
+                element.setdefault(FILE_LIST_TAGS[tag], []).append(value)
+            elif tag == "FileChecksum":
+                element.setdefault("checksums", []).append(_checksum(value))
+        elif section == "hasExtractedLicensingInfos":
+            if tag in LICENSE_TAGS:
+                element[LICENSE_TAGS[tag]] = value
+            elif tag == "LicenseCrossReference":
+                element.setdefault("seeAlsos", []).append(value)
+        elif section == "snippets" and tag == "SnippetSPDXID":
+            element["SPDXID"] = value
+
+    if "spdxVersion" not in bom:
+        raise ValueError("The document has no SPDXVersion tag")
+    return bom
+
+
+def detect_file_format(path: str) -> str:
+    """Determines the format of an SBOM file from its first characters, without
+    reading the whole file
+
+    Args:
+        path (str): The path of the file
+
+    Returns:
+        str: SBOMFileFormat.JSON, SBOMFileFormat.TAG_VALUE or SBOMFileFormat.UNKNOWN
+    """
+    with open(path, encoding="utf-8-sig") as fp:
+        head = fp.read(SNIFF_SIZE)
+    for line in head.lstrip().splitlines():
+        if line.startswith(("{", "[")):
+            return SBOMFileFormat.JSON
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        tag, sep, _ = line.partition(":")
+        if sep and tag.strip().isalnum():
+            return SBOMFileFormat.TAG_VALUE
+        break
+    return SBOMFileFormat.UNKNOWN
+
+
+def load_sbom(path: str) -> dict:
+    """Loads a JSON or SPDX tag-value SBOM file
+
+    Args:
+        path (str): The path of the file
+
+    Raises:
+        ValueError: Raised if the file is in neither format
+
+    Returns:
+        dict: The document, tag-value documents in the structure of SPDX JSON
+    """
+    file_format = detect_file_format(path)
+    with open(path, encoding="utf-8-sig") as fp:
+        if file_format == SBOMFileFormat.JSON:
+            return json.load(fp)
+        elif file_format == SBOMFileFormat.TAG_VALUE:
+            return parse_tag_value(fp)
+    raise ValueError("Unknown SBOM file format")
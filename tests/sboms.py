@@ -0,0 +1,122 @@
+"""Small SBOM documents shared by the tests"""
+
+import os
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(__file__)), "examples")
+
+
+def cyclonedx(
+    serial: str = "urn:uuid:1",
+    name: str = "app",
+    components: list = None,
+    dependencies: list = None,
+    vulnerabilities: list = None,
+) -> dict:
+    """Creates a CycloneDX document
+
+    Args:
+        serial (str, optional): The serialNumber. Defaults to "urn:uuid:1".
+        name (str, optional): The name of the metadata component. Defaults to "app".
+        components (list, optional): The components. Defaults to a, b and c, with a depending on b.
+        dependencies (list, optional): The dependencies. Defaults to a -> b.
+        vulnerabilities (list, optional): The vulnerabilities. Defaults to None.
+
+    Returns:
+        dict: The document
+    """
+    if components is None:
+        components = [component("a"), component("b"), component("c")]
+    if dependencies is None:
+        dependencies = [depends("a", "b")]
+    bom = {
+        "bomFormat": "CycloneDX",
+        "specVersion": "1.4",
+        "serialNumber": serial,
+        "version": 1,
+        "metadata": {
+            "timestamp": "2024-01-01T00:00:00Z",
+            "component": {"name": name, "type": "application"},
+        },
+        "components": components,
+        "dependencies": dependencies,
+    }
+    if vulnerabilities is not None:
+        bom["vulnerabilities"] = vulnerabilities
+    return bom
+
+
+def component(name: str, **props) -> dict:
+    """Creates a CycloneDX component with a purl and bom-ref derived from its name
+
+    Args:
+        name (str): The name
+
+    Returns:
+        dict: The component
+    """
+    return {
+        "name": name,
+        "version": "1.0",
+        "purl": f"pkg:pypi/{name}@1.0",
+        "bom-ref": f"pkg:pypi/{name}@1.0",
+        **props,
+    }
+
+
+def depends(name: str, *on: str) -> dict:
+    """Creates a CycloneDX dependency between components created by component()
+
+    Args:
+        name (str): The name of the dependent component
+        on (str): The names of the components it depends on
+
+    Returns:
+        dict: The dependency
+    """
+    return {
+        "ref": f"pkg:pypi/{name}@1.0",
+        "dependsOn": [f"pkg:pypi/{o}@1.0" for o in on],
+    }
+
+
+def spdx(namespace: str = "https://example.com/app-1", packages: list = None) -> dict:
+    """Creates an SPDX document describing its packages
+
+    Args:
+        namespace (str, optional): The documentNamespace. Defaults to "https://example.com/app-1".
+        packages (list, optional): The package names. Defaults to a and b.
+
+    Returns:
+        dict: The document
+    """
+    packages = packages or ["a", "b"]
+    return {
+        "spdxVersion": "SPDX-2.3",
+        "SPDXID": "SPDXRef-DOCUMENT",
+        "name": "app",
+        "documentNamespace": namespace,
+        "creationInfo": {"created": "2024-01-01T00:00:00Z"},
+        "packages": [
+            {
+                "name": p,
+                "SPDXID": f"SPDXRef-{p}",
+                "versionInfo": "1.0",
+                "externalRefs": [
+                    {
+                        "referenceCategory": "PACKAGE-MANAGER",
+                        "referenceType": "purl",
+                        "referenceLocator": f"pkg:pypi/{p}@1.0",
+                    }
+                ],
+            }
+            for p in packages
+        ],
+        "relationships": [
+            {
+                "spdxElementId": "SPDXRef-DOCUMENT",
+                "relationshipType": "DESCRIBES",
+                "relatedSpdxElement": f"SPDXRef-{p}",
+            }
+            for p in packages
+        ],
+    }
@@ -0,0 +1,44 @@
+import asyncio
+import time
+from async_writer import AsyncSBOMWriter
+from benchmarks.fake_neptune import FakeNeptuneGraphClient
+from sbom_writer import NeptuneAnalyticsSBOMWriter
+from tests.sboms import cyclonedx, spdx
+
+
+def test_writes_documents():
+    client = FakeNeptuneGraphClient()
+
+    async def run():
+        async with AsyncSBOMWriter(
+            NeptuneAnalyticsSBOMWriter("g", "local", client=client)
+        ) as writer:
+            return await writer.write_sboms([cyclonedx("urn:A"), spdx()])
+
+    assert asyncio.run(run()) == [True, True]
+    assert ("Component_a", "DEPENDS_ON", "Component_b") in client.edges
+    assert "Document_https://example.com/app-1" in client.nodes
+
+
+def test_exit_does_not_block_the_event_loop():
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    async def run():
+        writer = AsyncSBOMWriter(
+            NeptuneAnalyticsSBOMWriter("g", "local", client=FakeNeptuneGraphClient())
+        )
+        task = asyncio.create_task(ticker())
+        async with writer:
+            # A blocking call still in progress when the block exits
+            writer._AsyncSBOMWriter__executor.submit(time.sleep, 0.3)
+            await asyncio.sleep(0)
+            start = len(ticks)
+        task.cancel()
+        return len(ticks) - start
+
+    assert asyncio.run(run()) >= 5
@@ -0,0 +1,106 @@
+import threading
+import pytest
+from batching import AdaptiveBatchSizer, RetryPolicy, is_retryable, is_throttled
+from benchmarks.fake_neptune import FakeClientError, FakeNeptuneGraphClient
+from sbom_writer import BatchWriteError, NeptuneAnalyticsSBOMWriter, QueryError, Writer
+from tests.sboms import component, cyclonedx
+
+NO_DELAY = RetryPolicy(max_attempts=3, base_delay=0, max_delay=0)
+
+
+def rows(count: int) -> list:
+    return [{"__id": f"Component_{i}", "name": str(i)} for i in range(count)]
+
+
+def test_non_200_response_raises():
+    client = FakeNeptuneGraphClient(error_rate=1.0, error_status=400)
+    writer = Writer("g", client, retry_policy=NO_DELAY)
+    with pytest.raises(QueryError):
+        writer.write_node_rows(rows(1), "Component")
+    # A 400 is not retried
+    assert client.requests == 1
+
+
+def test_5xx_response_is_retried():
+    client = FakeNeptuneGraphClient(error_rate=1.0, error_status=503)
+    writer = Writer("g", client, retry_policy=NO_DELAY)
+    with pytest.raises(QueryError):
+        writer.write_node_rows(rows(1), "Component")
+    assert client.requests == NO_DELAY.max_attempts
+
+
+def test_throttled_batch_fails_without_splitting():
+    client = FakeNeptuneGraphClient(error_rate=1.0)
+    writer = Writer("g", client, retry_policy=NO_DELAY)
+    with pytest.raises(FakeClientError):
+        writer.write_node_rows(rows(8), "Component")
+    assert client.requests == NO_DELAY.max_attempts
+    assert client.count_nodes() == 0
+
+
+def test_throttled_phase_fails_with_workers():
+    client = FakeNeptuneGraphClient(error_rate=1.0)
+    writer = Writer("g", client, max_workers=4, retry_policy=NO_DELAY)
+    writer.batch_size = 2
+    with pytest.raises(BatchWriteError) as error:
+        writer.write_node_rows(rows(8), "Component")
+    assert len(error.value.failures) == 4
+    assert client.requests == 4 * NO_DELAY.max_attempts
+
+
+def test_too_large_batch_is_split():
+    client = FakeNeptuneGraphClient(max_request_rows=3)
+    writer = Writer("g", client, retry_policy=NO_DELAY)
+    writer.write_node_rows(rows(10), "Component")
+    assert client.count_nodes() == 10
+
+
+def test_document_write_surfaces_failures():
+    client = FakeNeptuneGraphClient(error_rate=1.0, error_status=500)
+    writer = NeptuneAnalyticsSBOMWriter(
+        "g", "local", client=client, retry_policy=NO_DELAY
+    )
+    with pytest.raises(QueryError):
+        writer.write_sbom(cyclonedx(components=[component("a")]))
+
+
+def test_error_classification():
+    assert is_throttled(FakeClientError("ThrottlingException", "slow down"))
+    assert is_retryable(FakeClientError("InternalServerException", "oops"))
+    assert not is_retryable(FakeClientError("ValidationException", "bad query"))
+
+
+class ThreadRecordingClient(FakeNeptuneGraphClient):
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.threads = set()
+
+    def execute_query(self, *args, **kwargs):
+        self.threads.add(threading.current_thread().name)
+        return super().execute_query(*args, **kwargs)
+
+
+def test_batch_pool_is_reused_across_phases():
+    client = ThreadRecordingClient()
+    with NeptuneAnalyticsSBOMWriter(
+        "reuse", "local", max_workers=2, client=client
+    ) as writer:
+        for serial in ("urn:A", "urn:B", "urn:C"):
+            writer.write_sbom(cyclonedx(serial))
+        pools = [w for w in threading.enumerate() if w.name.startswith("reuse-batch")]
+        assert 0 < len(pools) <= 2
+    assert len(client.threads) <= 2
+    assert not any(w.name.startswith("reuse-batch") for w in threading.enumerate())
+
+
+def test_too_large_batch_shrinks_the_following_batches():
+    client = FakeNeptuneGraphClient(max_request_rows=4)
+    sizer = AdaptiveBatchSizer(initial_rows=16, min_rows=1)
+    writer = Writer("g", client, batch_sizer=sizer, retry_policy=NO_DELAY)
+    writer.write_node_rows(rows(64), "Component")
+    assert client.count_nodes() == 64
+    assert sizer.rows <= 4
+    # The limit was learned, later phases are not rejected again
+    errors = client.errors
+    writer.write_node_rows(rows(128)[64:], "Component")
+    assert client.errors == errors
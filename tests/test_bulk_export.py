@@ -0,0 +1,131 @@
+import csv
+import json
+import os
+import pytest
+from bulk_export import ExportFormat, NeptuneAnalyticsBulkExporter
+from tests.sboms import EXAMPLES, component, cyclonedx, depends
+
+
+def read_csv(path: str) -> tuple:
+    with open(path, newline="") as fp:
+        rows = list(csv.reader(fp))
+    return rows[0], rows[1:]
+
+
+def vulnerable_bom() -> dict:
+    return cyclonedx(
+        components=[
+            component(
+                "a",
+                externalReferences=[{"url": "https://a.example.com", "type": "website"}],
+            ),
+            component("b", modified=False),
+        ],
+        dependencies=[depends("a", "b")],
+        vulnerabilities=[
+            {
+                "id": "CVE-1",
+                "ratings": [{"score": 9.8, "severity": "critical"}],
+                "affects": [{"ref": "pkg:pypi/b@1.0"}],
+            }
+        ],
+    )
+
+
+def test_csv_round_trip(tmp_path):
+    with NeptuneAnalyticsBulkExporter(str(tmp_path)) as exporter:
+        assert exporter.write_sbom(vulnerable_bom())
+
+    assert sorted(os.listdir(tmp_path / "nodes")) == [
+        "Component-00000.csv",
+        "Document-00000.csv",
+        "Reference-00000.csv",
+        "Vulnerability-00000.csv",
+    ]
+    header, rows = read_csv(tmp_path / "nodes" / "Component-00000.csv")
+    assert header[:2] == ["~id", "~label"]
+    assert "name:String" in header and "modified:Bool" in header
+    by_id = {r[0]: dict(zip(header, r)) for r in rows}
+    assert set(by_id) == {"Component_a", "Component_b"}
+    assert by_id["Component_b"]["modified:Bool"] == "false"
+    assert by_id["Component_a"]["modified:Bool"] == ""
+
+    header, rows = read_csv(tmp_path / "nodes" / "Vulnerability-00000.csv")
+    assert "score:Double" in header
+    assert [r[0] for r in rows] == ["Vulnerability_CVE-1"]
+
+    edges = {}
+    for name in os.listdir(tmp_path / "edges"):
+        header, rows = read_csv(tmp_path / "edges" / name)
+        assert header == ["~id", "~from", "~to", "~label"]
+        for r in rows:
+            edges.setdefault(r[3], set()).add((r[1], r[2]))
+    assert edges == {
+        "DESCRIBES": {
+            ("Document_urn:uuid:1", "Component_a"),
+            ("Document_urn:uuid:1", "Component_b"),
+        },
+        "REFERS_TO": {("Component_a", "Reference_https://a.example.com")},
+        "DEPENDS_ON": {("Component_a", "Component_b")},
+        "AFFECTS": {("Vulnerability_CVE-1", "Component_b")},
+    }
+
+
+def test_csv_splits_files(tmp_path):
+    bom = cyclonedx(components=[component(str(i)) for i in range(50)])
+    with NeptuneAnalyticsBulkExporter(str(tmp_path), max_file_bytes=512) as exporter:
+        exporter.write_sbom(bom)
+
+    files = sorted(f for f in os.listdir(tmp_path / "nodes") if f.startswith("Component"))
+    assert len(files) > 1
+    ids = set()
+    for name in files:
+        header, rows = read_csv(tmp_path / "nodes" / name)
+        assert header[0] == "~id"
+        ids.update(r[0] for r in rows)
+    assert ids == {f"Component_{i}" for i in range(50)}
+
+
+def test_parquet_round_trip(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    with NeptuneAnalyticsBulkExporter(str(tmp_path), ExportFormat.PARQUET) as exporter:
+        exporter.write_sbom(vulnerable_bom())
+
+    components = pq.read_table(tmp_path / "nodes" / "Component-00000.parquet")
+    rows = {r["~id"]: r for r in components.to_pylist()}
+    assert set(rows) == {"Component_a", "Component_b"}
+    assert rows["Component_b"]["modified"] is False
+    assert rows["Component_a"]["purl"] == "pkg:pypi/a@1.0"
+    assert all(r["~label"] == "Component" for r in rows.values())
+
+    vulnerabilities = pq.read_table(
+        tmp_path / "nodes" / "Vulnerability-00000.parquet"
+    ).to_pylist()
+    assert vulnerabilities[0]["score"] == 9.8
+
+    affects = pq.read_table(tmp_path / "edges" / "AFFECTS-00000.parquet").to_pylist()
+    assert [(e["~from"], e["~to"], e["~label"]) for e in affects] == [
+        ("Vulnerability_CVE-1", "Component_b", "AFFECTS")
+    ]
+
+
+def test_stream_matches_loaded(tmp_path):
+    example = os.path.join(EXAMPLES, "CycloneDX", "drop-wizard-bom.json")
+    with NeptuneAnalyticsBulkExporter(str(tmp_path / "loaded")) as exporter:
+        with open(example) as fp:
+            exporter.write_sbom(json.load(fp))
+    with NeptuneAnalyticsBulkExporter(str(tmp_path / "streamed")) as exporter:
+        exporter.write_sbom_stream(example)
+
+    for kind in ("nodes", "edges"):
+        loaded = sorted(os.listdir(tmp_path / "loaded" / kind))
+        assert loaded == sorted(os.listdir(tmp_path / "streamed" / kind))
+        for name in loaded:
+            _, a = read_csv(tmp_path / "loaded" / kind / name)
+            _, b = read_csv(tmp_path / "streamed" / kind / name)
+            assert sorted(r[0] for r in a) == sorted(r[0] for r in b)
+
+
+def test_rejects_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        NeptuneAnalyticsBulkExporter(str(tmp_path), "json")
@@ -0,0 +1,126 @@
+import json
+import os
+import threading
+import pytest
+from batching import RetryPolicy
+from benchmarks.fake_neptune import FakeClientError, FakeNeptuneGraphClient
+from coalescing import CoalescedWriteError, CoalescingSBOMWriter
+from main import ingest
+from sbom_writer import NeptuneAnalyticsSBOMWriter
+from tests.sboms import cyclonedx
+from watch import SpoolWatcher
+
+NO_DELAY = RetryPolicy(max_attempts=1, base_delay=0, max_delay=0)
+
+
+def writer(client: FakeNeptuneGraphClient) -> NeptuneAnalyticsSBOMWriter:
+    return NeptuneAnalyticsSBOMWriter("g", "local", client=client, retry_policy=NO_DELAY)
+
+
+def test_documents_share_requests():
+    client = FakeNeptuneGraphClient()
+    with CoalescingSBOMWriter(writer(client)) as coalescing:
+        coalescing.write_sbom(cyclonedx("urn:A"))
+        coalescing.write_sbom(cyclonedx("urn:B"))
+        assert client.requests == 0
+    assert ("Document_urn:B", "DESCRIBES", "Component_c") in client.edges
+    assert ("Component_a", "DEPENDS_ON", "Component_b") in client.edges
+
+
+def test_failed_flush_keeps_the_rows_and_names_every_document():
+    client = FakeNeptuneGraphClient(error_rate=1.0, error_status=500)
+    coalescing = CoalescingSBOMWriter(writer(client))
+    coalescing.write_sbom(cyclonedx("urn:A"), "a.json")
+    coalescing.write_sbom(cyclonedx("urn:B"), "b.json")
+    with pytest.raises(CoalescedWriteError) as error:
+        coalescing.flush()
+    assert error.value.documents == ["a.json", "b.json"]
+
+    # Nothing was dropped, the next flush sends every row again
+    client.error_rate = 0
+    coalescing.flush()
+    assert "Document_urn:A" in client.nodes
+    assert ("Document_urn:B", "DESCRIBES", "Component_c") in client.edges
+    assert coalescing.discard() == []
+
+
+def test_watcher_fails_every_buffered_file(tmp_path):
+    spool = tmp_path / "spool"
+    spool.mkdir()
+    paths = []
+    for name in ("a", "b"):
+        path = spool / f"{name}.json"
+        path.write_text(json.dumps(cyclonedx(f"urn:{name}")))
+        paths.append(str(path))
+
+    client = FakeNeptuneGraphClient(error_rate=1.0, error_status=500)
+    watcher = SpoolWatcher(writer(client), [str(spool)])
+    watcher.ingest(paths)
+    assert sorted(os.listdir(spool / "failed")) == [
+        "a.json",
+        "a.json.error",
+        "b.json",
+        "b.json.error",
+    ]
+    assert not (spool / "done").exists()
+    assert watcher.writer.discard() == []
+
+
+class RejectingClient(FakeNeptuneGraphClient):
+    """Rejects every request with rows of the Document of the provided serial"""
+
+    def __init__(self, serial: str, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.serial = serial
+
+    def execute_query(self, queryString, parameters, language, graphIdentifier):
+        if f"Document_{self.serial}" in json.dumps(parameters):
+            raise FakeClientError("ValidationException", "Bad document")
+        return super().execute_query(
+            queryString, parameters, language, graphIdentifier
+        )
+
+
+def test_ingest_fails_the_buffered_files_and_moves_on(tmp_path):
+    paths = []
+    for name in ("a", "bad", "c", "d"):
+        path = tmp_path / f"{name}.json"
+        path.write_text(json.dumps(cyclonedx(f"urn:{name}")))
+        paths.append(str(path))
+
+    client = RejectingClient("urn:bad")
+    coalescing = CoalescingSBOMWriter(writer(client), max_buffered_rows=1)
+    results = ingest(coalescing, paths, parse_workers=1, coalesce=True)
+    assert results["failed"] == [paths[1]]
+    assert sorted(results["written"]) == [paths[0], paths[2], paths[3]]
+    assert "Document_urn:d" in client.nodes
+    assert coalescing.discard() == []
+
+
+class BlockingClient(FakeNeptuneGraphClient):
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.sending = threading.Event()
+        self.release = threading.Event()
+
+    def execute_query(self, *args, **kwargs):
+        self.sending.set()
+        self.release.wait(5)
+        return super().execute_query(*args, **kwargs)
+
+
+def test_documents_are_buffered_while_a_flush_is_written():
+    client = BlockingClient()
+    coalescing = CoalescingSBOMWriter(writer(client))
+    coalescing.write_sbom(cyclonedx("urn:A"))
+    flushing = threading.Thread(target=coalescing.flush)
+    flushing.start()
+    assert client.sending.wait(5)
+
+    # The lock is not held while the flush waits on the graph
+    coalescing.write_sbom(cyclonedx("urn:B"))
+    assert client.release.is_set() is False
+    client.release.set()
+    flushing.join()
+    coalescing.flush()
+    assert {"Document_urn:A", "Document_urn:B"} <= set(client.nodes)
@@ -0,0 +1,55 @@
+import pytest
+from benchmarks.fake_neptune import FakeNeptuneGraphClient
+from incremental import IncrementalSBOMWriter
+from sbom_writer import NeptuneAnalyticsSBOMWriter
+from tests.sboms import component, cyclonedx
+
+
+@pytest.fixture
+def client():
+    return FakeNeptuneGraphClient()
+
+
+@pytest.fixture
+def writer(client, tmp_path):
+    return IncrementalSBOMWriter(
+        NeptuneAnalyticsSBOMWriter("g", "local", client=client), str(tmp_path)
+    )
+
+
+def test_rewrite_sends_nothing_unchanged(writer, client):
+    writer.write_sbom(cyclonedx("urn:A"))
+    requests = client.requests
+    writer.write_sbom(cyclonedx("urn:A"))
+    assert client.requests == requests
+
+
+def test_changed_node_is_rewritten(writer, client):
+    writer.write_sbom(cyclonedx("urn:A"))
+    components = [component("a", description="new"), component("b"), component("c")]
+    writer.write_sbom(cyclonedx("urn:A", components=components))
+    assert client.nodes["Component_a"]["properties"]["description"] == "new"
+
+
+def test_shared_edge_is_kept_when_one_document_drops_it(writer, client):
+    edge = ("Component_a", "DEPENDS_ON", "Component_b")
+    writer.write_sbom(cyclonedx("urn:A"))
+    writer.write_sbom(cyclonedx("urn:B"))
+    assert edge in client.edges
+
+    # A drops a -> b, B still declares it
+    writer.write_sbom(cyclonedx("urn:A", dependencies=[]))
+    assert edge in client.edges
+
+
+def test_document_edges_are_removed(writer, client):
+    writer.write_sbom(cyclonedx("urn:A"))
+    writer.write_sbom(cyclonedx("urn:B"))
+    assert ("Document_urn:A", "DESCRIBES", "Component_c") in client.edges
+
+    writer.write_sbom(cyclonedx("urn:A", components=[component("a"), component("b")]))
+    assert ("Document_urn:A", "DESCRIBES", "Component_c") not in client.edges
+    assert ("Document_urn:A", "DESCRIBES", "Component_a") in client.edges
+    # B still describes c, and the node is left in place
+    assert ("Document_urn:B", "DESCRIBES", "Component_c") in client.edges
+    assert "Component_c" in client.nodes
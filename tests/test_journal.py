@@ -0,0 +1,36 @@
+from journal import IngestJournal
+
+
+def test_files_are_done_per_graph(tmp_path):
+    path = str(tmp_path / "ingest.db")
+    a = IngestJournal(path, "graph-a")
+    a.start("sbom.json", "hash")
+    a.record_batch("hash", "batch", "Component nodes")
+    a.finish("hash", True)
+    assert a.is_done("hash")
+    a.close()
+
+    b = IngestJournal(path, "graph-b")
+    assert not b.is_done("hash")
+    b.start("sbom.json", "hash")
+    assert not b.is_batch_done("hash", "batch")
+    b.close()
+
+    report = IngestJournal(path).status({"sbom.json": "hash"})
+    assert report["counts"] == {"done": 1, "writing": 1}
+    assert [(u["graph"], u["status"]) for u in report["unfinished"]] == [
+        ("graph-b", "writing")
+    ]
+
+
+def test_partial_batches_resume_on_the_same_graph(tmp_path):
+    path = str(tmp_path / "ingest.db")
+    a = IngestJournal(path, "graph-a")
+    a.start("sbom.json", "hash")
+    a.record_batch("hash", "batch", "Component nodes")
+    a.close()
+
+    a = IngestJournal(path, "graph-a")
+    a.start("sbom.json", "hash")
+    assert a.is_batch_done("hash", "batch")
+    assert a.status({"sbom.json": "hash"})["pending"] == ["sbom.json"]
@@ -0,0 +1,41 @@
+import pytest
+from batching import RetryPolicy
+from benchmarks.fake_neptune import FakeNeptuneGraphClient
+from metrics import IngestMetrics
+from retention import GraphGarbageCollector
+from sbom_writer import NeptuneAnalyticsSBOMWriter, QueryError
+from tests.sboms import cyclonedx
+
+NO_DELAY = RetryPolicy(max_attempts=3, base_delay=0, max_delay=0)
+
+
+def phases(metrics: IngestMetrics) -> dict:
+    return {p["name"]: p for p in metrics.summary()["phases"]}
+
+
+def test_every_attempt_is_recorded():
+    metrics = IngestMetrics()
+    client = FakeNeptuneGraphClient(error_rate=1.0, error_status=503)
+    writer = NeptuneAnalyticsSBOMWriter(
+        "g", "local", client=client, retry_policy=NO_DELAY, metrics=metrics
+    )
+    with pytest.raises(QueryError):
+        writer.write_sbom(cyclonedx())
+    document = phases(metrics)["Document nodes"]
+    assert document["queries"] == 3
+    assert document["retries"] == 2
+    assert document["failures"] == 3
+    assert document["bytes"] > 0
+
+
+def test_queries_sent_outside_write_phases_are_recorded():
+    metrics = IngestMetrics()
+    writer = NeptuneAnalyticsSBOMWriter(
+        "g", "local", client=FakeNeptuneGraphClient(), metrics=metrics
+    )
+    writer.write_sbom(cyclonedx())
+    GraphGarbageCollector(writer, grace_seconds=0).run()
+    recorded = phases(metrics)
+    for phase in ("Document scans", "Component scans", "Vulnerability scans"):
+        assert recorded[phase]["queries"] == 1
+        assert sum(recorded[phase]["latency_histogram_ms"].values()) == 1
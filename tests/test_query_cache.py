@@ -0,0 +1,123 @@
+import io
+import json
+import threading
+from benchmarks.fake_neptune import FakeNeptuneGraphClient
+from query_cache import (
+    GENERATION_ID,
+    QueryCache,
+    generation_query,
+    record_write,
+    write_generation,
+)
+from sbom_query import SBOMQueryClient
+from sbom_writer import NeptuneAnalyticsSBOMWriter
+from tests.sboms import cyclonedx
+
+
+class LookupClient:
+    """Answers every lookup with one Document per key, optionally recording a write
+    to the graph while the query runs, and reads of the write generation with
+    generation"""
+
+    def __init__(self, write_during_query: bool = False) -> None:
+        self.write_during_query = write_during_query
+        self.generation = None
+        self.generation_reads = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def execute_query(self, queryString, parameters, language, graphIdentifier):
+        if "keys" not in parameters:
+            self.generation_reads += 1
+            return response([{"generation": self.generation}])
+        with self.lock:
+            self.requests += 1
+        if self.write_during_query:
+            record_write(graphIdentifier)
+        results = [{"key": k, "values": [f"Document_{k}"]} for k in parameters["keys"]]
+        return response(results)
+
+
+def response(results: list) -> dict:
+    return {
+        "ResponseMetadata": {"HTTPStatusCode": 200},
+        "payload": io.BytesIO(json.dumps({"results": results}).encode("utf-8")),
+    }
+
+
+def query_client(graph: str, client: LookupClient, cache: QueryCache, **kwargs):
+    writer = NeptuneAnalyticsSBOMWriter(graph, "local", client=client, **kwargs)
+    return SBOMQueryClient(writer, cache, batch_size=2)
+
+
+def test_results_are_cached():
+    client = LookupClient()
+    queries = query_client("cached", client, QueryCache())
+    assert queries.documents_with_purls(["a", "b"]) == {
+        "a": ["Document_a"],
+        "b": ["Document_b"],
+    }
+    queries.documents_with_purls(["a", "b"])
+    assert client.requests == 1
+
+
+def test_result_overlapping_a_write_is_not_served():
+    client = LookupClient(write_during_query=True)
+    queries = query_client("written", client, QueryCache())
+    queries.documents_with_purls(["a"])
+    queries.documents_with_purls(["a"])
+    assert client.requests == 2
+
+
+def test_put_keeps_the_generation_it_is_given():
+    cache = QueryCache()
+    generation = write_generation("put")
+    record_write("put")
+    cache.put("put", "q", "k", ["v"], generation)
+    assert cache.get("put", "q", "k") == (False, None)
+    cache.put("put", "q", "k", ["v"])
+    assert cache.get("put", "q", "k") == (True, ["v"])
+
+
+def test_requests_are_counted_across_threads():
+    client = LookupClient()
+    queries = query_client("threads", client, None, max_workers=4)
+    queries.documents_with_purls([str(i) for i in range(20)])
+    assert queries.requests == client.requests == 10
+
+
+def test_generations_published_by_other_processes_invalidate_results():
+    client = LookupClient()
+    queries = query_client("published", client, QueryCache())
+    queries.generation_interval = 0
+    queries.documents_with_purls(["a"])
+    queries.documents_with_purls(["a"])
+    assert client.requests == 1
+    # A writer in another process wrote a document
+    client.generation = "other"
+    queries.documents_with_purls(["a"])
+    assert client.requests == 2
+
+
+def test_published_generation_is_read_once_per_interval():
+    client = LookupClient()
+    queries = query_client("interval", client, QueryCache())
+    for _ in range(3):
+        queries.documents_with_purls(["a"])
+    assert client.generation_reads == 1
+    assert client.requests == 1
+
+
+def test_writers_publish_a_generation_per_document():
+    client = FakeNeptuneGraphClient()
+    writer = NeptuneAnalyticsSBOMWriter("g", "local", client=client)
+
+    def published():
+        resp = writer.create_writer().execute_query({"id": GENERATION_ID}, generation_query())
+        return json.loads(resp["payload"].read())["results"]
+
+    assert published() == []
+    writer.write_sbom(cyclonedx("urn:A"))
+    first = published()[0]["generation"]
+    writer.write_sbom(cyclonedx("urn:B"))
+    assert published()[0]["generation"] not in (None, first)
@@ -0,0 +1,125 @@
+import pytest
+from datetime import datetime, timezone
+from benchmarks.fake_neptune import FakeNeptuneGraphClient
+from coalescing import CoalescingSBOMWriter
+from retention import GraphGarbageCollector, RetentionPolicy
+from sbom_writer import MissingEndpointsError, NeptuneAnalyticsSBOMWriter
+from tests.sboms import component, cyclonedx, spdx
+from write_cache import WriteCache
+
+NOW = datetime(2024, 6, 1, tzinfo=timezone.utc)
+
+
+def collector(writer: NeptuneAnalyticsSBOMWriter, **kwargs) -> GraphGarbageCollector:
+    return GraphGarbageCollector(writer, grace_seconds=0, **kwargs)
+
+
+def test_spdx_packages_without_describes_relationships_are_kept():
+    client = FakeNeptuneGraphClient()
+    writer = NeptuneAnalyticsSBOMWriter("g", "local", client=client)
+    bom = spdx(packages=["a", "b", "c"])
+    # b is only listed in documentDescribes, c only in a package relationship
+    bom["documentDescribes"] = ["SPDXRef-b"]
+    bom["relationships"] = [
+        {
+            "spdxElementId": "SPDXRef-DOCUMENT",
+            "relationshipType": "DESCRIBES",
+            "relatedSpdxElement": "SPDXRef-a",
+        },
+        {
+            "spdxElementId": "SPDXRef-a",
+            "relationshipType": "DEPENDS_ON",
+            "relatedSpdxElement": "SPDXRef-c",
+        },
+    ]
+    writer.write_sbom(bom)
+
+    report = collector(writer).run(NOW)
+    assert report["deleted"]["Component"] == 0
+    assert {"Component_a", "Component_b", "Component_c"} <= set(client.nodes)
+
+
+def test_orphans_are_deleted():
+    client = FakeNeptuneGraphClient()
+    writer = NeptuneAnalyticsSBOMWriter("g", "local", client=client)
+    writer.write_sbom(cyclonedx())
+    orphan = {"__id": "Component_z", "name": "z"}
+    writer.create_writer().write_node_rows([orphan], "Component")
+
+    gc = collector(writer)
+    assert gc.plan(NOW)["orphaned"]["Component"] == 1
+    report = gc.run(NOW)
+    assert report["deleted"]["Component"] == 1
+    assert "Component_z" not in client.nodes
+    assert "Component_a" in client.nodes
+
+
+def test_expired_documents_and_their_components_are_deleted():
+    client = FakeNeptuneGraphClient()
+    writer = NeptuneAnalyticsSBOMWriter("g", "local", client=client)
+    old = cyclonedx("urn:A", components=[component("a"), component("old")])
+    new = cyclonedx("urn:B", components=[component("a")], dependencies=[])
+    new["metadata"]["timestamp"] = "2024-02-01T00:00:00Z"
+    writer.write_sbom(old)
+    writer.write_sbom(new)
+
+    gc = collector(writer, policy=RetentionPolicy(keep_latest=1))
+    plan = gc.plan(NOW)
+    assert plan["expired"] == {"app": ["Document_urn:A"]}
+    assert plan["orphaned_by_expiry"]["Component"] == 1
+
+    report = gc.run(NOW)
+    assert report["deleted"]["Document"] == 1
+    assert report["deleted"]["Component"] == 1
+    assert "Document_urn:A" not in client.nodes
+    assert "Component_old" not in client.nodes
+    assert ("Document_urn:B", "DESCRIBES", "Component_a") in client.edges
+
+
+def test_coalesced_nodes_are_written_with_their_edges():
+    client = FakeNeptuneGraphClient()
+    writer = NeptuneAnalyticsSBOMWriter("g", "local", client=client)
+    gc = collector(writer)
+    with CoalescingSBOMWriter(writer, max_buffered_rows=10) as coalescing:
+        for i in range(5):
+            coalescing.write_sbom(cyclonedx(f"urn:{i}"))
+            assert gc.plan(NOW)["orphaned"]["Component"] == 0
+        # The buffers were written before the end
+        assert client.count_nodes("Document") > 0
+
+
+def test_orphans_written_within_the_grace_are_kept():
+    client = FakeNeptuneGraphClient()
+    writer = NeptuneAnalyticsSBOMWriter("g", "local", client=client)
+    writer.write_sbom(cyclonedx())
+    # An orphan a document being ingested writes again, before linking it
+    orphan = {"__id": "Component_z", "name": "z"}
+    writer.create_writer().write_node_rows([orphan], "Component")
+    client.nodes["Component_z"]["properties"]["written_at"] = 0
+    gc = GraphGarbageCollector(writer, grace_seconds=60)
+    assert gc.plan(NOW)["orphaned"]["Component"] == 1
+    writer.create_writer().write_node_rows([orphan], "Component")
+
+    assert gc.plan(NOW)["orphaned"]["Component"] == 0
+    assert gc.run(NOW)["deleted"]["Component"] == 0
+    assert "Component_z" in client.nodes
+
+
+def test_edges_to_deleted_cached_nodes_fail_the_document(tmp_path):
+    client = FakeNeptuneGraphClient()
+    cache = WriteCache(str(tmp_path / "cache.db"))
+    writer = NeptuneAnalyticsSBOMWriter("g", "local", client=client, write_cache=cache)
+    writer.write_sbom(cyclonedx("urn:A"))
+    # Another process expires the Document and deletes its Components
+    other = NeptuneAnalyticsSBOMWriter("g", "local", client=client)
+    newer = cyclonedx("urn:B", components=[component("c")], dependencies=[])
+    newer["metadata"]["timestamp"] = "2024-02-01T00:00:00Z"
+    other.write_sbom(newer)
+    collector(other, policy=RetentionPolicy(keep_latest=1)).run(NOW)
+    assert "Component_a" not in client.nodes
+
+    # The cache keeps Component_a from being written again
+    with pytest.raises(MissingEndpointsError):
+        writer.write_sbom(cyclonedx("urn:C"))
+    writer.write_sbom(cyclonedx("urn:C"))
+    assert ("Document_urn:C", "DESCRIBES", "Component_a") in client.edges
@@ -0,0 +1,21 @@
+import json
+import pytest
+from sbom_schema import decode_sbom
+from sbom_writer import record_sbom
+from tests.sboms import component, cyclonedx, spdx
+
+
+@pytest.mark.parametrize("bom", [cyclonedx(), spdx()])
+def test_typed_decode_maps_to_the_same_graph(bom):
+    data = json.dumps(bom).encode("utf-8")
+    a = record_sbom(json.loads(data))
+    b = record_sbom(decode_sbom(data))
+    assert a.nodes == b.nodes
+    assert a.edges == b.edges
+    assert a.property_edges == b.property_edges
+
+
+def test_invalid_field_fails_with_its_path():
+    bom = cyclonedx(components=[component("a"), {"name": 1}])
+    with pytest.raises(ValueError, match=r"\$\.components\[1\]\.name"):
+        decode_sbom(json.dumps(bom))
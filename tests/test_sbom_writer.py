@@ -0,0 +1,107 @@
+import pytest
+from advisories import AdvisoryIndex
+from benchmarks.fake_neptune import FakeNeptuneGraphClient
+from sbom_writer import (
+    DocumentRecord,
+    KeyIndex,
+    NeptuneAnalyticsSBOMWriter,
+    record_sbom,
+)
+from tests.sboms import component, cyclonedx, depends, spdx
+
+
+def bom_with_metadata_purl() -> dict:
+    # The metadata component, merged into the Document node, has the purl and
+    # bom-ref of component a
+    bom = cyclonedx(
+        components=[component("a"), component("b")],
+        dependencies=[depends("a", "b")],
+        vulnerabilities=[
+            {
+                "id": "CVE-1",
+                "ratings": [{"severity": "high"}],
+                "affects": [{"ref": "pkg:pypi/a@1.0"}],
+            }
+        ],
+    )
+    bom["metadata"]["component"].update(
+        {"purl": "pkg:pypi/a@1.0", "bom-ref": "pkg:pypi/a@1.0"}
+    )
+    return bom
+
+
+def test_key_index_resolves_per_label():
+    index = KeyIndex()
+    index.add([{"__id": "Document_1", "purl": "p"}], "Document")
+    index.add([{"__id": "Component_a", "purl": "p"}], "Component")
+
+    assert index.resolve("purl", "p", "Component") == {"Component_a"}
+    assert index.resolve("purl", "p", "Document") == {"Document_1"}
+    assert index.resolve("purl", "p") == {"Document_1", "Component_a"}
+    assert index.resolve("purl", "q", "Component") == set()
+    assert index.resolve("~id", "Document_1", "Component") == {"Document_1"}
+
+
+def test_edges_resolve_to_components_only():
+    client = FakeNeptuneGraphClient()
+    writer = NeptuneAnalyticsSBOMWriter("g", "local", client=client)
+    assert writer.write_sbom(bom_with_metadata_purl())
+
+    depends_on = {e for e in client.edges if e[1] == "DEPENDS_ON"}
+    assert depends_on == {("Component_a", "DEPENDS_ON", "Component_b")}
+    affects = {e for e in client.edges if e[1] == "AFFECTS"}
+    assert affects == {("Vulnerability_CVE-1", "AFFECTS", "Component_a")}
+
+
+def test_record_resolves_to_components_only():
+    r = record_sbom(bom_with_metadata_purl())
+    assert ("Component_a", "DEPENDS_ON", "Component_b") in r.edges
+    assert not any(e[0].startswith("Document") and e[1] == "DEPENDS_ON" for e in r.edges)
+    assert ("Vulnerability_CVE-1", "AFFECTS", "Component_a") in r.edges
+    assert not any(e[2].startswith("Document") for e in r.edges)
+
+
+def test_spdx_describes_resolves_from_document_id():
+    bom = spdx()
+    expected = {
+        ("Document_https://example.com/app-1", "DESCRIBES", "Component_a"),
+        ("Document_https://example.com/app-1", "DESCRIBES", "Component_b"),
+    }
+    assert record_sbom(bom).edges >= expected
+
+
+@pytest.mark.parametrize("bom", [bom_with_metadata_purl(), spdx()])
+def test_replayed_record_holds_the_writer_mapping(bom):
+    record = record_sbom(bom)
+    replayed = DocumentRecord()
+    record.replay(replayed)
+    assert replayed.nodes == record.nodes
+    assert replayed.edges == record.edges
+    assert replayed.property_edges == record.property_edges
+
+
+@pytest.mark.parametrize("bom", [cyclonedx(), spdx()])
+def test_advisories_add_vulnerabilities(bom):
+    advisories = AdvisoryIndex()
+    advisories.add(
+        {
+            "id": "GHSA-1",
+            "summary": "bad",
+            "affected": [
+                {"package": {"ecosystem": "PyPI", "name": "a"}, "versions": ["1.0"]}
+            ],
+        }
+    )
+    record = record_sbom(bom, advisories)
+    label, row = record.nodes["Vulnerability_GHSA-1"]
+    assert label == "Vulnerability"
+    assert row["description"] == "bad"
+    affects = {e for e in record.edges if e[1] == "AFFECTS"}
+    assert affects == {("Vulnerability_GHSA-1", "AFFECTS", "Component_a")}
+
+    client = FakeNeptuneGraphClient()
+    writer = NeptuneAnalyticsSBOMWriter("g", "local", client=client, advisories=advisories)
+    assert writer.write_sbom(bom)
+    assert client.nodes["Vulnerability_GHSA-1"]["properties"]["description"] == "bad"
+    assert affects <= client.edges
+    assert record.edges <= client.edges
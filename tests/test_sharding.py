@@ -0,0 +1,85 @@
+import json
+import pytest
+from benchmarks.fake_neptune import FakeNeptuneGraphClient
+from sbom_writer import NeptuneAnalyticsSBOMWriter
+from sharding import PartitionKey, ShardedSBOMWriter, ShardRouter, partition_key
+from tests.sboms import cyclonedx, spdx
+
+GRAPHS = ["g0", "g1", "g2"]
+
+
+def sharded(partition: str = PartitionKey.ARTIFACT) -> ShardedSBOMWriter:
+    return ShardedSBOMWriter(
+        [
+            NeptuneAnalyticsSBOMWriter(g, "local", client=FakeNeptuneGraphClient())
+            for g in GRAPHS
+        ],
+        partition,
+    )
+
+
+def keyless() -> dict:
+    bom = cyclonedx()
+    del bom["serialNumber"]
+    return bom
+
+
+def test_partition_keys_fall_back():
+    bom = cyclonedx("urn:A", name="app")
+    assert partition_key(bom, PartitionKey.ACCOUNT) == "account:app"
+    assert partition_key(bom, PartitionKey.NAMESPACE) == "namespace:urn:A"
+    assert partition_key(spdx(), PartitionKey.NAMESPACE) == (
+        "namespace:https://example.com/app-1"
+    )
+    assert partition_key(keyless(), PartitionKey.NAMESPACE) is None
+    with pytest.raises(ValueError):
+        partition_key(bom, "unknown")
+
+
+def test_adding_a_graph_only_moves_keys_to_it():
+    keys = [f"artifact:{i}" for i in range(200)]
+    before = ShardRouter(GRAPHS)
+    after = ShardRouter([*GRAPHS, "g3"])
+    for key in keys:
+        assert before.route(key) == ShardRouter(list(reversed(GRAPHS))).route(key)
+        assert after.route(key) in (before.route(key), "g3")
+    assert len({before.route(k) for k in keys}) == len(GRAPHS)
+
+
+def test_documents_of_an_artifact_share_a_shard():
+    writer = sharded()
+    for serial in ("urn:A", "urn:B"):
+        writer.write_sbom(cyclonedx(serial, name="app"))
+    graph = writer.shard_for(cyclonedx(name="app"))
+    assert writer.documents[graph] == 2
+    client = writer.writers[graph].client
+    assert {"Document_urn:A", "Document_urn:B"} <= set(client.nodes)
+    for g in GRAPHS:
+        if g != graph:
+            assert writer.writers[g].client.count_nodes() == 0
+
+
+def test_documents_without_a_key_are_routed_by_content(tmp_path):
+    writer = sharded(PartitionKey.NAMESPACE)
+    bom = keyless()
+    graph = writer.shard_for(bom)
+    assert all(writer.shard_for(keyless()) == graph for _ in range(5))
+
+    path = tmp_path / "bom.json"
+    path.write_text(json.dumps(bom))
+    writer.write_sbom_stream(str(path))
+    writer.write_sbom_stream(str(path))
+    assert sorted(writer.documents.values()) == [0, 0, 2]
+
+
+def test_keyless_files_go_to_the_same_shard_loaded_or_streamed(tmp_path):
+    for i in range(8):
+        path = tmp_path / f"bom-{i}.json"
+        bom = keyless()
+        bom["version"] = i
+        path.write_text(json.dumps(bom))
+
+        writer = sharded(PartitionKey.NAMESPACE)
+        writer.write_sbom(json.loads(path.read_text()), path=str(path))
+        writer.write_sbom_stream(str(path))
+        assert sorted(writer.documents.values()) == [0, 0, 2]
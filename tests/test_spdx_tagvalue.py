@@ -0,0 +1,127 @@
+import io
+import json
+import os
+import pytest
+from sbom_writer import record_sbom
+from spdx_tagvalue import (
+    SBOMFileFormat,
+    detect_file_format,
+    iter_tag_values,
+    load_sbom,
+    parse_tag_value,
+)
+from tests.sboms import EXAMPLES, spdx
+
+# The tag-value form of tests.sboms.spdx()
+DOCUMENT = """\
+SPDXVersion: SPDX-2.3
+SPDXID: SPDXRef-DOCUMENT
+DocumentName: app
+DocumentNamespace: https://example.com/app-1
+Created: 2024-01-01T00:00:00Z
+
+## Packages
+PackageName: a
+SPDXID: SPDXRef-a
+PackageVersion: 1.0
+ExternalRef: PACKAGE_MANAGER purl pkg:pypi/a@1.0
+
+PackageName: b
+SPDXID: SPDXRef-b
+PackageVersion: 1.0
+ExternalRef: PACKAGE_MANAGER purl pkg:pypi/b@1.0
+
+Relationship: SPDXRef-DOCUMENT DESCRIBES SPDXRef-a
+Relationship: SPDXRef-DOCUMENT DESCRIBES SPDXRef-b
+"""
+
+
+def parse(text: str) -> dict:
+    return parse_tag_value(io.StringIO(text))
+
+
+def test_multi_line_text_values():
+    bom = parse(
+        "SPDXVersion: SPDX-2.3\n"
+        "PackageName: a\n"
+        "PackageDescription: <text>first line\n"
+        "second: line\n"
+        "</text>\n"
+        "PackageCopyrightText: <text>one line</text>\n"
+    )
+    package = bom["packages"][0]
+    assert package["description"] == "first line\nsecond: line"
+    assert package["copyrightText"] == "one line"
+
+
+def test_unterminated_text_is_an_error():
+    with pytest.raises(ValueError, match="PackageComment"):
+        list(iter_tag_values(io.StringIO("PackageComment: <text>never\nends\n")))
+
+
+def test_packages_relationships_and_annotations():
+    bom = parse(
+        DOCUMENT
+        + "RelationshipComment: the app\n"
+        + "Creator: Organization: Example\n"
+        + "Annotator: Person: someone\n"
+        + "AnnotationDate: 2024-01-02T00:00:00Z\n"
+        + "AnnotationType: REVIEW\n"
+        + "SPDXREF: SPDXRef-a\n"
+        + "AnnotationComment: <text>looks\nfine</text>\n"
+    )
+    assert bom["packages"][0]["externalRefs"] == [
+        {
+            "referenceCategory": "PACKAGE-MANAGER",
+            "referenceType": "purl",
+            "referenceLocator": "pkg:pypi/a@1.0",
+        }
+    ]
+    assert bom["relationships"][1] == {
+        "spdxElementId": "SPDXRef-DOCUMENT",
+        "relationshipType": "DESCRIBES",
+        "relatedSpdxElement": "SPDXRef-b",
+        "comment": "the app",
+    }
+    assert bom["annotations"] == [
+        {
+            "annotator": "Person: someone",
+            "annotationDate": "2024-01-02T00:00:00Z",
+            "annotationType": "REVIEW",
+            "spdxElementId": "SPDXRef-a",
+            "comment": "looks\nfine",
+        }
+    ]
+
+
+def test_document_without_version_is_rejected():
+    with pytest.raises(ValueError):
+        parse("DocumentName: app\n")
+
+
+def test_tag_value_maps_to_the_graph_of_its_json():
+    tag_value = record_sbom(parse(DOCUMENT))
+    json_document = record_sbom(spdx())
+    assert tag_value.nodes == json_document.nodes
+    assert tag_value.edges == json_document.edges
+    assert tag_value.property_edges == json_document.property_edges
+
+
+def test_file_formats_are_detected(tmp_path):
+    tag_value = tmp_path / "app.spdx"
+    tag_value.write_text("# An SPDX document\n\n" + DOCUMENT)
+    json_file = tmp_path / "app.json"
+    json_file.write_text("\n  " + json.dumps(spdx()))
+    unknown = tmp_path / "notes.txt"
+    unknown.write_text("Just some notes, not an SBOM\n")
+
+    assert detect_file_format(str(tag_value)) == SBOMFileFormat.TAG_VALUE
+    assert detect_file_format(str(json_file)) == SBOMFileFormat.JSON
+    assert detect_file_format(str(unknown)) == SBOMFileFormat.UNKNOWN
+    # JSON documents with a .txt extension are still JSON
+    example = os.path.join(EXAMPLES, "SPDX", "i-0dfd4132c0dd31532_SPDX_2_3.txt")
+    assert detect_file_format(example) == SBOMFileFormat.JSON
+
+    assert load_sbom(str(tag_value)) == load_sbom(str(json_file))
+    with pytest.raises(ValueError):
+        load_sbom(str(unknown))
@@ -0,0 +1,275 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from advisories import AdvisoryIndex
+from coalescing import CoalescedWriteError, CoalescingSBOMWriter
+from sbom_writer import BomType, NeptuneAnalyticsSBOMWriter, determine_bom_type
+from spdx_tagvalue import SBOM_EXTENSIONS, load_sbom
+
+DONE_DIR = "done"
+FAILED_DIR = "failed"
+
+
+class SpoolWatcher:
+    """Ingests the SBOM files dropped into one or more spool directories as they
+    arrive.
+
+    The directories are polled. A file is picked up once its size and modification
+    time have not changed for settle_seconds, so files still being written are left
+    alone. Files that are ready are ingested in micro-batches, once max_batch_files
+    are waiting or the oldest has waited max_batch_age seconds. The rows of every
+    document of a micro-batch share batches (see CoalescingSBOMWriter). When the
+    micro-batch is written its files are moved to the done directory, and files that
+    could not be parsed or written to the failed directory with a .error file. As
+    the documents share requests, a failed write fails every file whose rows were
+    buffered, and those rows are dropped.
+    """
+
+    def __init__(
+        self,
+        writer: NeptuneAnalyticsSBOMWriter,
+        directories: list,
+        max_batch_files: int = 50,
+        max_batch_age: float = 5.0,
+        poll_interval: float = 1.0,
+        settle_seconds: float = 1.0,
+        done_dir: str = None,
+        failed_dir: str = None,
+        status_path: str = None,
+        advisories: AdvisoryIndex = None,
+    ) -> None:
+        """Creates the watcher
+
+        Args:
+            writer (NeptuneAnalyticsSBOMWriter): The writer whose client and settings are used
+            directories (list): The spool directories to watch
+            max_batch_files (int, optional): The number of ready files that triggers a micro-batch. Defaults to 50.
+            max_batch_age (float, optional): The number of seconds the oldest ready file waits before a micro-batch is written. Defaults to 5.
+            poll_interval (float, optional): The number of seconds between scans of the directories. Defaults to 1.
+            settle_seconds (float, optional): The number of seconds a file must be unchanged to be picked up. Defaults to 1.
+            done_dir (str, optional): Where ingested files are moved. Defaults to a done/ directory in each spool directory.
+            failed_dir (str, optional): Where failed files are moved. Defaults to a failed/ directory in each spool directory.
+            status_path (str, optional): A file the status() is written to as JSON after every scan. Defaults to None.
+            advisories (AdvisoryIndex, optional): Advisories to add the Vulnerabilities of the components from. Defaults to None.
+        """
+        self.writer = CoalescingSBOMWriter(writer, advisories=advisories)
+        self.directories = directories
+        self.max_batch_files = max_batch_files
+        self.max_batch_age = max_batch_age
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self.done_dir = done_dir
+        self.failed_dir = failed_dir
+        self.status_path = status_path
+        self.done = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_batch_seconds = 0.0
+        self.last_lag_seconds = 0.0
+        # path -> (size, mtime, first seen, unchanged since)
+        self.__seen = {}
+        # path -> first seen, in the order the files became ready
+        self.__ready = {}
+
+    def run(self, stop: threading.Event = None):
+        """Watches the directories until stop is set, then writes the files that are
+        ready. Files that are still settling are left for the next run.
+
+        Args:
+            stop (threading.Event, optional): Stops the watcher when set. Defaults to None (run forever).
+        """
+        stop = stop or threading.Event()
+        logging.info(f"Watching {', '.join(self.directories)}")
+        while not stop.is_set():
+            self.poll()
+            stop.wait(self.poll_interval)
+        if len(self.__ready) > 0:
+            self.ingest(list(self.__ready))
+        self.__write_status()
+
+    def poll(self) -> int:
+        """Scans the directories and writes a micro-batch if one is due
+
+        Returns:
+            int: The number of files ingested
+        """
+        now = time.monotonic()
+        self.scan(now)
+        ingested = 0
+        if len(self.__ready) > 0:
+            oldest = next(iter(self.__ready.values()))
+            if (
+                len(self.__ready) >= self.max_batch_files
+                or now - oldest >= self.max_batch_age
+            ):
+                paths = list(self.__ready)[: self.max_batch_files]
+                self.ingest(paths)
+                ingested = len(paths)
+        self.__write_status()
+        return ingested
+
+    def scan(self, now: float = None):
+        """Finds new files and the files that have settled
+
+        Args:
+            now (float, optional): The time.monotonic() of the scan. Defaults to now.
+        """
+        now = time.monotonic() if now is None else now
+        present = set()
+        for directory in self.directories:
+            try:
+                names = os.listdir(directory)
+            except OSError as e:
+                logging.error(f"Unable to list {directory}: {e}")
+                continue
+            for name in names:
+                path = os.path.join(directory, name)
+                if name.startswith(".") or not name.endswith(SBOM_EXTENSIONS):
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if not os.path.isfile(path):
+                    continue
+                present.add(path)
+                if path in self.__ready:
+                    continue
+                size, mtime, first_seen, since = self.__seen.get(
+                    path, (None, None, now, now)
+                )
+                if (size, mtime) != (stat.st_size, stat.st_mtime):
+                    self.__seen[path] = (stat.st_size, stat.st_mtime, first_seen, now)
+                elif now - since >= self.settle_seconds:
+                    self.__ready[path] = first_seen
+                    del self.__seen[path]
+
+        # Forget the files removed by something else
+        for path in [p for p in self.__seen if p not in present]:
+            del self.__seen[path]
+        for path in [p for p in self.__ready if p not in present]:
+            del self.__ready[path]
+
+    def ingest(self, paths: list):
+        """Writes a micro-batch of files and moves each to the done or failed directory
+
+        Args:
+            paths (list): The files
+        """
+        start = time.monotonic()
+        written = []
+        for path in paths:
+            try:
+                bom = load_sbom(path)
+                if determine_bom_type(bom) == BomType.UNKNOWN:
+                    raise ValueError("Unknown SBOM format")
+                self.writer.write_sbom(bom, path)
+                written.append(path)
+            except CoalescedWriteError as e:
+                written = self.__fail_buffered(e, written)
+            except Exception as e:
+                logging.error(f"Failed writing {path}: {e}")
+                self.__finish(path, e)
+
+        try:
+            self.writer.flush()
+        except CoalescedWriteError as e:
+            written = self.__fail_buffered(e, written)
+        for path in written:
+            self.__finish(path)
+
+        end = time.monotonic()
+        self.batches += 1
+        self.last_batch_seconds = end - start
+        self.last_lag_seconds = max(
+            (end - self.__ready.get(p, start) for p in paths), default=0.0
+        )
+        for path in paths:
+            self.__ready.pop(path, None)
+        logging.info(
+            f"Ingested a micro-batch of {len(paths)} files in "
+            f"{self.last_batch_seconds:.2f}s, {self.last_lag_seconds:.2f}s after the oldest arrived"
+        )
+
+    def __fail_buffered(self, error: CoalescedWriteError, written: list) -> list:
+        """Fails the files whose rows were buffered when a write failed, and drops
+        those rows so they are not written with the next micro-batch
+
+        Args:
+            error (CoalescedWriteError): The error
+            written (list): The files written so far
+
+        Returns:
+            list: The files of written that are still to be moved to the done directory
+        """
+        logging.error(
+            f"Failed writing a micro-batch of {len(error.documents)} files: {error.error}"
+        )
+        self.writer.discard()
+        for path in error.documents:
+            self.__finish(path, error.error)
+        failed = set(error.documents)
+        return [p for p in written if p not in failed]
+
+    def __finish(self, path: str, error: Exception = None):
+        """Moves an ingested file to the done directory, or a failed file to the failed
+        directory next to a .error file holding the error
+
+        Args:
+            path (str): The file
+            error (Exception, optional): The error the file failed with. Defaults to None.
+        """
+        if error is None:
+            self.done += 1
+            target = self.done_dir or os.path.join(os.path.dirname(path), DONE_DIR)
+        else:
+            self.failed += 1
+            target = self.failed_dir or os.path.join(os.path.dirname(path), FAILED_DIR)
+        os.makedirs(target, exist_ok=True)
+        destination = os.path.join(target, os.path.basename(path))
+        if os.path.exists(destination):
+            root, ext = os.path.splitext(destination)
+            destination = f"{root}-{time.time_ns()}{ext}"
+        try:
+            shutil.move(path, destination)
+            if error is not None:
+                with open(destination + ".error", "w") as f:
+                    f.write(f"{error}\n")
+        except OSError as e:
+            logging.error(f"Unable to move {path} to {target}: {e}")
+
+    def status(self) -> dict:
+        """Reports the queue depth and lag of the watcher
+
+        Returns:
+            dict: The number of files settling and ready, the age in seconds of the oldest waiting file, and the counts and timings of the micro-batches written
+        """
+        now = time.monotonic()
+        waiting = [first for _, _, first, _ in self.__seen.values()]
+        waiting.extend(self.__ready.values())
+        return {
+            "settling": len(self.__seen),
+            "ready": len(self.__ready),
+            "queue_depth": len(self.__seen) + len(self.__ready),
+            "oldest_waiting_seconds": round(now - min(waiting), 3) if waiting else 0.0,
+            "done": self.done,
+            "failed": self.failed,
+            "batches": self.batches,
+            "last_batch_seconds": round(self.last_batch_seconds, 3),
+            "last_lag_seconds": round(self.last_lag_seconds, 3),
+        }
+
+    def __write_status(self):
+        """Writes the status to status_path, if set, replacing it atomically"""
+        if self.status_path is None:
+            return
+        temp_path = self.status_path + ".tmp"
+        try:
+            with open(temp_path, "w") as f:
+                json.dump(self.status(), f, indent=2)
+            os.replace(temp_path, self.status_path)
+        except OSError as e:
+            logging.error(f"Unable to write the status to {self.status_path}: {e}")
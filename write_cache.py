@@ -0,0 +1,170 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+MAX_ENTRIES = 1000000
+
+# SQLite limits the number of bound parameters per statement
+QUERY_CHUNK_SIZE = 500
+
+
+class WriteCache:
+    """A local, persistent record of the content hash of every node row written to a
+    graph, used to skip rows whose properties have not changed since they were last
+    written successfully.
+
+    The cache assumes it is the only thing changing the nodes it tracks. If nodes are
+    deleted or changed outside of this writer, call clear() for that graph.
+    """
+
+    def __init__(self, path: str, max_entries: int = MAX_ENTRIES) -> None:
+        """Opens (creating if needed) the cache
+
+        Args:
+            path (str): The path of the SQLite database file
+            max_entries (int, optional): The number of rows kept before the least recently used are evicted. Defaults to 1,000,000.
+        """
+        self.max_entries = max_entries
+        self.skipped = 0
+        self.written = 0
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(path, check_same_thread=False)
+        self.__conn.execute(
+            """CREATE TABLE IF NOT EXISTS nodes (
+                graph TEXT NOT NULL,
+                id TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (graph, id)
+            )"""
+        )
+        self.__conn.execute(
+            "CREATE INDEX IF NOT EXISTS nodes_last_used ON nodes (last_used)"
+        )
+        self.__conn.commit()
+        self.__size = self.__conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
+
+    def close(self):
+        """Closes the cache"""
+        with self.__lock:
+            self.__conn.close()
+
+    @staticmethod
+    def hash_row(row: dict) -> str:
+        """Creates the content hash of a row
+
+        Args:
+            row (dict): The node row, including its __id
+
+        Returns:
+            str: The hash of the row
+        """
+        data = json.dumps(row, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha1(data).hexdigest()
+
+    def filter(self, graph_identifier: str, rows: list) -> tuple:
+        """Drops the rows whose content has not changed since they were last written
+
+        Args:
+            graph_identifier (str): The graph the rows are written to
+            rows (list): The node rows, each with its `~id` in __id
+
+        Returns:
+            tuple: The rows that need to be written, and a map of their __id to hash to pass to record() once written
+        """
+        hashes = {r["__id"]: self.hash_row(r) for r in rows}
+        ids = list(hashes.keys())
+        cached = {}
+        with self.__lock:
+            for i in range(0, len(ids), QUERY_CHUNK_SIZE):
+                chunk = ids[i : i + QUERY_CHUNK_SIZE]
+                cached.update(
+                    self.__conn.execute(
+                        f"""SELECT id, hash FROM nodes WHERE graph = ?
+                            AND id IN ({",".join("?" * len(chunk))})""",
+                        [graph_identifier, *chunk],
+                    ).fetchall()
+                )
+            hits = [i for i in ids if cached.get(i) == hashes[i]]
+            self.__conn.executemany(
+                "UPDATE nodes SET last_used = ? WHERE graph = ? AND id = ?",
+                [(time.time(), graph_identifier, i) for i in hits],
+            )
+            self.__conn.commit()
+
+        changed = [r for r in rows if cached.get(r["__id"]) != hashes[r["__id"]]]
+        pending = {r["__id"]: hashes[r["__id"]] for r in changed}
+        with self.__lock:
+            self.skipped += len(rows) - len(changed)
+        return changed, pending
+
+    def record(self, graph_identifier: str, hashes: dict):
+        """Records rows as successfully written, evicting the least recently used rows
+        if the cache is full
+
+        Args:
+            graph_identifier (str): The graph the rows were written to
+            hashes (dict): The map of __id to hash returned by filter()
+        """
+        if len(hashes) == 0:
+            return
+        now = time.time()
+        with self.__lock:
+            self.written += len(hashes)
+            before = self.__conn.total_changes
+            self.__conn.executemany(
+                """INSERT INTO nodes (graph, id, hash, last_used) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (graph, id) DO UPDATE SET hash = excluded.hash,
+                    last_used = excluded.last_used""",
+                [(graph_identifier, i, h, now) for i, h in hashes.items()],
+            )
+            # Upserts of existing rows count as changes too, so this over-estimates
+            self.__size += self.__conn.total_changes - before
+            if self.__size > self.max_entries:
+                self.__size = self.__conn.execute(
+                    "SELECT COUNT(*) FROM nodes"
+                ).fetchone()[0]
+            if self.__size > self.max_entries:
+                evict = self.__size - self.max_entries
+                logging.info(f"Evicting {evict} rows from the write cache")
+                self.__conn.execute(
+                    """DELETE FROM nodes WHERE rowid IN (
+                        SELECT rowid FROM nodes ORDER BY last_used LIMIT ?)""",
+                    (evict,),
+                )
+                self.__size -= evict
+            self.__conn.commit()
+
+    def clear(self, graph_identifier: str):
+        """Forgets every row written to the provided graph
+
+        Args:
+            graph_identifier (str): The graph identifier
+        """
+        with self.__lock:
+            self.__conn.execute("DELETE FROM nodes WHERE graph = ?", (graph_identifier,))
+            self.__conn.commit()
+            self.__size = self.__conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
+
+    def forget(self, graph_identifier: str, ids: list):
+        """Forgets the provided rows, e.g. because their nodes were deleted from the
+        graph, so they are written again the next time they are seen
+
+        Args:
+            graph_identifier (str): The graph identifier
+            ids (list): The `~id`s of the rows
+        """
+        ids = list(ids)
+        with self.__lock:
+            for i in range(0, len(ids), QUERY_CHUNK_SIZE):
+                chunk = ids[i : i + QUERY_CHUNK_SIZE]
+                self.__conn.execute(
+                    f"""DELETE FROM nodes WHERE graph = ?
+                        AND id IN ({",".join("?" * len(chunk))})""",
+                    [graph_identifier, *chunk],
+                )
+            self.__conn.commit()
+            self.__size = self.__conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]